@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Control de admisión para los endpoints de recomendación.
+
+Como máximo `max_concurrentes` cálculos corren a la vez; hasta `max_cola`
+solicitudes más esperan un lugar durante `espera_maxima` segundos. Lo que no
+entra se rechaza de inmediato con Sobrecarga, que el API responde con 503 y
+Retry-After: ante una ráfaga es preferible rechazar rápido a que todas las
+solicitudes se vuelvan lentas.
+
+También decide qué solicitudes son desmedidas (límite de resultados enorme o
+rango de presupuesto que abarca todo el catálogo) para atenderlas en un modo
+más barato.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+
+class Sobrecarga(Exception):
+    """No hay lugar para la solicitud; reintentar después de `reintentar_en` segundos."""
+
+    def __init__(self, mensaje: str, reintentar_en: int = 1):
+        super().__init__(mensaje)
+        self.reintentar_en = reintentar_en
+
+
+class ControlAdmision:
+    """Limita la concurrencia con una cola corta y acotada en tiempo."""
+
+    def __init__(self, max_concurrentes: int, max_cola: int, espera_maxima: float = 2.0):
+        self.max_concurrentes = max(1, max_concurrentes)
+        self.max_cola = max(0, max_cola)
+        self.espera_maxima = espera_maxima
+        self._condicion = threading.Condition()
+        self.en_ejecucion = 0
+        self.en_cola = 0
+        self.stats = {'admitidas': 0, 'rechazadas_cola_llena': 0, 'rechazadas_espera': 0}
+
+    @property
+    def reintentar_en(self) -> int:
+        return max(1, int(round(self.espera_maxima)))
+
+    @contextmanager
+    def admitir(self) -> Iterator[float]:
+        """
+        Reserva un lugar mientras dura el bloque `with`.
+
+        Yields:
+            Segundos que la solicitud esperó en la cola
+
+        Raises:
+            Sobrecarga: si la cola está llena o se agotó la espera
+        """
+        inicio = time.perf_counter()
+        with self._condicion:
+            if self.en_ejecucion >= self.max_concurrentes:
+                if self.en_cola >= self.max_cola:
+                    self.stats['rechazadas_cola_llena'] += 1
+                    raise Sobrecarga("Servidor ocupado: cola de recomendaciones llena", self.reintentar_en)
+
+                self.en_cola += 1
+                limite = inicio + self.espera_maxima
+                try:
+                    while self.en_ejecucion >= self.max_concurrentes:
+                        restante = limite - time.perf_counter()
+                        if restante <= 0:
+                            self.stats['rechazadas_espera'] += 1
+                            raise Sobrecarga("Servidor ocupado: se agotó la espera en cola", self.reintentar_en)
+                        self._condicion.wait(restante)
+                finally:
+                    self.en_cola -= 1
+
+            self.en_ejecucion += 1
+            self.stats['admitidas'] += 1
+
+        try:
+            yield time.perf_counter() - inicio
+        finally:
+            with self._condicion:
+                self.en_ejecucion -= 1
+                self._condicion.notify()
+
+    def estadisticas(self) -> Dict[str, int]:
+        """Solicitudes en ejecución y en cola, admitidas y rechazadas."""
+        with self._condicion:
+            return dict(self.stats, en_ejecucion=self.en_ejecucion, en_cola=self.en_cola,
+                        max_concurrentes=self.max_concurrentes, max_cola=self.max_cola)
+
+
+def motivo_degradacion(data: Dict[str, Any], limite_maximo: int,
+                       ancho_presupuesto_maximo: float) -> Optional[str]:
+    """Retorna por qué una solicitud de recomendaciones es desmedida, o None."""
+    try:
+        limite = int(data.get('limite', 0) or 0)
+        ancho = float(data.get('presupuesto_max', 0) or 0) - float(data.get('presupuesto_min', 0) or 0)
+    except (TypeError, ValueError):
+        # Los valores inválidos los reporta el cálculo con su propio error
+        return None
+
+    if limite > limite_maximo:
+        return f"limite {limite} mayor que el máximo {limite_maximo}"
+    if ancho > ancho_presupuesto_maximo:
+        return f"rango de presupuesto de {ancho:,.0f} USD mayor que el máximo {ancho_presupuesto_maximo:,.0f}"
+    return None
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Versiones del catálogo de Citrino para el API, con recarga en caliente.
+
+Un Catalogo agrupa el sistema de consulta y los dos motores de recomendación
+construidos sobre la misma lista de propiedades. El GestorCatalogo arma la
+versión nueva en segundo plano y la publica con una sola asignación de
+referencia: cada request toma el catálogo vigente al empezar y lo usa hasta
+terminar, así nunca ve índices a medio construir. La versión anterior se
+libera cuando termina el último request que la usaba.
+
+El número de versión sale del contenido de los archivos cargados: los
+workers de gunicorn que cargaron los mismos datos publican la misma versión,
+y con ella los mismos ETags y cursores, aunque cada uno recargue por su cuenta.
+"""
+
+import hashlib
+import os
+import sys
+import threading
+import time
+from functools import partial
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Agregar los directorios src y scripts al path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from fragmentos import FragmentosPropiedades
+from recommendation_engine import RecommendationEngine
+from recommendation_engine_mejorado import RecommendationEngineMejorado
+from sistema_consulta import SistemaConsultaCitrino
+
+
+class Catalogo:
+    """Versión del catálogo: sistema de consulta y motores, de solo lectura."""
+
+    def __init__(self, sistema: SistemaConsultaCitrino,
+                 motor_recomendacion: RecommendationEngine,
+                 motor_mejorado: RecommendationEngineMejorado,
+                 ruta: Optional[str] = None, mtime: Optional[Tuple[float, ...]] = None):
+        self.sistema = sistema
+        self.motor_recomendacion = motor_recomendacion
+        self.motor_mejorado = motor_mejorado
+        self.ruta = ruta
+        # Fechas de modificación de la base de datos y la guía urbana al cargar
+        self.mtime = mtime
+        self.creado = time.time()
+        # Respuestas de solo lectura serializadas para esta versión: nombre -> (cuerpo, etag)
+        self.respuestas: Dict[str, Tuple[bytes, str]] = {}
+        # Propiedades formateadas y serializadas para las respuestas de esta versión
+        self.fragmentos = FragmentosPropiedades()
+
+    @property
+    def version(self) -> int:
+        return self.sistema.version_catalogo
+
+    @classmethod
+    def vacio(cls) -> 'Catalogo':
+        """Catálogo sin propiedades, vigente hasta la primera carga."""
+        return cls(SistemaConsultaCitrino(), RecommendationEngine(), RecommendationEngineMejorado())
+
+
+def _numero_solicitud(data: Dict[str, Any], campo: str, tipo: Callable[[Any], Any]) -> Any:
+    """Convierte un filtro numérico del cuerpo; un valor inválido es un error de la solicitud (400)."""
+    valor = data[campo]
+    try:
+        return tipo(valor)
+    except (TypeError, ValueError):
+        raise ValueError(f"Filtro '{campo}' inválido: se esperaba un número y se recibió {valor!r}")
+
+
+def filtros_desde_solicitud(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Filtros de búsqueda a partir del cuerpo de /api/buscar
+
+    Raises:
+        ValueError: si un filtro numérico no es un número
+    """
+    filtros = {}
+
+    if 'zona' in data:
+        filtros['zona'] = data['zona']
+
+    for campo in ('precio_min', 'precio_max', 'superficie_min', 'superficie_max'):
+        if campo in data and data[campo]:
+            filtros[campo] = _numero_solicitud(data, campo, float)
+
+    for campo in ('habitaciones_min', 'banos_min'):
+        if campo in data and data[campo]:
+            filtros[campo] = _numero_solicitud(data, campo, int)
+
+    if 'tiene_garaje' in data:
+        filtros['tiene_garaje'] = bool(data['tiene_garaje'])
+
+    return filtros
+
+
+def perfil_desde_solicitud(data: Dict[str, Any], id_por_defecto: str = 'perfil_cherry') -> Dict[str, Any]:
+    """Perfil de los motores a partir del cuerpo de /api/recomendar o /api/recomendar-mejorado"""
+    return {
+        'id': data.get('id', id_por_defecto),
+        'presupuesto': {
+            'min': data.get('presupuesto_min', 0),
+            'max': data.get('presupuesto_max', 1000000)
+        },
+        'composicion_familiar': {
+            'adultos': data.get('adultos', 1),
+            'ninos': data.get('ninos', []),
+            'adultos_mayores': data.get('adultos_mayores', 0)
+        },
+        'preferencias': {
+            'ubicacion': data.get('zona_preferida', ''),
+            'tipo_propiedad': data.get('tipo_propiedad', '')
+        },
+        'necesidades': data.get('necesidades', [])
+    }
+
+
+def estadisticas_catalogo(catalogo: Catalogo) -> Dict[str, Any]:
+    """Estadísticas generales del catálogo (las de /api/estadisticas)"""
+    globales = catalogo.sistema.estadisticas_globales
+    stats = {
+        'total_propiedades': globales['total_propiedades'],
+        'precio_promedio': globales['precio_promedio'],
+        'precio_minimo': globales['precio_minimo'],
+        'precio_maximo': globales['precio_maximo'],
+        'superficie_promedio': globales['superficie_promedio'],
+        'total_zonas': globales['total_zonas'],
+        'distribucion_zonas': {},
+        'distribucion_precios': {}
+    }
+
+    # Agregar distribución por zonas
+    for zona, props in list(catalogo.sistema.indices['zona'].items())[:10]:
+        stats['distribucion_zonas'][zona] = len(props)
+
+    # Agregar distribución por precios
+    for rango, props in catalogo.sistema.indices['precio'].items():
+        stats['distribucion_precios'][rango] = len(props)
+
+    return stats
+
+
+# Callback (motor, etapa, segundos) para las etapas de los motores
+ObservadorEtapas = Callable[[str, str, float], None]
+
+
+def fechas_archivos(*rutas: str) -> Tuple[Optional[float], ...]:
+    """Fecha de modificación de cada archivo (None si no existe)."""
+    fechas = []
+    for ruta in rutas:
+        try:
+            fechas.append(os.path.getmtime(ruta))
+        except OSError:
+            fechas.append(None)
+    return tuple(fechas)
+
+
+def version_contenido(*rutas: str) -> int:
+    """
+    Versión del catálogo derivada del contenido de los archivos: igual en
+    todos los procesos que cargaron los mismos datos, distinta si cambian.
+    """
+    huella = hashlib.blake2b(digest_size=6)
+    for ruta in rutas:
+        try:
+            with open(ruta, 'rb') as f:
+                for bloque in iter(lambda: f.read(1 << 20), b''):
+                    huella.update(bloque)
+        except OSError:
+            pass
+        huella.update(b'\0')
+    return int.from_bytes(huella.digest(), 'big')
+
+
+def construir_catalogo(ruta_base_datos: str, ruta_guia_urbana: str,
+                       observador_etapas: Optional[ObservadorEtapas] = None) -> Catalogo:
+    """
+    Carga la base de datos, alimenta ambos motores y precalienta caches.
+
+    Args:
+        ruta_base_datos: JSON de propiedades
+        ruta_guia_urbana: JSON de la guía urbana para el motor mejorado
+        observador_etapas: Recibe la duración de cada etapa de los motores
+    """
+    # Fechas antes que contenido: si el archivo cambia durante la carga la
+    # vigilancia lo ve y vuelve a cargar
+    mtime = fechas_archivos(ruta_base_datos, ruta_guia_urbana)
+    version = version_contenido(ruta_base_datos, ruta_guia_urbana)
+
+    sistema = SistemaConsultaCitrino()
+    print("Cargando base de datos...")
+    sistema.cargar_base_datos(ruta_base_datos)
+    # Los cursores de paginación emitidos con otros datos quedan invalidados
+    sistema.version_catalogo = version
+
+    motor_recomendacion = RecommendationEngine()
+    motor_recomendacion.cargar_propiedades(sistema.propiedades)
+
+    # Cargar datos para el motor mejorado
+    print("Cargando guía urbana municipal...")
+    motor_mejorado = RecommendationEngineMejorado()
+    motor_mejorado.cargar_propiedades(sistema.propiedades)
+    try:
+        motor_mejorado.cargar_guias_urbanas(ruta_guia_urbana)
+        print("Guía urbana cargada exitosamente")
+    except Exception as e:
+        print(f"Advertencia: No se pudo cargar guía urbana: {e}")
+
+    if observador_etapas:
+        motor_recomendacion.observador_etapas = partial(observador_etapas, 'original')
+        motor_mejorado.observador_etapas = partial(observador_etapas, 'mejorado')
+
+    print("Precalentando caches...")
+    sistema.precalentar()
+
+    return Catalogo(sistema, motor_recomendacion, motor_mejorado, ruta_base_datos, mtime)
+
+
+class GestorCatalogo:
+    """Publica versiones del catálogo y coordina recargas en segundo plano."""
+
+    def __init__(self, ruta_base_datos: str, ruta_guia_urbana: str,
+                 observador_etapas: Optional[ObservadorEtapas] = None):
+        self.ruta_base_datos = ruta_base_datos
+        self.ruta_guia_urbana = ruta_guia_urbana
+        self.observador_etapas = observador_etapas
+        self.catalogo = Catalogo.vacio()
+
+        # Sólo una recarga a la vez; la publicación es una asignación atómica
+        self._lock_recarga = threading.Lock()
+        self.estado_recarga: Dict[str, Any] = {
+            'en_curso': False,
+            'recargas': 0,
+            'ultima': None,
+            'duracion_segundos': None,
+            'error': None
+        }
+        self._vigilante: Optional[threading.Thread] = None
+        self._detener_vigilante = threading.Event()
+        # Segundos entre revisiones de los archivos; None sin vigilancia
+        self.intervalo_vigilancia: Optional[float] = None
+
+    def cargar(self, ruta_base_datos: Optional[str] = None, ruta_guia_urbana: Optional[str] = None) -> Catalogo:
+        """Construye y publica una versión nueva en el hilo actual (errores se propagan)."""
+        if ruta_base_datos:
+            self.ruta_base_datos = ruta_base_datos
+        if ruta_guia_urbana:
+            self.ruta_guia_urbana = ruta_guia_urbana
+
+        nuevo = construir_catalogo(self.ruta_base_datos, self.ruta_guia_urbana,
+                                   observador_etapas=self.observador_etapas)
+        self.catalogo = nuevo
+        return nuevo
+
+    def recargar(self, esperar: bool = False) -> bool:
+        """
+        Inicia una recarga en segundo plano. Mientras tanto los requests siguen
+        usando la versión vigente.
+
+        Cada proceso tiene su propio gestor: los demás workers de gunicorn
+        cargan los archivos nuevos con su vigilancia (ver vigilar_archivo).
+
+        Args:
+            esperar: Bloquea hasta que la recarga termine
+
+        Returns:
+            False si ya había una recarga en curso
+        """
+        if not self._lock_recarga.acquire(blocking=False):
+            return False
+
+        self.estado_recarga['en_curso'] = True
+        hilo = threading.Thread(target=self._ejecutar_recarga, name='recarga-catalogo', daemon=True)
+        hilo.start()
+        if esperar:
+            hilo.join()
+        return True
+
+    def _ejecutar_recarga(self) -> None:
+        inicio = time.time()
+        try:
+            anterior = self.catalogo
+            self.cargar()
+            self.estado_recarga['error'] = None
+            self.estado_recarga['recargas'] += 1
+            print(f"Catálogo recargado: versión {anterior.version} -> {self.catalogo.version}")
+        except Exception as e:
+            # La versión vigente sigue publicada
+            self.estado_recarga['error'] = str(e)
+            print(f"Error recargando catálogo: {e}")
+        finally:
+            self.estado_recarga.update({
+                'en_curso': False,
+                'ultima': time.time(),
+                'duracion_segundos': round(time.time() - inicio, 3)
+            })
+            self._lock_recarga.release()
+
+    def vigilar_archivo(self, intervalo: float = 30.0) -> None:
+        """
+        Revisa periódicamente la fecha de modificación de la base de datos y de
+        la guía urbana y recarga si cambió alguna.
+        """
+        if self._vigilante and self._vigilante.is_alive():
+            return
+        self.intervalo_vigilancia = intervalo
+        self._detener_vigilante.clear()
+        self._vigilante = threading.Thread(target=self._vigilar, args=(intervalo,),
+                                           name='vigilante-catalogo', daemon=True)
+        self._vigilante.start()
+
+    def detener_vigilancia(self) -> None:
+        self._detener_vigilante.set()
+        if self._vigilante:
+            self._vigilante.join()
+            self._vigilante = None
+        self.intervalo_vigilancia = None
+
+    def _vigilar(self, intervalo: float) -> None:
+        while not self._detener_vigilante.wait(intervalo):
+            mtime = fechas_archivos(self.ruta_base_datos, self.ruta_guia_urbana)
+            # Sin base de datos no se recarga: se conserva la versión vigente
+            if mtime[0] is None:
+                continue
+            if self.catalogo.mtime is not None and mtime != self.catalogo.mtime:
+                self.recargar(esperar=True)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Coalescencia de solicitudes idénticas concurrentes (single-flight).
+
+Si llega una solicitud mientras otra idéntica se está calculando, espera ese
+mismo cálculo y comparte su resultado en lugar de repetirlo. El resultado
+compartido no debe modificarse después de retornarlo.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+
+class _Vuelo:
+    """Cálculo en curso y su resultado."""
+
+    __slots__ = ('listo', 'resultado', 'error', 'esperando')
+
+    def __init__(self):
+        self.listo = threading.Event()
+        self.resultado = None
+        self.error = None
+        self.esperando = 0
+
+
+class Coalescedor:
+    """Ejecuta una sola vez cada cálculo concurrente con la misma clave."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._en_vuelo: Dict[Hashable, _Vuelo] = {}
+        self.stats = {'ejecuciones': 0, 'coalescidas': 0}
+
+    def ejecutar(self, clave: Hashable, funcion: Callable[[], Any]) -> Any:
+        """
+        Ejecuta `funcion` o espera el cálculo en curso con la misma clave.
+        Si el cálculo falla, la excepción se propaga a todas las solicitudes
+        que lo esperaban.
+        """
+        with self._lock:
+            vuelo = self._en_vuelo.get(clave)
+            lider = vuelo is None
+            if lider:
+                vuelo = self._en_vuelo[clave] = _Vuelo()
+                self.stats['ejecuciones'] += 1
+            else:
+                vuelo.esperando += 1
+                self.stats['coalescidas'] += 1
+
+        if lider:
+            try:
+                vuelo.resultado = funcion()
+            except Exception as e:
+                vuelo.error = e
+            finally:
+                with self._lock:
+                    del self._en_vuelo[clave]
+                vuelo.listo.set()
+        else:
+            vuelo.listo.wait()
+
+        if vuelo.error is not None:
+            raise vuelo.error
+        return vuelo.resultado
+
+    def estadisticas(self) -> Dict[str, int]:
+        """Ejecuciones, solicitudes coalescidas y cálculos en curso."""
+        with self._lock:
+            return dict(self.stats, en_vuelo=len(self._en_vuelo))
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Compresión de respuestas del API (gzip y, si está instalado, brotli).
+
+Las respuestas dinámicas se comprimen al salir con un nivel moderado; las
+respuestas versionadas por catálogo (estadísticas, zonas) se comprimen una
+sola vez con el nivel máximo y se sirven ya comprimidas. Las respuestas por
+partes (NDJSON) se comprimen bloque a bloque sin perder el envío progresivo.
+"""
+
+import gzip
+import zlib
+from typing import Iterable, Iterator, Optional
+
+try:
+    import brotli
+except ImportError:
+    # brotli es opcional: sin él se negocia sólo gzip
+    brotli = None
+
+# Tipos de contenido que vale la pena comprimir
+TIPOS_COMPRIMIBLES = ('application/json', 'application/x-ndjson', 'text/plain', 'text/csv', 'text/html')
+
+# Niveles para respuestas dinámicas y para las que se comprimen una sola vez
+NIVEL_GZIP, NIVEL_GZIP_MAXIMO = 6, 9
+NIVEL_BROTLI, NIVEL_BROTLI_MAXIMO = 5, 11
+
+
+def codificaciones_disponibles() -> tuple:
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def elegir_codificacion(accept_encodings) -> Optional[str]:
+    """
+    Elige la codificación según el header Accept-Encoding (objeto Accept de
+    werkzeug): brotli si está disponible y el cliente lo acepta con la misma
+    o mayor preferencia que gzip, si no gzip, si no ninguna.
+    """
+    mejor, calidad_mejor = None, 0
+    for codificacion in codificaciones_disponibles():
+        calidad = accept_encodings[codificacion]
+        if calidad > calidad_mejor:
+            mejor, calidad_mejor = codificacion, calidad
+    return mejor
+
+
+def es_comprimible(mimetype: Optional[str]) -> bool:
+    return bool(mimetype) and mimetype in TIPOS_COMPRIMIBLES
+
+
+def comprimir(datos: bytes, codificacion: str, maximo: bool = False) -> bytes:
+    """Comprime un cuerpo completo."""
+    if codificacion == 'br':
+        return brotli.compress(datos, quality=NIVEL_BROTLI_MAXIMO if maximo else NIVEL_BROTLI)
+    if codificacion == 'gzip':
+        # mtime=0 para que el mismo cuerpo produzca siempre los mismos bytes
+        return gzip.compress(datos, compresslevel=NIVEL_GZIP_MAXIMO if maximo else NIVEL_GZIP, mtime=0)
+    raise ValueError(f"Codificación no soportada: {codificacion}")
+
+
+def comprimir_flujo(bloques: Iterable[bytes], codificacion: str) -> Iterator[bytes]:
+    """
+    Comprime una respuesta por partes. El compresor se vacía en cada bloque
+    para que el cliente pueda descomprimirlo apenas llega.
+    """
+    try:
+        if codificacion == 'br':
+            compresor = brotli.Compressor(quality=NIVEL_BROTLI)
+            for bloque in bloques:
+                yield compresor.process(_a_bytes(bloque)) + compresor.flush()
+            yield compresor.finish()
+        else:
+            # wbits 31: formato gzip
+            compresor = zlib.compressobj(NIVEL_GZIP, zlib.DEFLATED, 31)
+            for bloque in bloques:
+                yield compresor.compress(_a_bytes(bloque)) + compresor.flush(zlib.Z_SYNC_FLUSH)
+            yield compresor.flush()
+    finally:
+        # El servidor cierra este generador; el original (p. ej. stream_with_context) también debe cerrarse
+        cerrar = getattr(bloques, 'close', None)
+        if cerrar:
+            cerrar()
+
+
+def _a_bytes(bloque) -> bytes:
+    return bloque.encode('utf-8') if isinstance(bloque, str) else bloque
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Formato binario columnar (MessagePack) para clientes de alto volumen.
+
+Los evaluadores y scripts internos sólo necesitan ids, puntajes y algunos
+campos clave. En lugar de una lista de objetos JSON con justificaciones, la
+respuesta lleva arreglos paralelos: las columnas numéricas como bytes
+little-endian con su dtype (se leen con np.frombuffer, sin recorrer
+elementos), las categóricas como códigos más su lista de categorías y los
+textos cortos como listas.
+
+    {'formato': 'columnar', 'version': 1, 'filas': n, ...metadatos,
+     'columnas': {'id': [...], 'precio': {'dtype': '<f8', 'datos': b'...'},
+                  'zona': {'categorias': [...], 'codigos': {'dtype': '<i4', 'datos': b'...'}}}}
+
+`decodificar` convierte la respuesta de vuelta a arreglos de numpy.
+"""
+
+from typing import Any, Dict, List, Mapping
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:
+    # msgpack es opcional: sin él el API responde 406 a quien pida este formato
+    msgpack = None
+
+MSGPACK = 'application/x-msgpack'
+TIPOS_MSGPACK = (MSGPACK, 'application/msgpack', 'application/vnd.msgpack')
+VERSION_FORMATO = 1
+
+# Columna -> dtype de las columnas numéricas; las demás son texto o categóricas
+COLUMNAS_NUMERICAS = {
+    'precio': '<f8',
+    'superficie_m2': '<f8',
+    'habitaciones': '<i4',
+    'banos': '<i4',
+    'compatibilidad': '<f8',
+}
+COLUMNAS_CATEGORICAS = ('zona', 'fuente')
+COLUMNAS_TEXTO = ('id', 'nombre')
+
+
+def disponible() -> bool:
+    return msgpack is not None
+
+
+def _numero(valor: Any) -> float:
+    try:
+        return float(valor or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _arreglo(valores: np.ndarray) -> Dict[str, Any]:
+    return {'dtype': valores.dtype.str, 'datos': valores.tobytes()}
+
+
+def columnas_registros(registros: List[Mapping]) -> Dict[str, Any]:
+    """Arreglos paralelos a partir de registros ya formateados (una fila por registro)."""
+    if not registros:
+        return {}
+    presentes = registros[0].keys()
+    columnas: Dict[str, Any] = {}
+
+    for nombre in COLUMNAS_TEXTO:
+        if nombre in presentes:
+            columnas[nombre] = [str(r.get(nombre, '') or '') for r in registros]
+
+    for nombre, dtype in COLUMNAS_NUMERICAS.items():
+        if nombre in presentes:
+            valores = np.fromiter((_numero(r.get(nombre)) for r in registros), dtype=np.float64,
+                                  count=len(registros))
+            columnas[nombre] = _arreglo(valores.astype(dtype))
+
+    for nombre in COLUMNAS_CATEGORICAS:
+        if nombre in presentes:
+            categorias, codigos = np.unique([str(r.get(nombre, '') or '') for r in registros],
+                                            return_inverse=True)
+            columnas[nombre] = {'categorias': categorias.tolist(), 'codigos': _arreglo(codigos.astype('<i4'))}
+
+    return columnas
+
+
+def empaquetar(metadatos: Dict[str, Any], registros: List[Mapping]) -> bytes:
+    """Respuesta columnar completa en MessagePack."""
+    cuerpo = dict(metadatos, formato='columnar', version=VERSION_FORMATO, filas=len(registros),
+                  columnas=columnas_registros(registros))
+    return msgpack.packb(cuerpo, use_bin_type=True)
+
+
+def decodificar(datos: bytes) -> Dict[str, Any]:
+    """
+    Lado cliente: desempaqueta la respuesta y reemplaza las columnas por
+    arreglos de numpy (las categóricas se expanden a arreglos de texto).
+    """
+    cuerpo = msgpack.unpackb(datos, raw=False)
+    columnas = {}
+    for nombre, columna in cuerpo.get('columnas', {}).items():
+        if isinstance(columna, list):
+            columnas[nombre] = columna
+        elif 'categorias' in columna:
+            codigos = np.frombuffer(columna['codigos']['datos'], dtype=columna['codigos']['dtype'])
+            columnas[nombre] = np.asarray(columna['categorias'], dtype=object)[codigos]
+        else:
+            columnas[nombre] = np.frombuffer(columna['datos'], dtype=columna['dtype'])
+    cuerpo['columnas'] = columnas
+    return cuerpo
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Fragmentos JSON preserializados de las propiedades, por versión del catálogo.
+
+Las respuestas de /api/buscar, /api/recomendar y /api/recomendar-mejorado
+repiten para cada propiedad el mismo objeto formateado (id, nombre, precio,
+zona, extracto de la descripción...). Cada Catalogo guarda esos objetos ya
+serializados a bytes y las respuestas se arman concatenando fragmentos; por
+request sólo se serializan los campos propios de la consulta
+(compatibilidad, justificación, totales, cursor).
+"""
+
+import json
+from typing import Any, Dict, List, Mapping, Optional
+
+from registro_compacto import extracto_texto
+
+# Fragmentos que se guardan por catálogo y tipo; pasado el límite se
+# serializan en cada request sin guardarlos
+MAX_FRAGMENTOS = 100000
+
+
+def a_json(valor: Any) -> bytes:
+    """Serialización compacta en UTF-8, la usada en todos los fragmentos."""
+    return json.dumps(valor, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class JsonPreserializado:
+    """Valor con su JSON ya calculado; `ensamblar_json` lo inserta tal cual."""
+
+    __slots__ = ('datos', 'json')
+
+    def __init__(self, datos: Optional[Dict[str, Any]], json_bytes: bytes):
+        self.datos = datos
+        self.json = json_bytes
+
+    def __getitem__(self, clave: str) -> Any:
+        return self.datos[clave]
+
+    def __repr__(self) -> str:
+        return f"JsonPreserializado({self.json.decode('utf-8')})"
+
+
+def ensamblar_json(valor: Any) -> bytes:
+    """Serializa diccionarios y listas insertando los fragmentos preserializados."""
+    partes: List[bytes] = []
+    _ensamblar(valor, partes)
+    return b''.join(partes)
+
+
+def _ensamblar(valor: Any, partes: List[bytes]) -> None:
+    if valor.__class__ is JsonPreserializado:
+        partes.append(valor.json)
+    elif isinstance(valor, dict):
+        partes.append(b'{')
+        for i, (clave, elemento) in enumerate(valor.items()):
+            if i:
+                partes.append(b',')
+            partes.append(a_json(str(clave)))
+            partes.append(b':')
+            _ensamblar(elemento, partes)
+        partes.append(b'}')
+    elif isinstance(valor, (list, tuple)):
+        partes.append(b'[')
+        for i, elemento in enumerate(valor):
+            if i:
+                partes.append(b',')
+            _ensamblar(elemento, partes)
+        partes.append(b']')
+    else:
+        partes.append(a_json(valor))
+
+
+def formatear_busqueda(prop: Mapping) -> Dict[str, Any]:
+    """Objeto de una propiedad en los resultados de /api/buscar."""
+    caract = prop.get('caracteristicas_principales', {})
+    ubicacion = prop.get('ubicacion', {})
+    return {
+        'id': prop.get('id', ''),
+        'nombre': prop.get('nombre', ''),
+        'precio': caract.get('precio', 0),
+        'superficie_m2': caract.get('superficie_m2', 0),
+        'habitaciones': caract.get('habitaciones', 0),
+        'banos': caract.get('banos_completos', 0),
+        'garaje': caract.get('cochera_garaje', False),
+        'espacios_garaje': caract.get('numero_espacios_garaje', 0),
+        'zona': ubicacion.get('zona', ''),
+        'direccion': ubicacion.get('direccion', ''),
+        'fuente': prop.get('fuente', ''),
+        'descripcion': extracto_texto(prop, 'descripcion')
+    }
+
+
+def formatear_recomendacion(prop: Mapping) -> Dict[str, Any]:
+    """Campos fijos de una propiedad en las recomendaciones (sin compatibilidad ni justificación)."""
+    caract = prop.get('caracteristicas_principales', {})
+    ubicacion = prop.get('ubicacion', {})
+    return {
+        'id': prop.get('id', ''),
+        'nombre': prop.get('nombre', ''),
+        'precio': caract.get('precio', 0),
+        'superficie_m2': caract.get('superficie_m2', 0),
+        'habitaciones': caract.get('habitaciones', 0),
+        'banos': caract.get('banos_completos', 0),
+        'zona': ubicacion.get('zona', ''),
+        'fuente': prop.get('fuente', '')
+    }
+
+
+class FragmentosPropiedades:
+    """
+    Fragmentos de las propiedades de una versión del catálogo, calculados la
+    primera vez que una respuesta los usa. Se indexan por identidad del
+    registro: el catálogo mantiene vivas sus propiedades mientras exista.
+    """
+
+    def __init__(self, max_fragmentos: int = MAX_FRAGMENTOS):
+        self.max_fragmentos = max_fragmentos
+        self._busqueda: Dict[int, bytes] = {}
+        self._recomendacion: Dict[int, JsonPreserializado] = {}
+
+    def busqueda(self, prop: Mapping, guardar: bool = True) -> JsonPreserializado:
+        """
+        Propiedad formateada para /api/buscar, serializada. Con guardar=False
+        se usa el fragmento si ya existe pero no se agrega uno nuevo (recorridos
+        masivos que no deben llenar el cache).
+        """
+        fragmento = self._busqueda.get(id(prop))
+        if fragmento is None:
+            fragmento = a_json(formatear_busqueda(prop))
+            if guardar and len(self._busqueda) < self.max_fragmentos:
+                self._busqueda[id(prop)] = fragmento
+        return JsonPreserializado(None, fragmento)
+
+    def recomendacion(self, prop: Mapping, compatibilidad: float, justificacion: str) -> JsonPreserializado:
+        """Propiedad recomendada: fragmento fijo más los campos de esta consulta."""
+        base = self._recomendacion.get(id(prop))
+        if base is None:
+            datos = formatear_recomendacion(prop)
+            # Sin la llave de cierre, para agregar los campos de la consulta
+            base = JsonPreserializado(datos, a_json(datos)[:-1])
+            if len(self._recomendacion) < self.max_fragmentos:
+                self._recomendacion[id(prop)] = base
+
+        extras = {'compatibilidad': compatibilidad, 'justificacion': justificacion}
+        datos = dict(base.datos, **extras)
+        return JsonPreserializado(datos, base.json + b',' + a_json(extras)[1:])
+
+    def __len__(self) -> int:
+        return len(self._busqueda) + len(self._recomendacion)
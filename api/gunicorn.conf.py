@@ -0,0 +1,46 @@
+"""
+Configuración de gunicorn para el API de Citrino.
+
+Uso:
+    gunicorn -c api/gunicorn.conf.py wsgi:application
+
+Variables de entorno:
+    CITRINO_BIND       Dirección de escucha (por defecto 0.0.0.0:5000)
+    CITRINO_WORKERS    Número de workers (por defecto, uno por núcleo)
+    CITRINO_THREADS    Hilos por worker (por defecto 4)
+    CITRINO_VIGILAR_SEGUNDOS  Intervalo para recargar si cambia la base de datos
+                              o la guía urbana (cada worker vigila y recarga su
+                              propia copia). Sin definir, con más de un worker
+                              se revisa cada 5 s; así /api/admin/recargar llega
+                              a todos. Con 0 recarga sólo el worker que la recibe.
+    CITRINO_DIR_EXPORTACIONES Directorio de exportaciones y de su registro de trabajos,
+                              compartido por los workers (por defecto, en /tmp)
+"""
+
+import gc
+import multiprocessing
+import os
+
+chdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+pythonpath = os.path.join(chdir, 'api')
+
+bind = os.environ.get('CITRINO_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('CITRINO_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('CITRINO_THREADS', 4))
+timeout = 60
+keepalive = 5
+
+# Cargar catálogo e índices una sola vez en el maestro y compartirlos por fork
+preload_app = True
+
+
+def post_fork(server, worker):
+    """Reactiva el recolector en el worker; lo cargado quedó congelado en el maestro."""
+    gc.enable()
+
+    # Los hilos no sobreviven al fork: la vigilancia se inicia en cada worker
+    from server import gestor_catalogo, intervalo_vigilancia
+    intervalo = intervalo_vigilancia(workers)
+    if intervalo > 0:
+        gestor_catalogo.vigilar_archivo(intervalo)
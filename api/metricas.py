@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Métricas del API en formato de texto de Prometheus.
+
+Cada serie de latencia se publica de dos formas:
+- un histograma acumulado desde el arranque (buckets fijos, _sum y _count),
+  apto para agregar entre workers en Prometheus;
+- cuantiles p50/p95/p99 sobre las últimas observaciones (ventana deslizante),
+  para leer la cola de latencia directamente en el endpoint.
+
+Las métricas son de cada proceso: con varios workers de gunicorn cada
+consulta a /api/metricas la responde un worker cualquiera con sus propios
+números. Por eso toda muestra lleva la etiqueta pid del worker; las series de
+workers distintos no se mezclan, y los histogramas se pueden sumar por pid en
+Prometheus. Los cuantiles de la ventana no se agregan entre workers.
+"""
+
+import os
+import threading
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Límites superiores de los buckets, en segundos
+BUCKETS_SEGUNDOS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                    0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CUANTILES = (0.5, 0.95, 0.99)
+
+# Observaciones recientes que se conservan por serie para los cuantiles
+TAMANO_VENTANA = 2048
+
+# Aclaración agregada a la ayuda de cada métrica
+AYUDA_POR_PROCESO = '[valor de este worker, etiqueta pid]'
+
+Etiquetas = Tuple[Tuple[str, str], ...]
+
+
+class Histograma:
+    """Histograma acumulado más una ventana de observaciones recientes."""
+
+    __slots__ = ('conteos', 'suma', 'total', 'ventana')
+
+    def __init__(self):
+        self.conteos = [0] * len(BUCKETS_SEGUNDOS)
+        self.suma = 0.0
+        self.total = 0
+        self.ventana = deque(maxlen=TAMANO_VENTANA)
+
+    def observar(self, valor: float) -> None:
+        for i, limite in enumerate(BUCKETS_SEGUNDOS):
+            if valor <= limite:
+                self.conteos[i] += 1
+                break
+        self.suma += valor
+        self.total += 1
+        self.ventana.append(valor)
+
+    def cuantiles(self) -> Dict[float, float]:
+        if not self.ventana:
+            return {}
+        valores = np.percentile(np.fromiter(self.ventana, dtype=np.float64), [c * 100 for c in CUANTILES])
+        return dict(zip(CUANTILES, valores.tolist()))
+
+
+def _escapar(valor: str) -> str:
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _formatear_etiquetas(etiquetas: Iterable[Tuple[str, str]]) -> str:
+    pares = [f'{nombre}="{_escapar(valor)}"' for nombre, valor in etiquetas]
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+
+def _formatear_numero(valor: float) -> str:
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class RegistroMetricas:
+    """Registro de histogramas y contadores, seguro entre hilos."""
+
+    def __init__(self, prefijo: str = 'citrino'):
+        self.prefijo = prefijo
+        self._lock = threading.Lock()
+        self._histogramas: Dict[str, Dict[Etiquetas, Histograma]] = {}
+        self._ayudas: Dict[str, str] = {}
+        self._contadores: Dict[str, Dict[Etiquetas, float]] = {}
+
+    def observar(self, nombre: str, valor: float, ayuda: str = '', **etiquetas: str) -> None:
+        """Registra una duración (segundos) en el histograma `nombre`."""
+        clave = tuple(sorted(etiquetas.items()))
+        with self._lock:
+            series = self._histogramas.setdefault(nombre, {})
+            histograma = series.get(clave)
+            if histograma is None:
+                histograma = series[clave] = Histograma()
+                if ayuda:
+                    self._ayudas.setdefault(nombre, ayuda)
+            histograma.observar(valor)
+
+    def incrementar(self, nombre: str, valor: float = 1, ayuda: str = '', **etiquetas: str) -> None:
+        """Suma `valor` al contador `nombre`."""
+        clave = tuple(sorted(etiquetas.items()))
+        with self._lock:
+            series = self._contadores.setdefault(nombre, {})
+            series[clave] = series.get(clave, 0) + valor
+            if ayuda:
+                self._ayudas.setdefault(nombre, ayuda)
+
+    def cuantiles(self, nombre: str, **etiquetas: str) -> Dict[float, float]:
+        """Cuantiles de la ventana reciente de una serie (vacío si no hay datos)."""
+        with self._lock:
+            histograma = self._histogramas.get(nombre, {}).get(tuple(sorted(etiquetas.items())))
+            return histograma.cuantiles() if histograma else {}
+
+    def exportar(self, medidores: Optional[List[Tuple[str, str, Dict[str, str], float]]] = None) -> str:
+        """
+        Genera el texto de exposición de Prometheus.
+
+        Args:
+            medidores: Valores instantáneos (nombre, ayuda, etiquetas, valor)
+                calculados al momento de la consulta
+        """
+        lineas: List[str] = []
+        # Se calcula al exportar: el registro se crea en el maestro, antes del fork
+        proceso: Etiquetas = (('pid', str(os.getpid())),)
+        with self._lock:
+            for nombre in sorted(self._histogramas):
+                completo = f'{self.prefijo}_{nombre}'
+                ayuda = self._ayudas.get(nombre, nombre)
+                lineas.append(f'# HELP {completo} {ayuda} {AYUDA_POR_PROCESO}')
+                lineas.append(f'# TYPE {completo} histogram')
+                for clave, histograma in sorted(self._histogramas[nombre].items()):
+                    clave = clave + proceso
+                    acumulado = 0
+                    for limite, conteo in zip(BUCKETS_SEGUNDOS, histograma.conteos):
+                        acumulado += conteo
+                        etiquetas = _formatear_etiquetas(clave + (('le', _formatear_numero(limite)),))
+                        lineas.append(f'{completo}_bucket{etiquetas} {acumulado}')
+                    etiquetas = _formatear_etiquetas(clave + (('le', '+Inf'),))
+                    lineas.append(f'{completo}_bucket{etiquetas} {histograma.total}')
+                    lineas.append(f'{completo}_sum{_formatear_etiquetas(clave)} {histograma.suma!r}')
+                    lineas.append(f'{completo}_count{_formatear_etiquetas(clave)} {histograma.total}')
+
+                # Cuantiles de la ventana reciente como summary aparte
+                lineas.append(f'# HELP {completo}_ventana {ayuda} (últimas {TAMANO_VENTANA} observaciones) '
+                              f'{AYUDA_POR_PROCESO}')
+                lineas.append(f'# TYPE {completo}_ventana summary')
+                for clave, histograma in sorted(self._histogramas[nombre].items()):
+                    clave = clave + proceso
+                    for cuantil, valor in histograma.cuantiles().items():
+                        etiquetas = _formatear_etiquetas(clave + (('quantile', str(cuantil)),))
+                        lineas.append(f'{completo}_ventana{etiquetas} {valor!r}')
+                    lineas.append(f'{completo}_ventana_sum{_formatear_etiquetas(clave)} {sum(histograma.ventana)!r}')
+                    lineas.append(f'{completo}_ventana_count{_formatear_etiquetas(clave)} {len(histograma.ventana)}')
+
+            for nombre in sorted(self._contadores):
+                completo = f'{self.prefijo}_{nombre}'
+                lineas.append(f'# HELP {completo} {self._ayudas.get(nombre, nombre)} {AYUDA_POR_PROCESO}')
+                lineas.append(f'# TYPE {completo} counter')
+                for clave, valor in sorted(self._contadores[nombre].items()):
+                    lineas.append(f'{completo}{_formatear_etiquetas(clave + proceso)} {_formatear_numero(valor)}')
+
+        vistos = set()
+        for nombre, ayuda, etiquetas, valor in medidores or []:
+            completo = f'{self.prefijo}_{nombre}'
+            if completo not in vistos:
+                vistos.add(completo)
+                lineas.append(f'# HELP {completo} {ayuda} {AYUDA_POR_PROCESO}')
+                lineas.append(f'# TYPE {completo} gauge')
+            lineas.append(f'{completo}{_formatear_etiquetas(tuple(sorted(etiquetas.items())) + proceso)} '
+                          f'{_formatear_numero(valor)}')
+
+        return '\n'.join(lineas) + '\n'
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Perfilado bajo demanda de requests individuales con cProfile.
+
+Cada ejecución perfilada guarda un archivo .pstats (abrible con pstats,
+snakeviz o gprof2dot) y retorna un resumen con las funciones de mayor tiempo
+acumulado. Sólo se perfila un request a la vez: cProfile mide el hilo que lo
+activa y varios perfiles simultáneos se mezclarían en los tiempos.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Funciones que se incluyen en el resumen
+TOP_FUNCIONES = 25
+
+
+class PerfiladorOcupado(Exception):
+    """Ya hay un request perfilándose en este proceso."""
+
+
+def resumir_estadisticas(estadisticas: pstats.Stats, limite: int = TOP_FUNCIONES) -> List[Dict[str, Any]]:
+    """Funciones ordenadas por tiempo acumulado, como dicts serializables."""
+    filas = []
+    for (archivo, linea, funcion), (primitivas, llamadas, propio, acumulado, _) in estadisticas.stats.items():
+        filas.append({
+            'funcion': f"{os.path.basename(archivo)}:{linea}({funcion})",
+            'llamadas': llamadas,
+            'llamadas_primitivas': primitivas,
+            'tiempo_propio': round(propio, 6),
+            'tiempo_acumulado': round(acumulado, 6)
+        })
+    filas.sort(key=lambda fila: fila['tiempo_acumulado'], reverse=True)
+    return filas[:limite]
+
+
+class Perfilador:
+    """Ejecuta funciones bajo cProfile y guarda los resultados en un directorio."""
+
+    def __init__(self, directorio: Optional[str] = None):
+        self.directorio = directorio or os.path.join(tempfile.gettempdir(), 'citrino_perfilado')
+        self._lock = threading.Lock()
+
+    def ejecutar(self, nombre: str, funcion: Callable[[], Any]) -> Tuple[Any, Dict[str, Any]]:
+        """
+        Ejecuta `funcion` perfilada.
+
+        Returns:
+            Tupla (resultado de la función, resumen con archivo y top funciones)
+
+        Raises:
+            PerfiladorOcupado: si otro request se está perfilando
+        """
+        if not self._lock.acquire(blocking=False):
+            raise PerfiladorOcupado("Ya hay un request perfilándose")
+
+        try:
+            perfil = cProfile.Profile()
+            inicio = time.perf_counter()
+            perfil.enable()
+            try:
+                resultado = funcion()
+            finally:
+                perfil.disable()
+            duracion = time.perf_counter() - inicio
+        finally:
+            self._lock.release()
+
+        os.makedirs(self.directorio, exist_ok=True)
+        archivo = os.path.join(
+            self.directorio,
+            f"{nombre}_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.pstats"
+        )
+        perfil.dump_stats(archivo)
+
+        estadisticas = pstats.Stats(perfil, stream=io.StringIO())
+        return resultado, {
+            'archivo': archivo,
+            'duracion_segundos': round(duracion, 6),
+            'total_llamadas': estadisticas.total_calls,
+            'top_funciones': resumir_estadisticas(estadisticas)
+        }
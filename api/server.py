@@ -3,47 +3,461 @@
 API Server para Citrino - Permite consultas desde Cherry Studio
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, has_request_context, make_response, send_file, url_for, \
+    stream_with_context
+from functools import wraps
+import hashlib
+import hmac
 import json
 import sys
 import os
+import threading
+import time
 from flask_cors import CORS
 
 # Agregar los directorios src y scripts al path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
 
-from recommendation_engine import RecommendationEngine
-from recommendation_engine_mejorado import RecommendationEngineMejorado
-from sistema_consulta import SistemaConsultaCitrino
+from admision import ControlAdmision, Sobrecarga, motivo_degradacion
+from catalogo import GestorCatalogo, estadisticas_catalogo, filtros_desde_solicitud, perfil_desde_solicitud
+from coalescencia import Coalescedor
+from compresion import comprimir, comprimir_flujo, elegir_codificacion, es_comprimible
+from metricas import RegistroMetricas
+from perfilado import Perfilador, PerfiladorOcupado
+import formato_binario
+from formato_binario import MSGPACK, TIPOS_MSGPACK
+from fragmentos import ensamblar_json, formatear_busqueda
+from solicitudes_lentas import RegistroSolicitudesLentas
+from trabajos import ColaTrabajos
 
 app = Flask(__name__)
 CORS(app)  # Permite peticiones desde otros dominios
 
-# Inicializar sistemas
-sistema_consulta = SistemaConsultaCitrino()
-motor_recomendacion = RecommendationEngine()
-motor_mejorado = RecommendationEngineMejorado()
+# Rutas de datos (configurables por variables de entorno)
+RUTA_BASE_DATOS = os.environ.get('CITRINO_BASE_DATOS', 'data/bd_final/propiedades_limpias.json')
+RUTA_GUIA_URBANA = os.environ.get('CITRINO_GUIA_URBANA', 'data/guia_urbana_municipal_completa.json')
+
+# Token para los endpoints de administración (deshabilitados si no se define)
+ADMIN_TOKEN = os.environ.get('CITRINO_ADMIN_TOKEN', '')
+
+# Segundos entre revisiones de los archivos del catálogo (0 = sin vigilancia).
+# Sin definir, un solo proceso no vigila y cada worker de gunicorn con
+# hermanos revisa cada VIGILANCIA_WORKERS_SEGUNDOS (ver intervalo_vigilancia)
+INTERVALO_VIGILANCIA = float(os.environ.get('CITRINO_VIGILAR_SEGUNDOS', '0'))
+VIGILANCIA_WORKERS_SEGUNDOS = 5.0
+
+
+def intervalo_vigilancia(workers: int = 1) -> float:
+    """
+    Intervalo de vigilancia para un proceso con `workers` workers en total.
+    Con varios workers se vigila aunque no se haya configurado: es lo que
+    lleva una recarga a los workers que no recibieron /api/admin/recargar.
+    """
+    if 'CITRINO_VIGILAR_SEGUNDOS' in os.environ or workers <= 1:
+        return INTERVALO_VIGILANCIA
+    return VIGILANCIA_WORKERS_SEGUNDOS
+
+# Segundos que clientes y proxies pueden reutilizar estadísticas y zonas
+SEGUNDOS_CACHE_LECTURA = int(os.environ.get('CITRINO_CACHE_SEGUNDOS', '30'))
+
+# Control de admisión de las recomendaciones: cálculos simultáneos, cola y
+# segundos máximos de espera en cola por proceso
+MAX_RECOMENDACIONES_CONCURRENTES = int(os.environ.get('CITRINO_MAX_CONCURRENTES', str(os.cpu_count() or 4)))
+MAX_COLA_RECOMENDACIONES = int(os.environ.get('CITRINO_MAX_COLA', str(2 * MAX_RECOMENDACIONES_CONCURRENTES)))
+ESPERA_COLA_SEGUNDOS = float(os.environ.get('CITRINO_ESPERA_COLA_SEGUNDOS', '2.0'))
+
+# Solicitudes más grandes se atienden en modo degradado (límite recortado, motor original)
+LIMITE_MAXIMO_RECOMENDACIONES = int(os.environ.get('CITRINO_LIMITE_MAXIMO', '50'))
+ANCHO_PRESUPUESTO_MAXIMO = float(os.environ.get('CITRINO_ANCHO_PRESUPUESTO_MAXIMO', '2000000'))
+
+# Exportaciones en segundo plano: simultáneas, pendientes, directorio y retención
+MAX_EXPORTACIONES_SIMULTANEAS = int(os.environ.get('CITRINO_MAX_EXPORTACIONES', '2'))
+MAX_EXPORTACIONES_PENDIENTES = int(os.environ.get('CITRINO_MAX_EXPORTACIONES_PENDIENTES', '10'))
+DIR_EXPORTACIONES = os.environ.get('CITRINO_DIR_EXPORTACIONES') or None
+RETENCION_EXPORTACIONES_SEGUNDOS = float(os.environ.get('CITRINO_RETENCION_EXPORTACIONES', '3600'))
+
+# Respuestas más chicas que esto (bytes) no se comprimen (0 = sin compresión)
+MINIMO_BYTES_COMPRESION = int(os.environ.get('CITRINO_COMPRIMIR_DESDE_BYTES', '1024'))
+
+# Perfiles por solicitud en /api/recomendar-lote
+MAX_PERFILES_LOTE = int(os.environ.get('CITRINO_MAX_PERFILES_LOTE', '100'))
+
+# Solicitudes más lentas que este umbral se guardan para reproducirlas (0 = desactivado)
+UMBRAL_SOLICITUD_LENTA = float(os.environ.get('CITRINO_UMBRAL_LENTO_SEGUNDOS', '1.0'))
+RUTA_LOG_LENTAS = os.environ.get('CITRINO_LOG_LENTAS', 'logs/solicitudes_lentas.jsonl')
+
+# Latencias por endpoint y por etapa de los motores (ver /api/metricas)
+metricas = RegistroMetricas()
+solicitudes_en_curso = {'total': 0}
+_en_curso_lock = threading.Lock()
+
+
+def observar_etapa(motor, etapa, segundos):
+    """Registra la duración de una etapa y la acumula en el request en curso"""
+    metricas.observar('etapa_duracion_segundos', segundos,
+                      'Duración de cada etapa de los motores y del API', motor=motor, etapa=etapa)
+    if has_request_context():
+        etapas = g.setdefault('etapas', {})
+        clave = f'{motor}.{etapa}'
+        etapas[clave] = etapas.get(clave, 0.0) + segundos
+
+
+# Catálogo vigente (sistema de consulta + motores). Cada request toma
+# gestor_catalogo.catalogo una sola vez y lo usa hasta terminar.
+gestor_catalogo = GestorCatalogo(RUTA_BASE_DATOS, RUTA_GUIA_URBANA, observador_etapas=observar_etapa)
+
+# Recomendaciones idénticas concurrentes comparten un solo cálculo
+coalescedor = Coalescedor()
+
+# Cálculos de recomendaciones simultáneos; el exceso se rechaza con 503
+control_admision = ControlAdmision(MAX_RECOMENDACIONES_CONCURRENTES, MAX_COLA_RECOMENDACIONES,
+                                   ESPERA_COLA_SEGUNDOS)
+
+# Perfilado bajo demanda (sólo administradores); los .pstats quedan en este directorio
+perfilador = Perfilador(os.environ.get('CITRINO_DIR_PERFILADO') or None)
+
+# Exportaciones de resultados (CSV, Excel, JSON) fuera del hilo del request
+cola_exportaciones = ColaTrabajos(DIR_EXPORTACIONES, MAX_EXPORTACIONES_SIMULTANEAS,
+                                  MAX_EXPORTACIONES_PENDIENTES, RETENCION_EXPORTACIONES_SEGUNDOS)
+
+# Solicitudes lentas con su cuerpo, etapas y caches (ver scripts/reproducir_solicitudes_lentas.py)
+registro_lentas = RegistroSolicitudesLentas(RUTA_LOG_LENTAS, UMBRAL_SOLICITUD_LENTA)
+
+# Estado de la carga inicial: 'pendiente', 'cargando', 'listo' o 'error'
+estado_carga = {
+    'estado': 'pendiente',
+    'inicio': None,
+    'duracion_segundos': None,
+    'error': None
+}
+_carga_lock = threading.Lock()
+
+
+def inicializar_datos(ruta_base_datos: str = None, ruta_guia_urbana: str = None) -> bool:
+    """
+    Carga la base de datos, construye índices y precalienta caches antes de
+    que el servidor acepte tráfico. Es idempotente: llamadas concurrentes o
+    repetidas no vuelven a cargar.
+
+    Returns:
+        True si los datos quedaron listos
+    """
+    with _carga_lock:
+        if estado_carga['estado'] == 'listo':
+            return True
+
+        estado_carga.update({'estado': 'cargando', 'inicio': time.time(), 'error': None})
+        try:
+            gestor_catalogo.cargar(ruta_base_datos, ruta_guia_urbana)
+        except Exception as e:
+            estado_carga.update({
+                'estado': 'error',
+                'error': str(e),
+                'duracion_segundos': round(time.time() - estado_carga['inicio'], 3)
+            })
+            print(f"Error cargando base de datos: {e}")
+            return False
+
+        estado_carga.update({
+            'estado': 'listo',
+            'duracion_segundos': round(time.time() - estado_carga['inicio'], 3)
+        })
+        print(f"Base de datos cargada exitosamente en {estado_carga['duracion_segundos']} s")
+        return True
+
 
-# Cargar base de datos al iniciar
 @app.before_request
-def cargar_datos():
-    if not hasattr(app, 'datos_cargados'):
-        print("Cargando base de datos...")
-        sistema_consulta.cargar_base_datos("data/bd_final/propiedades_limpias.json")
-        motor_recomendacion.cargar_propiedades(sistema_consulta.propiedades)
-
-        # Cargar datos para el motor mejorado
-        print("Cargando guía urbana municipal...")
+def iniciar_medicion():
+    g.inicio_solicitud = time.perf_counter()
+    g.catalogo_solicitud = gestor_catalogo.catalogo
+    with _en_curso_lock:
+        solicitudes_en_curso['total'] += 1
+
+
+@app.after_request
+def contar_respuesta(respuesta):
+    metricas.incrementar('respuestas_total', ayuda='Respuestas por endpoint y código HTTP',
+                         endpoint=request.endpoint or 'no_encontrado', codigo=str(respuesta.status_code))
+    g.codigo_respuesta = respuesta.status_code
+    return respuesta
+
+
+def codificacion_para(tamano=None):
+    """Codificación negociada para una respuesta de `tamano` bytes (None si no conviene)"""
+    if MINIMO_BYTES_COMPRESION <= 0 or (tamano is not None and tamano < MINIMO_BYTES_COMPRESION):
+        return None
+    return elegir_codificacion(request.accept_encodings)
+
+
+@app.after_request
+def comprimir_respuesta(respuesta):
+    """Comprime las respuestas JSON/NDJSON/texto según Accept-Encoding"""
+    if (not es_comprimible(respuesta.mimetype) or respuesta.direct_passthrough
+            or 'Content-Encoding' in respuesta.headers or respuesta.status_code < 200
+            or respuesta.status_code in (204, 304)):
+        return respuesta
+
+    respuesta.vary.add('Accept-Encoding')
+    if respuesta.is_streamed:
+        codificacion = codificacion_para()
+        if codificacion:
+            respuesta.response = comprimir_flujo(respuesta.response, codificacion)
+            respuesta.headers['Content-Encoding'] = codificacion
+        return respuesta
+
+    datos = respuesta.get_data()
+    codificacion = codificacion_para(len(datos))
+    if codificacion:
+        comprimido = comprimir(datos, codificacion)
+        metricas.incrementar('compresion_bytes_total', len(datos),
+                             ayuda='Bytes de respuestas comprimidas antes y después', tipo='original')
+        metricas.incrementar('compresion_bytes_total', len(comprimido),
+                             ayuda='Bytes de respuestas comprimidas antes y después', tipo='comprimido')
+        respuesta.set_data(comprimido)
+        respuesta.headers['Content-Encoding'] = codificacion
+    return respuesta
+
+
+@app.teardown_request
+def finalizar_medicion(error=None):
+    inicio = g.pop('inicio_solicitud', None)
+    if inicio is None:
+        return
+    with _en_curso_lock:
+        solicitudes_en_curso['total'] -= 1
+    duracion = time.perf_counter() - inicio
+    metricas.observar('solicitud_duracion_segundos', duracion,
+                      'Latencia total por endpoint', endpoint=request.endpoint or 'no_encontrado')
+    if registro_lentas.es_lenta(duracion):
         try:
-            motor_mejorado.cargar_propiedades(sistema_consulta.propiedades)
-            motor_mejorado.cargar_guias_urbanas("data/guia_urbana_municipal_completa.json")
-            print("Guía urbana cargada exitosamente")
+            registro_lentas.registrar(describir_solicitud_lenta(duracion))
         except Exception as e:
-            print(f"Advertencia: No se pudo cargar guía urbana: {e}")
+            # El registro nunca debe romper la respuesta
+            print(f"Error registrando solicitud lenta: {e}")
+
+
+def estado_caches(catalogo):
+    """Estado de los caches del catálogo y de la coalescencia"""
+    busqueda = catalogo.sistema.estadisticas_cache()
+    return {
+        'busqueda': {clave: busqueda[clave] for clave in ('hits', 'misses', 'entradas', 'bytes', 'hit_rate')},
+        'motor_original': dict(catalogo.motor_recomendacion.stats),
+        'motor_mejorado': dict(catalogo.motor_mejorado.stats),
+        'coalescencia': coalescedor.estadisticas()
+    }
+
+
+def describir_solicitud_lenta(duracion):
+    """Registro reproducible de la solicitud en curso para el log de solicitudes lentas"""
+    catalogo = g.get('catalogo_solicitud') or gestor_catalogo.catalogo
+    return {
+        'metodo': request.method,
+        'ruta': request.path,
+        'endpoint': request.endpoint,
+        'parametros': request.args.to_dict(),
+        'payload': request.get_json(silent=True),
+        # Lo que efectivamente llegó al motor: filtros normalizados (la clave del
+        # cache de búsquedas) o el perfil de la recomendación
+        'consulta': g.get('consulta'),
+        'codigo': g.get('codigo_respuesta'),
+        'duracion_segundos': round(duracion, 6),
+        'umbral_segundos': registro_lentas.umbral_segundos,
+        'catalogo': {
+            'version': catalogo.version,
+            'ruta': catalogo.ruta,
+            'mtime': catalogo.mtime,
+            'propiedades': len(catalogo.sistema.propiedades)
+        },
+        'etapas': {etapa: round(segundos, 6) for etapa, segundos in g.get('etapas', {}).items()},
+        'cache': estado_caches(catalogo)
+    }
+
 
-        app.datos_cargados = True
-        print("Base de datos cargada exitosamente")
+def responder_json(payload):
+    """
+    Respuesta JSON armada con los fragmentos preserializados del catálogo,
+    midiendo la etapa de serialización
+    """
+    inicio = time.perf_counter()
+    respuesta = app.response_class(ensamblar_json(payload), mimetype='application/json')
+    observar_etapa('api', 'serializacion', time.perf_counter() - inicio)
+    return respuesta
+
+
+NDJSON = 'application/x-ndjson'
+
+# Líneas que se agrupan en cada envío de una respuesta NDJSON
+FILAS_POR_BLOQUE = 200
+
+
+def formato_solicitado():
+    """'json', 'ndjson' o 'msgpack' según el header Accept (JSON si empatan)"""
+    mejor = request.accept_mimetypes.best_match(['application/json', NDJSON, *TIPOS_MSGPACK])
+    if mejor == NDJSON:
+        return 'ndjson'
+    if mejor in TIPOS_MSGPACK:
+        return 'msgpack'
+    return 'json'
+
+
+def quiere_ndjson():
+    """El cliente pidió NDJSON (Accept: application/x-ndjson) antes que JSON"""
+    return formato_solicitado() == 'ndjson'
+
+
+def formato_no_disponible():
+    """406 si el cliente pidió MessagePack y el servidor no tiene msgpack instalado"""
+    if formato_solicitado() == 'msgpack' and not formato_binario.disponible():
+        return jsonify({
+            'success': False,
+            'error': 'Formato MessagePack no disponible en este servidor',
+            'formatos': ['application/json', NDJSON]
+        }), 406
+    return None
+
+
+def responder_columnar(metadatos, registros):
+    """MessagePack con los registros como arreglos paralelos, midiendo la serialización"""
+    inicio = time.perf_counter()
+    respuesta = app.response_class(formato_binario.empaquetar(metadatos, registros), mimetype=MSGPACK)
+    observar_etapa('api', 'serializacion', time.perf_counter() - inicio)
+    return respuesta
+
+
+def responder_recomendaciones(payload):
+    """
+    Respuesta JSON o, si el cliente pidió MessagePack, columnar con ids,
+    compatibilidad y campos clave (sin justificaciones ni briefing)
+    """
+    if formato_solicitado() != 'msgpack':
+        return responder_json(payload)
+    metadatos = {clave: valor for clave, valor in payload.items()
+                 if clave not in ('recomendaciones', 'briefing_personalizado')}
+    return responder_columnar(metadatos, [rec.datos for rec in payload['recomendaciones']])
+
+
+def responder_ndjson_busqueda(catalogo, ids):
+    """
+    Envía una propiedad por línea a medida que se recorre el arreglo de ids,
+    sin armar la lista de resultados ni un JSON completo en memoria
+    """
+    propiedades = catalogo.sistema.propiedades
+    fragmentos = catalogo.fragmentos
+
+    def generar():
+        bloque = []
+        for i in ids:
+            bloque.append(fragmentos.busqueda(propiedades[i], guardar=False).json)
+            if len(bloque) >= FILAS_POR_BLOQUE:
+                yield b'\n'.join(bloque) + b'\n'
+                bloque = []
+        if bloque:
+            yield b'\n'.join(bloque) + b'\n'
+
+    respuesta = app.response_class(generar(), mimetype=NDJSON)
+    respuesta.headers['X-Total-Coincidencias'] = str(len(ids))
+    return respuesta
+
+
+def clave_solicitud(endpoint, catalogo, data):
+    """Clave canónica de una solicitud: endpoint, versión del catálogo y cuerpo ordenado"""
+    cuerpo = json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return endpoint, catalogo.version, cuerpo
+
+
+def calcular_coalescido(endpoint, catalogo, data, funcion):
+    """
+    Ejecuta el cálculo coalescido y con control de admisión: sólo el cálculo
+    que realmente corre ocupa un lugar. Un request perfilado siempre calcula
+    por su cuenta. Lanza Sobrecarga si no hay lugar.
+    """
+    def calcular():
+        with control_admision.admitir() as espera:
+            metricas.observar('admision_espera_segundos', espera,
+                              'Espera en la cola de admisión', endpoint=endpoint)
+            return funcion(catalogo, data)
+
+    if g.get('perfilando'):
+        return calcular()
+    clave = clave_solicitud(endpoint, catalogo, data)
+    return coalescedor.ejecutar(clave, calcular)
+
+
+def ajustar_solicitud_desmedida(data):
+    """
+    Recorta el límite de las solicitudes desmedidas.
+
+    Returns:
+        Tupla (datos a usar, motivo de la degradación o None)
+    """
+    motivo = motivo_degradacion(data, LIMITE_MAXIMO_RECOMENDACIONES, ANCHO_PRESUPUESTO_MAXIMO)
+    if motivo is None:
+        return data, None
+
+    metricas.incrementar('solicitudes_degradadas_total', ayuda='Solicitudes atendidas en modo degradado',
+                         endpoint=request.endpoint)
+    if 'limite' in data:
+        data = dict(data, limite=min(int(data['limite']), LIMITE_MAXIMO_RECOMENDACIONES))
+    return data, motivo
+
+
+def responder_sobrecarga(error):
+    """503 con Retry-After cuando el control de admisión rechaza la solicitud"""
+    metricas.incrementar('solicitudes_rechazadas_total', ayuda='Solicitudes rechazadas por sobrecarga',
+                         endpoint=request.endpoint)
+    respuesta = jsonify({
+        'success': False,
+        'error': str(error),
+        'reintentar_en': error.reintentar_en
+    })
+    respuesta.status_code = 503
+    respuesta.headers['Retry-After'] = str(error.reintentar_en)
+    return respuesta
+
+
+def es_admin() -> bool:
+    """Verifica el token de administración del header X-Admin-Token"""
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+def perfilable(endpoint):
+    """
+    Permite perfilar el endpoint con cProfile enviando el header X-Perfilar: 1
+    o ?perfilar=1 junto con el token de administración. La respuesta JSON
+    incluye 'perfilado' con el archivo .pstats y las funciones de mayor tiempo
+    acumulado. Sin la marca el endpoint se ejecuta directamente.
+    """
+    @wraps(endpoint)
+    def envoltura(*args, **kwargs):
+        if not (request.headers.get('X-Perfilar') or request.args.get('perfilar')):
+            return endpoint(*args, **kwargs)
+
+        if not es_admin():
+            return jsonify({
+                'success': False,
+                'error': 'No autorizado'
+            }), 403
+
+        g.perfilando = True
+        try:
+            resultado, resumen = perfilador.ejecutar(endpoint.__name__, lambda: endpoint(*args, **kwargs))
+        except PerfiladorOcupado as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 409
+
+        respuesta = make_response(resultado)
+        datos = respuesta.get_json(silent=True)
+        if isinstance(datos, dict):
+            datos['perfilado'] = resumen
+            respuesta = make_response(jsonify(datos), respuesta.status_code)
+        respuesta.headers['X-Perfil-Archivo'] = os.path.basename(resumen['archivo'])
+        return respuesta
+
+    return envoltura
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -51,74 +465,190 @@ def health_check():
     return jsonify({
         'status': 'ok',
         'message': 'API Citrino funcionando',
-        'total_propiedades': len(sistema_consulta.propiedades)
+        'total_propiedades': len(gestor_catalogo.catalogo.sistema.propiedades),
+        'coalescencia': coalescedor.estadisticas(),
+        'admision': control_admision.estadisticas(),
+        'exportaciones': cola_exportaciones.estadisticas()
     })
 
-@app.route('/api/buscar', methods=['POST'])
-def buscar_propiedades():
-    """Busca propiedades según filtros"""
-    try:
-        data = request.get_json()
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """Indica si los datos ya están cargados (200) o todavía no (503)"""
+    catalogo = gestor_catalogo.catalogo
+    listo = estado_carga['estado'] == 'listo'
+    return jsonify({
+        'ready': listo,
+        'estado': estado_carga['estado'],
+        'duracion_carga_segundos': estado_carga['duracion_segundos'],
+        'error': estado_carga['error'],
+        'recargando': gestor_catalogo.estado_recarga['en_curso'],
+        'total_propiedades': len(catalogo.sistema.propiedades),
+        'version_catalogo': catalogo.version
+    }), 200 if listo else 503
 
-        # Aplicar filtros
-        filtros = {}
+@app.route('/api/metricas', methods=['GET'])
+def exportar_metricas():
+    """
+    Métricas en formato de texto de Prometheus, del worker que atiende la
+    consulta (etiqueta pid): con varios workers cada consulta ve uno solo.
+    """
+    catalogo = gestor_catalogo.catalogo
+    cache_busqueda = catalogo.sistema.estadisticas_cache()
+    coalescencia = coalescedor.estadisticas()
+    admision = control_admision.estadisticas()
+    exportaciones = cola_exportaciones.estadisticas()
 
-        if 'zona' in data:
-            filtros['zona'] = data['zona']
+    def tasa_motor(motor):
+        return motor.stats['cache_hits'] / max(1, motor.stats['calculos_realizados'])
 
-        if 'precio_min' in data and data['precio_min']:
-            filtros['precio_min'] = float(data['precio_min'])
+    medidores = [
+        ('catalogo_propiedades', 'Propiedades en el catálogo vigente', {}, len(catalogo.sistema.propiedades)),
+        ('catalogo_version', 'Versión del catálogo vigente', {}, catalogo.version),
+        ('solicitudes_en_curso', 'Solicitudes en curso en este proceso', {}, solicitudes_en_curso['total']),
+        ('cache_tasa_aciertos', 'Proporción de aciertos por cache', {'cache': 'busqueda'},
+         cache_busqueda['hit_rate']),
+        ('cache_tasa_aciertos', 'Proporción de aciertos por cache', {'cache': 'motor_original'},
+         tasa_motor(catalogo.motor_recomendacion)),
+        ('cache_tasa_aciertos', 'Proporción de aciertos por cache', {'cache': 'motor_mejorado'},
+         tasa_motor(catalogo.motor_mejorado)),
+        ('cache_entradas', 'Entradas en cache', {'cache': 'busqueda'}, cache_busqueda['entradas']),
+        ('coalescencia', 'Recomendaciones ejecutadas y coalescidas', {'tipo': 'ejecuciones'},
+         coalescencia['ejecuciones']),
+        ('coalescencia', 'Recomendaciones ejecutadas y coalescidas', {'tipo': 'coalescidas'},
+         coalescencia['coalescidas']),
+        ('coalescencia', 'Recomendaciones ejecutadas y coalescidas', {'tipo': 'en_vuelo'},
+         coalescencia['en_vuelo']),
+        ('admision_en_ejecucion', 'Cálculos de recomendaciones en ejecución', {}, admision['en_ejecucion']),
+        ('admision_en_cola', 'Solicitudes esperando en la cola de admisión', {}, admision['en_cola']),
+        ('admision_capacidad', 'Capacidad del control de admisión', {'tipo': 'concurrentes'},
+         admision['max_concurrentes']),
+        ('admision_capacidad', 'Capacidad del control de admisión', {'tipo': 'cola'}, admision['max_cola']),
+        ('exportaciones', 'Trabajos de exportación por estado', {'estado': 'en_cola'}, exportaciones['en_cola']),
+        ('exportaciones', 'Trabajos de exportación por estado', {'estado': 'ejecutando'},
+         exportaciones['ejecutando']),
+        ('exportaciones', 'Trabajos de exportación por estado', {'estado': 'completados'},
+         exportaciones['completados']),
+        ('exportaciones', 'Trabajos de exportación por estado', {'estado': 'errores'}, exportaciones['errores']),
+        ('exportaciones', 'Trabajos de exportación por estado', {'estado': 'rechazados'},
+         exportaciones['rechazados']),
+    ]
+    return app.response_class(metricas.exportar(medidores),
+                              content_type='text/plain; version=0.0.4; charset=utf-8')
 
-        if 'precio_max' in data and data['precio_max']:
-            filtros['precio_max'] = float(data['precio_max'])
+@app.route('/api/admin/recargar', methods=['POST'])
+def recargar_catalogo():
+    """
+    Reconstruye el catálogo en segundo plano y lo publica al terminar.
 
-        if 'superficie_min' in data and data['superficie_min']:
-            filtros['superficie_min'] = float(data['superficie_min'])
+    La recarga ocurre en el proceso que recibe la solicitud. Si los archivos
+    cambiaron, los demás workers los cargan en la próxima revisión de su
+    vigilancia (activa por defecto con varios workers de gunicorn). Como la
+    versión sale del contenido, todos terminan con la misma.
+    """
+    if not es_admin():
+        return jsonify({
+            'success': False,
+            'error': 'No autorizado'
+        }), 403
 
-        if 'superficie_max' in data and data['superficie_max']:
-            filtros['superficie_max'] = float(data['superficie_max'])
+    esperar = request.args.get('esperar', '').lower() in ('1', 'true', 'si')
+    version_anterior = gestor_catalogo.catalogo.version
+    iniciada = gestor_catalogo.recargar(esperar=esperar)
+    estado = dict(gestor_catalogo.estado_recarga)
+    vigilancia = gestor_catalogo.intervalo_vigilancia
+    alcance = {
+        'alcance': 'todos_los_workers' if vigilancia else 'este_worker',
+        'intervalo_vigilancia': vigilancia
+    }
 
-        if 'habitaciones_min' in data and data['habitaciones_min']:
-            filtros['habitaciones_min'] = int(data['habitaciones_min'])
+    if not iniciada:
+        return jsonify({
+            'success': False,
+            'error': 'Ya hay una recarga en curso',
+            'recarga': estado
+        }), 409
 
-        if 'banos_min' in data and data['banos_min']:
-            filtros['banos_min'] = int(data['banos_min'])
+    if esperar and estado['error']:
+        return jsonify({
+            'success': False,
+            'error': estado['error'],
+            'version_catalogo': gestor_catalogo.catalogo.version,
+            'recarga': estado,
+            **alcance
+        }), 500
 
-        if 'tiene_garaje' in data:
-            filtros['tiene_garaje'] = bool(data['tiene_garaje'])
+    return jsonify({
+        'success': True,
+        'version_anterior': version_anterior,
+        'version_catalogo': gestor_catalogo.catalogo.version,
+        'recarga': estado,
+        **alcance
+    }), 200 if esperar else 202
 
-        # Realizar búsqueda
-        resultados = sistema_consulta.buscar_por_filtros(filtros)
+@app.route('/api/buscar', methods=['POST'])
+@perfilable
+def buscar_propiedades():
+    """Busca propiedades según filtros"""
+    catalogo = gestor_catalogo.catalogo
+    try:
+        data = request.get_json()
+        no_disponible = formato_no_disponible()
+        if no_disponible:
+            return no_disponible
 
-        # Limitar resultados
-        limite = data.get('limite', 20)
-        resultados = resultados[:limite]
+        filtros = filtros_desde_solicitud(data)
 
-        # Formatear resultados
-        propiedades_formateadas = []
-        for prop in resultados:
-            caract = prop.get('caracteristicas_principales', {})
-            ubicacion = prop.get('ubicacion', {})
+        # Ordenamiento opcional: precio, superficie, precio_m2 o fecha
+        ordenar_por = data.get('ordenar_por') or None
+        descendente = str(data.get('orden', 'asc')).lower() == 'desc'
+        g.consulta = {
+            'filtros': catalogo.sistema.normalizar_filtros(filtros),
+            'texto': data.get('texto') or None,
+            'ordenar_por': ordenar_por,
+            'descendente': descendente,
+            'con_cursor': bool(data.get('cursor'))
+        }
 
-            prop_formateada = {
-                'id': prop.get('id', ''),
-                'nombre': prop.get('nombre', ''),
-                'precio': caract.get('precio', 0),
-                'superficie_m2': caract.get('superficie_m2', 0),
-                'habitaciones': caract.get('habitaciones', 0),
-                'banos': caract.get('banos_completos', 0),
-                'garaje': caract.get('cochera_garaje', False),
-                'espacios_garaje': caract.get('numero_espacios_garaje', 0),
-                'zona': ubicacion.get('zona', ''),
-                'direccion': ubicacion.get('direccion', ''),
-                'fuente': prop.get('fuente', ''),
-                'descripcion': prop.get('descripcion', '')[:300] + '...' if len(prop.get('descripcion', '')) > 300 else prop.get('descripcion', '')
-            }
-            propiedades_formateadas.append(prop_formateada)
+        if quiere_ndjson():
+            # Modo masivo: todas las coincidencias (o 'limite'), una por línea
+            ids = catalogo.sistema.buscar_ids_por_filtros(filtros, ordenar_por, descendente,
+                                                          texto=data.get('texto') or None)
+            if data.get('limite'):
+                ids = ids[:int(data['limite'])]
+            return responder_ndjson_busqueda(catalogo, ids)
 
-        return jsonify({
+        # Realizar búsqueda paginada (cursor opaco de la página anterior).
+        # 'texto' busca palabras en nombre y descripción; sin ordenar_por
+        # los resultados se ordenan por relevancia.
+        limite = int(data.get('limite', 20))
+        inicio_consulta = time.perf_counter()
+        pagina = catalogo.sistema.buscar_pagina(
+            filtros,
+            ordenar_por=ordenar_por,
+            descendente=descendente,
+            limite=limite,
+            cursor=data.get('cursor') or None,
+            texto=data.get('texto') or None
+        )
+        observar_etapa('busqueda', 'consulta', time.perf_counter() - inicio_consulta)
+        resultados = pagina['propiedades']
+
+        if formato_solicitado() == 'msgpack':
+            return responder_columnar({
+                'success': True,
+                'total_resultados': len(resultados),
+                'total_coincidencias': pagina['total'],
+                'siguiente_cursor': pagina['siguiente_cursor']
+            }, [formatear_busqueda(prop) for prop in resultados])
+
+        # Propiedades ya formateadas y serializadas para esta versión del catálogo
+        propiedades_formateadas = [catalogo.fragmentos.busqueda(prop) for prop in resultados]
+
+        return responder_json({
             'success': True,
             'total_resultados': len(resultados),
+            'total_coincidencias': pagina['total'],
+            'siguiente_cursor': pagina['siguiente_cursor'],
             'propiedades': propiedades_formateadas
         })
 
@@ -128,102 +658,116 @@ def buscar_propiedades():
             'error': str(e)
         }), 400
 
+def calcular_recomendaciones(catalogo, data):
+    """Recomendaciones del motor original con briefing personalizado"""
+    # Formatear perfil para el motor
+    perfil = perfil_desde_solicitud(data, 'perfil_cherry')
+
+    # Generar recomendaciones con motor original (rendimiento optimizado)
+    recomendaciones = catalogo.motor_recomendacion.generar_recomendaciones(
+        perfil,
+        limite=data.get('limite', 10),
+        umbral_minimo=data.get('umbral_minimo', 0.3)
+    )
+
+    # Fragmentos fijos de cada propiedad más compatibilidad y justificación
+    resultados_formateados = [
+        catalogo.fragmentos.recomendacion(rec['propiedad'], round(rec['compatibilidad'] * 100, 1),
+                                          rec.get('justificacion', ''))
+        for rec in recomendaciones
+    ]
+
+    # Generar briefing personalizado
+    briefing = generar_briefing_personalizado(data, resultados_formateados)
+
+    return {
+        'success': True,
+        'total_recomendaciones': len(resultados_formateados),
+        'recomendaciones': resultados_formateados,
+        'briefing_personalizado': briefing
+    }
+
 @app.route('/api/recomendar', methods=['POST'])
+@perfilable
 def recomendar_propiedades():
     """Genera recomendaciones basadas en perfil"""
+    catalogo = gestor_catalogo.catalogo
     try:
         data = request.get_json()
+        no_disponible = formato_no_disponible()
+        if no_disponible:
+            return no_disponible
+        data, motivo = ajustar_solicitud_desmedida(data)
+        g.consulta = {'perfil': perfil_desde_solicitud(data, 'perfil_cherry'), 'degradada': motivo}
 
-        # Formatear perfil para el motor
-        perfil = {
-            'id': data.get('id', 'perfil_cherry'),
-            'presupuesto': {
-                'min': data.get('presupuesto_min', 0),
-                'max': data.get('presupuesto_max', 1000000)
-            },
-            'composicion_familiar': {
-                'adultos': data.get('adultos', 1),
-                'ninos': data.get('ninos', []),
-                'adultos_mayores': data.get('adultos_mayores', 0)
-            },
-            'preferencias': {
-                'ubicacion': data.get('zona_preferida', ''),
-                'tipo_propiedad': data.get('tipo_propiedad', '')
-            },
-            'necesidades': data.get('necesidades', [])
-        }
-
-        # Generar recomendaciones con motor original (rendimiento optimizado)
-        recomendaciones = motor_recomendacion.generar_recomendaciones(
-            perfil,
-            limite=data.get('limite', 10),
-            umbral_minimo=data.get('umbral_minimo', 0.3)
-        )
-
-        # Formatear resultados
-        resultados_formateados = []
-        for rec in recomendaciones:
-            prop = rec['propiedad']
-            caract = prop.get('caracteristicas_principales', {})
-            ubicacion = prop.get('ubicacion', {})
-
-            resultado = {
-                'id': prop.get('id', ''),
-                'nombre': prop.get('nombre', ''),
-                'precio': caract.get('precio', 0),
-                'superficie_m2': caract.get('superficie_m2', 0),
-                'habitaciones': caract.get('habitaciones', 0),
-                'banos': caract.get('banos_completos', 0),
-                'zona': ubicacion.get('zona', ''),
-                'compatibilidad': round(rec['compatibilidad'] * 100, 1),
-                'justificacion': rec.get('justificacion', ''),
-                'fuente': prop.get('fuente', '')
-            }
-            resultados_formateados.append(resultado)
-
-        # Generar briefing personalizado
-        briefing = generar_briefing_personalizado(data, resultados_formateados)
-
-        return jsonify({
-            'success': True,
-            'total_recomendaciones': len(resultados_formateados),
-            'recomendaciones': resultados_formateados,
-            'briefing_personalizado': briefing
-        })
+        payload = calcular_coalescido('recomendar_propiedades', catalogo, data, calcular_recomendaciones)
+        if motivo:
+            payload = dict(payload, degradada=motivo)
+        return responder_recomendaciones(payload)
 
+    except Sobrecarga as e:
+        return responder_sobrecarga(e)
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         }), 400
 
+def respuesta_por_version(catalogo, nombre, construir):
+    """
+    Responde con un cuerpo JSON serializado una sola vez por versión del
+    catálogo, con ETag fuerte y Cache-Control. Si el cliente envía un
+    If-None-Match vigente se responde 304 sin reconstruir nada. La variante
+    comprimida también se calcula una sola vez, con el nivel máximo, y tiene
+    su propio ETag.
+    """
+    entrada = catalogo.respuestas.get(nombre)
+    if entrada is None:
+        cuerpo = jsonify(construir(catalogo)).get_data()
+        etag = f"v{catalogo.version}-{hashlib.sha1(cuerpo).hexdigest()[:16]}"
+        entrada = catalogo.respuestas.setdefault(nombre, (cuerpo, etag))
+    cuerpo, etag = entrada
+
+    codificacion = codificacion_para(len(cuerpo))
+    if codificacion:
+        variante = catalogo.respuestas.get(f'{nombre}.{codificacion}')
+        if variante is None:
+            variante = catalogo.respuestas.setdefault(
+                f'{nombre}.{codificacion}', (comprimir(cuerpo, codificacion, maximo=True), f'{etag}-{codificacion}'))
+        cuerpo, etag = variante
+
+    if request.if_none_match.contains(etag):
+        respuesta = app.response_class(status=304)
+    else:
+        respuesta = app.response_class(cuerpo, mimetype='application/json')
+    if codificacion:
+        respuesta.headers['Content-Encoding'] = codificacion
+    respuesta.vary.add('Accept-Encoding')
+    respuesta.set_etag(etag)
+    respuesta.headers['Cache-Control'] = f'public, max-age={SEGUNDOS_CACHE_LECTURA}'
+    return respuesta
+
+def construir_estadisticas(catalogo):
+    """Estadísticas generales del catálogo"""
+    return {
+        'success': True,
+        'estadisticas': estadisticas_catalogo(catalogo)
+    }
+
+def construir_zonas(catalogo):
+    """Lista ordenada de zonas del catálogo"""
+    zonas = list(catalogo.sistema.indices['zona'].keys())
+    return {
+        'success': True,
+        'zonas': sorted(zonas)
+    }
+
 @app.route('/api/estadisticas', methods=['GET'])
 def obtener_estadisticas():
     """Obtiene estadísticas generales"""
+    catalogo = gestor_catalogo.catalogo
     try:
-        stats = {
-            'total_propiedades': sistema_consulta.estadisticas_globales['total_propiedades'],
-            'precio_promedio': sistema_consulta.estadisticas_globales['precio_promedio'],
-            'precio_minimo': sistema_consulta.estadisticas_globales['precio_minimo'],
-            'precio_maximo': sistema_consulta.estadisticas_globales['precio_maximo'],
-            'superficie_promedio': sistema_consulta.estadisticas_globales['superficie_promedio'],
-            'total_zonas': sistema_consulta.estadisticas_globales['total_zonas'],
-            'distribucion_zonas': {},
-            'distribucion_precios': {}
-        }
-
-        # Agregar distribución por zonas
-        for zona, props in list(sistema_consulta.indices['zona'].items())[:10]:
-            stats['distribucion_zonas'][zona] = len(props)
-
-        # Agregar distribución por precios
-        for rango, props in sistema_consulta.indices['precio'].items():
-            stats['distribucion_precios'][rango] = len(props)
-
-        return jsonify({
-            'success': True,
-            'estadisticas': stats
-        })
+        return respuesta_por_version(catalogo, 'estadisticas', construir_estadisticas)
 
     except Exception as e:
         return jsonify({
@@ -234,84 +778,225 @@ def obtener_estadisticas():
 @app.route('/api/zonas', methods=['GET'])
 def obtener_zonas():
     """Obtiene lista de todas las zonas disponibles"""
+    catalogo = gestor_catalogo.catalogo
     try:
-        zonas = list(sistema_consulta.indices['zona'].keys())
-        return jsonify({
-            'success': True,
-            'zonas': sorted(zonas)
-        })
+        return respuesta_por_version(catalogo, 'zonas', construir_zonas)
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         }), 400
 
+def calcular_recomendaciones_mejoradas(catalogo, data):
+    """Recomendaciones del motor mejorado (georreferenciación real)"""
+    # Formatear perfil para el motor
+    perfil = perfil_desde_solicitud(data, 'perfil_mejorado')
+
+    # Generar recomendaciones con motor mejorado
+    recomendaciones = catalogo.motor_mejorado.generar_recomendaciones(
+        perfil,
+        limite=data.get('limite', 5),
+        umbral_minimo=data.get('umbral_minimo', 0.3)
+    )
+
+    # Fragmentos fijos de cada propiedad más compatibilidad y justificación
+    resultados_formateados = [
+        catalogo.fragmentos.recomendacion(rec['propiedad'], round(rec['compatibilidad'], 1),
+                                          rec.get('justificacion', ''))
+        for rec in recomendaciones
+    ]
+
+    return {
+        'success': True,
+        'total_recomendaciones': len(resultados_formateados),
+        'recomendaciones': resultados_formateados,
+        'motor': 'mejorado_con_georreferenciacion'
+    }
+
 @app.route('/api/recomendar-mejorado', methods=['POST'])
+@perfilable
 def recomendar_propiedades_mejorado():
     """Genera recomendaciones con motor mejorado (georreferenciación real)"""
+    catalogo = gestor_catalogo.catalogo
     try:
         data = request.get_json()
+        no_disponible = formato_no_disponible()
+        if no_disponible:
+            return no_disponible
+        data, motivo = ajustar_solicitud_desmedida(data)
+        g.consulta = {'perfil': perfil_desde_solicitud(data, 'perfil_cherry' if motivo else 'perfil_mejorado'),
+                      'degradada': motivo}
 
-        # Formatear perfil para el motor
-        perfil = {
-            'id': data.get('id', 'perfil_mejorado'),
-            'presupuesto': {
-                'min': data.get('presupuesto_min', 0),
-                'max': data.get('presupuesto_max', 1000000)
-            },
-            'composicion_familiar': {
-                'adultos': data.get('adultos', 1),
-                'ninos': data.get('ninos', []),
-                'adultos_mayores': data.get('adultos_mayores', 0)
-            },
-            'preferencias': {
-                'ubicacion': data.get('zona_preferida', ''),
-                'tipo_propiedad': data.get('tipo_propiedad', '')
-            },
-            'necesidades': data.get('necesidades', [])
-        }
+        if motivo:
+            # Las solicitudes desmedidas usan el motor original, mucho más barato
+            payload = calcular_coalescido('recomendar_propiedades', catalogo, data, calcular_recomendaciones)
+            payload = dict(payload, motor='original_degradado', degradada=motivo)
+        else:
+            payload = calcular_coalescido('recomendar_propiedades_mejorado', catalogo, data,
+                                          calcular_recomendaciones_mejoradas)
+        return responder_recomendaciones(payload)
 
-        # Generar recomendaciones con motor mejorado
-        recomendaciones = motor_mejorado.generar_recomendaciones(
-            perfil,
-            limite=data.get('limite', 5),
-            umbral_minimo=data.get('umbral_minimo', 0.3)
-        )
+    except Sobrecarga as e:
+        return responder_sobrecarga(e)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
 
-        # Formatear resultados
-        resultados_formateados = []
-        for rec in recomendaciones:
-            prop = rec['propiedad']
-            caract = prop.get('caracteristicas_principales', {})
-            ubicacion = prop.get('ubicacion', {})
-
-            resultado = {
-                'id': prop.get('id', ''),
-                'nombre': prop.get('nombre', ''),
-                'precio': caract.get('precio', 0),
-                'superficie_m2': caract.get('superficie_m2', 0),
-                'habitaciones': caract.get('habitaciones', 0),
-                'banos': caract.get('banos_completos', 0),
-                'zona': ubicacion.get('zona', ''),
-                'compatibilidad': round(rec['compatibilidad'], 1),
-                'justificacion': rec.get('justificacion', ''),
-                'fuente': prop.get('fuente', '')
-            }
-            resultados_formateados.append(resultado)
+def recomendar_perfil_lote(catalogo, perfil, motor):
+    """Recomendaciones de un perfil del lote; los errores quedan en su propio resultado"""
+    try:
+        perfil, motivo = ajustar_solicitud_desmedida(perfil)
+        if motor == 'mejorado' and not motivo:
+            payload = calcular_coalescido('recomendar_propiedades_mejorado', catalogo, perfil,
+                                          calcular_recomendaciones_mejoradas)
+        else:
+            payload = calcular_coalescido('recomendar_propiedades', catalogo, perfil, calcular_recomendaciones)
+        if motivo:
+            payload = dict(payload, degradada=motivo)
+        return payload
+    except Sobrecarga as e:
+        return {'success': False, 'error': str(e), 'reintentar_en': e.reintentar_en}
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
 
+@app.route('/api/recomendar-lote', methods=['POST'])
+def recomendar_lote():
+    """
+    Recomendaciones para varios perfiles con el motor 'original' o 'mejorado'.
+    Con Accept: application/x-ndjson cada resultado se envía apenas está listo.
+    """
+    catalogo = gestor_catalogo.catalogo
+    try:
+        data = request.get_json()
+        perfiles = data.get('perfiles')
+        if not isinstance(perfiles, list) or not perfiles:
+            raise ValueError("Se requiere una lista 'perfiles'")
+        if len(perfiles) > MAX_PERFILES_LOTE:
+            raise ValueError(f"Máximo {MAX_PERFILES_LOTE} perfiles por lote")
+        motor = data.get('motor', 'original')
+        if motor not in ('original', 'mejorado'):
+            raise ValueError(f"Motor no soportado: {motor}")
+    except Exception as e:
         return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    def resultados():
+        for indice, perfil in enumerate(perfiles):
+            yield dict({'indice': indice}, **recomendar_perfil_lote(catalogo, perfil, motor))
+
+    if quiere_ndjson():
+        generar = (ensamblar_json(resultado) + b'\n' for resultado in resultados())
+        return app.response_class(stream_with_context(generar), mimetype=NDJSON)
+
+    return responder_json({
+        'success': True,
+        'total_perfiles': len(perfiles),
+        'resultados': list(resultados())
+    })
+
+FORMATOS_EXPORTACION = ('csv', 'excel', 'json')
+
+
+def exportar_busqueda(catalogo, data, trabajo):
+    """Trabajo de exportación: busca con los filtros de la solicitud y escribe el archivo"""
+    trabajo.avanzar('buscando', 0.05)
+    ids = catalogo.sistema.buscar_ids_por_filtros(
+        filtros_desde_solicitud(data),
+        ordenar_por=data.get('ordenar_por') or None,
+        descendente=str(data.get('orden', 'asc')).lower() == 'desc',
+        texto=data.get('texto') or None
+    )
+    if data.get('limite'):
+        ids = ids[:int(data['limite'])]
+
+    trabajo.avanzar('exportando', 0.3)
+    resultados = [catalogo.sistema.propiedades[i] for i in ids]
+    trabajo.resumen = {'total_resultados': len(resultados), 'version_catalogo': catalogo.version}
+    return catalogo.sistema.exportar_resultados(
+        resultados,
+        formato=data.get('formato', 'csv'),
+        nombre_archivo=f"exportacion_{trabajo.id}",
+        directorio=cola_exportaciones.directorio
+    )
+
+def describir_trabajo(trabajo):
+    """Estado del trabajo con las URLs de estado y descarga"""
+    return dict(
+        trabajo.a_dict(),
+        estado_url=url_for('estado_exportacion', id_trabajo=trabajo.id),
+        descarga_url=url_for('descargar_exportacion', id_trabajo=trabajo.id) if trabajo.estado == 'completado' else None
+    )
+
+@app.route('/api/exportaciones', methods=['POST'])
+def crear_exportacion():
+    """Encola la exportación de una búsqueda (mismos filtros que /api/buscar) y responde 202"""
+    catalogo = gestor_catalogo.catalogo
+    try:
+        data = request.get_json()
+        formato = data.get('formato', 'csv')
+        if formato not in FORMATOS_EXPORTACION:
+            raise ValueError(f"Formato no soportado: {formato}")
+        # Filtros inválidos se reportan ahora y no al terminar el trabajo
+        filtros_desde_solicitud(data)
+
+        trabajo = cola_exportaciones.enviar('exportacion', lambda t: exportar_busqueda(catalogo, data, t),
+                                            parametros=data)
+        respuesta = jsonify({
             'success': True,
-            'total_recomendaciones': len(resultados_formateados),
-            'recomendaciones': resultados_formateados,
-            'motor': 'mejorado_con_georreferenciacion'
+            'trabajo': describir_trabajo(trabajo)
         })
+        respuesta.status_code = 202
+        respuesta.headers['Location'] = url_for('estado_exportacion', id_trabajo=trabajo.id)
+        return respuesta
 
+    except Sobrecarga as e:
+        return responder_sobrecarga(e)
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         }), 400
 
+@app.route('/api/exportaciones/<id_trabajo>', methods=['GET'])
+def estado_exportacion(id_trabajo):
+    """Estado y progreso de una exportación"""
+    trabajo = cola_exportaciones.obtener(id_trabajo)
+    if trabajo is None:
+        return jsonify({
+            'success': False,
+            'error': 'Exportación no encontrada'
+        }), 404
+
+    return jsonify({
+        'success': True,
+        'trabajo': describir_trabajo(trabajo)
+    })
+
+@app.route('/api/exportaciones/<id_trabajo>/descarga', methods=['GET'])
+def descargar_exportacion(id_trabajo):
+    """Descarga el archivo de una exportación terminada (se envía por partes desde disco)"""
+    trabajo = cola_exportaciones.obtener(id_trabajo)
+    if trabajo is None:
+        return jsonify({
+            'success': False,
+            'error': 'Exportación no encontrada'
+        }), 404
+
+    if trabajo.estado != 'completado':
+        return jsonify({
+            'success': False,
+            'error': trabajo.error or 'La exportación todavía no terminó',
+            'trabajo': describir_trabajo(trabajo)
+        }), 409
+
+    extension = os.path.splitext(trabajo.archivo)[1]
+    return send_file(os.path.abspath(trabajo.archivo), as_attachment=True,
+                     download_name=f"citrino_exportacion_{trabajo.id[:8]}{extension}")
+
 def generar_briefing_personalizado(datos_prospecto, recomendaciones):
     """Genera un briefing personalizado para compartir con el prospecto"""
 
@@ -370,4 +1055,9 @@ if __name__ == '__main__':
     print("Endpoint: http://localhost:5000")
     print("Documentación: http://localhost:5000/api/health")
 
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # Carga completa antes de aceptar tráfico. Sin el reloader de debug, que
+    # cargaría todo dos veces (proceso vigilante y proceso hijo).
+    inicializar_datos()
+    if intervalo_vigilancia() > 0:
+        gestor_catalogo.vigilar_archivo(intervalo_vigilancia())
+    app.run(debug=True, use_reloader=False, host='0.0.0.0', port=5000)
\ No newline at end of file
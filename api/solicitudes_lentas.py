@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Registro de solicitudes lentas en un archivo JSONL rotativo.
+
+Cada línea guarda lo necesario para reproducir la solicitud fuera de
+producción: ruta y cuerpo JSON tal como llegaron, la consulta que recibió el
+motor (filtros normalizados, que son la clave del cache de búsquedas, o el
+perfil de la recomendación), versión y archivo del catálogo, duración por
+etapa y estado de los caches en ese momento. El script
+scripts/reproducir_solicitudes_lentas.py vuelve a ejecutar esas solicitudes
+contra un catálogo local con perfilado.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+# Tamaño máximo de cada archivo antes de rotar y respaldos que se conservan
+MAX_BYTES_ARCHIVO = 10 * 1024 * 1024
+RESPALDOS = 5
+
+
+class RegistroSolicitudesLentas:
+    """Escribe en JSONL las solicitudes que superan un umbral de duración."""
+
+    def __init__(self, ruta: str, umbral_segundos: float = 1.0,
+                 max_bytes: int = MAX_BYTES_ARCHIVO, respaldos: int = RESPALDOS):
+        self.ruta = ruta
+        self.umbral_segundos = umbral_segundos
+        self.registradas = 0
+
+        # El handler de logging rota el archivo y serializa las escrituras entre hilos
+        self._handler: Optional[RotatingFileHandler] = None
+        self._lock = threading.Lock()
+        self._max_bytes = max_bytes
+        self._respaldos = respaldos
+
+    @property
+    def activo(self) -> bool:
+        return self.umbral_segundos > 0
+
+    def es_lenta(self, duracion_segundos: float) -> bool:
+        return self.activo and duracion_segundos >= self.umbral_segundos
+
+    def registrar(self, registro: Dict[str, Any]) -> None:
+        """Agrega una línea al archivo; `registro` debe ser serializable a JSON."""
+        with self._lock:
+            if self._handler is None:
+                directorio = os.path.dirname(self.ruta)
+                if directorio:
+                    os.makedirs(directorio, exist_ok=True)
+                self._handler = RotatingFileHandler(self.ruta, maxBytes=self._max_bytes,
+                                                    backupCount=self._respaldos, encoding='utf-8')
+                self._handler.setFormatter(logging.Formatter('%(message)s'))
+
+        registro = dict(registro, marca=time.strftime('%Y-%m-%dT%H:%M:%S%z'))
+        linea = json.dumps(registro, ensure_ascii=False, sort_keys=True, default=str)
+        self._handler.handle(logging.makeLogRecord({'msg': linea, 'levelno': logging.INFO}))
+        self.registradas += 1
+
+    def cerrar(self) -> None:
+        with self._lock:
+            if self._handler is not None:
+                self._handler.close()
+                self._handler = None
+
+
+def leer_registros(rutas: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Lee registros de uno o más archivos JSONL (p. ej. el vigente y sus respaldos)."""
+    for ruta in rutas:
+        with open(ruta, 'r', encoding='utf-8') as f:
+            for numero, linea in enumerate(f, 1):
+                linea = linea.strip()
+                if not linea:
+                    continue
+                try:
+                    yield json.loads(linea)
+                except json.JSONDecodeError:
+                    # Una línea truncada (p. ej. el proceso murió escribiendo) no invalida el resto
+                    print(f"Advertencia: línea {numero} de {ruta} no es JSON válido")
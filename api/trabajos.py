@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Cola de trabajos en segundo plano para exportaciones y reportes pesados.
+
+Los trabajos corren en un pool local de hilos, sin broker externo: el API
+responde de inmediato con el id del trabajo, el cliente consulta el estado y
+descarga el archivo cuando está listo. La cantidad de trabajos simultáneos
+la fija el tamaño del pool y la de pendientes un tope que, al superarse,
+rechaza con Sobrecarga. Los trabajos terminados y sus archivos se descartan
+pasada la retención.
+
+El estado de los trabajos se guarda en un registro SQLite dentro del
+directorio de exportaciones. Con varios workers de gunicorn que comparten
+ese directorio, cualquiera responde el estado y la descarga de un trabajo
+que ejecuta otro, y el tope de pendientes vale para todos.
+
+Cada proceso renueva cada `intervalo_latido` segundos el latido de los
+trabajos que ejecuta. Un trabajo sin terminar cuyo latido tiene más de tres
+intervalos se da por perdido (su worker terminó, o corre en otro host que
+ya no responde): deja de contar para el tope y se informa en error. El
+vencimiento se registra al abrir el registro en cada proceso, al encolar y
+en cada latido; las consultas de estado y las métricas sólo leen.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from admision import Sobrecarga
+
+ESTADOS_FINALES = ('completado', 'error')
+
+NOMBRE_REGISTRO = 'trabajos.sqlite'
+# Se incrementa al cambiar las columnas; un registro de otra versión se recrea
+VERSION_REGISTRO = 2
+
+COLUMNAS = ('id', 'tipo', 'estado', 'etapa', 'progreso', 'parametros', 'creado', 'iniciado',
+            'terminado', 'error', 'archivo', 'resumen', 'propietario', 'latido')
+
+# Latidos que puede perder un trabajo antes de darse por perdido
+LATIDOS_PERDIDOS = 3
+
+ERROR_PERDIDO = 'El proceso que ejecutaba el trabajo dejó de responder'
+
+
+class Trabajo:
+    """Estado y resultado de un trabajo en segundo plano."""
+
+    def __init__(self, tipo: str, parametros: Dict[str, Any], id_trabajo: Optional[str] = None):
+        self.id = id_trabajo or uuid.uuid4().hex
+        self.tipo = tipo
+        self.parametros = parametros
+        self.estado = 'en_cola'
+        self.etapa = None
+        self.progreso = 0.0
+        self.creado = time.time()
+        self.iniciado: Optional[float] = None
+        self.terminado: Optional[float] = None
+        self.error: Optional[str] = None
+        self.archivo: Optional[str] = None
+        self.resumen: Dict[str, Any] = {}
+        # Proceso que lo ejecuta y última vez que dio señales de vida
+        self.propietario: Optional[str] = None
+        self.latido = self.creado
+        # La cola registra cada avance para que lo vean los demás workers
+        self._al_avanzar: Optional[Callable[['Trabajo'], None]] = None
+
+    @classmethod
+    def desde_fila(cls, fila: Tuple) -> 'Trabajo':
+        """Reconstruye un trabajo a partir de una fila del registro."""
+        datos = dict(zip(COLUMNAS, fila))
+        trabajo = cls(datos['tipo'], json.loads(datos['parametros']), datos['id'])
+        for campo in ('estado', 'etapa', 'progreso', 'creado', 'iniciado', 'terminado', 'error', 'archivo',
+                      'propietario', 'latido'):
+            setattr(trabajo, campo, datos[campo])
+        trabajo.resumen = json.loads(datos['resumen'])
+        return trabajo
+
+    def a_fila(self) -> Tuple:
+        return (self.id, self.tipo, self.estado, self.etapa, self.progreso,
+                json.dumps(self.parametros, ensure_ascii=False, default=str), self.creado, self.iniciado,
+                self.terminado, self.error, self.archivo,
+                json.dumps(self.resumen, ensure_ascii=False, default=str), self.propietario, self.latido)
+
+    @property
+    def finalizado(self) -> bool:
+        return self.estado in ESTADOS_FINALES
+
+    def avanzar(self, etapa: str, progreso: float) -> None:
+        """Informa la etapa en curso y la fracción completada (0 a 1)."""
+        self.etapa = etapa
+        self.progreso = round(min(1.0, max(0.0, progreso)), 3)
+        if self._al_avanzar:
+            self._al_avanzar(self)
+
+    def a_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'tipo': self.tipo,
+            'estado': self.estado,
+            'etapa': self.etapa,
+            'progreso': self.progreso,
+            'parametros': self.parametros,
+            'creado': self.creado,
+            'iniciado': self.iniciado,
+            'terminado': self.terminado,
+            'duracion_segundos': round(self.terminado - self.iniciado, 3) if self.terminado and self.iniciado else None,
+            'error': self.error,
+            'resumen': self.resumen,
+            'archivo': os.path.basename(self.archivo) if self.archivo else None
+        }
+
+
+# Función del trabajo: recibe el Trabajo (para informar avance) y retorna la ruta del archivo
+FuncionTrabajo = Callable[[Trabajo], str]
+
+
+class ColaTrabajos:
+    """Pool de hilos con tope de trabajos pendientes, registro compartido y retención de resultados."""
+
+    def __init__(self, directorio: Optional[str] = None, max_simultaneos: int = 2,
+                 max_pendientes: int = 10, retencion_segundos: float = 3600, intervalo_latido: float = 10.0):
+        self.directorio = directorio or os.path.join(tempfile.gettempdir(), 'citrino_exportaciones')
+        self.ruta_registro = os.path.join(self.directorio, NOMBRE_REGISTRO)
+        self.max_simultaneos = max(1, max_simultaneos)
+        self.max_pendientes = max_pendientes
+        self.retencion_segundos = retencion_segundos
+        self.intervalo_latido = intervalo_latido
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._hilo_latido: Optional[threading.Thread] = None
+        self._detener_latido = threading.Event()
+        self._lock = threading.Lock()
+        self._conexion: Optional[sqlite3.Connection] = None
+        self._pid_conexion: Optional[int] = None
+        # Identidad de este proceso en el registro; se fija al conectar (después del fork)
+        self._propietario: Optional[str] = None
+        # Contadores de este proceso; los estados en curso se cuentan en el registro
+        self.stats = {'enviados': 0, 'completados': 0, 'errores': 0, 'rechazados': 0}
+
+    def _ejecutor(self) -> ThreadPoolExecutor:
+        # Se crea al primer trabajo: con gunicorn preload_app los hilos no sobreviven al fork
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_simultaneos, thread_name_prefix='trabajo')
+            self._detener_latido.clear()
+            self._hilo_latido = threading.Thread(target=self._latir, name='trabajos-latido', daemon=True)
+            self._hilo_latido.start()
+        return self._pool
+
+    @property
+    def vencimiento_segundos(self) -> float:
+        """Antigüedad del latido a partir de la cual un trabajo sin terminar se da por perdido."""
+        return LATIDOS_PERDIDOS * self.intervalo_latido
+
+    def _latir(self) -> None:
+        """Renueva el latido de los trabajos de este proceso y registra los perdidos de otros."""
+        while not self._detener_latido.wait(self.intervalo_latido):
+            try:
+                with self._lock:
+                    conexion = self._conectar()
+                    conexion.execute(
+                        "UPDATE trabajos SET latido = ? WHERE propietario = ? AND estado NOT IN ('completado', 'error')",
+                        (time.time(), self._propietario))
+                    self._expirar(conexion)
+            except sqlite3.Error as e:
+                print(f"Error renovando el latido de los trabajos: {e}")
+
+    def _conectar(self) -> sqlite3.Connection:
+        # Se abre al primer uso y de nuevo tras un fork: la conexión no se comparte entre procesos
+        if self._conexion is None or self._pid_conexion != os.getpid():
+            os.makedirs(self.directorio, exist_ok=True)
+            conexion = sqlite3.connect(self.ruta_registro, timeout=10, check_same_thread=False,
+                                       isolation_level=None)
+            conexion.execute('PRAGMA journal_mode=WAL')
+            conexion.execute('BEGIN IMMEDIATE')
+            if conexion.execute('PRAGMA user_version').fetchone()[0] != VERSION_REGISTRO:
+                # Sólo guarda estado transitorio: se descarta el de una versión anterior
+                conexion.execute('DROP TABLE IF EXISTS trabajos')
+                conexion.execute(f'PRAGMA user_version = {VERSION_REGISTRO}')
+            conexion.execute("""
+                CREATE TABLE IF NOT EXISTS trabajos (
+                    id TEXT PRIMARY KEY,
+                    tipo TEXT NOT NULL,
+                    estado TEXT NOT NULL,
+                    etapa TEXT,
+                    progreso REAL NOT NULL,
+                    parametros TEXT NOT NULL,
+                    creado REAL NOT NULL,
+                    iniciado REAL,
+                    terminado REAL,
+                    error TEXT,
+                    archivo TEXT,
+                    resumen TEXT NOT NULL,
+                    propietario TEXT,
+                    latido REAL NOT NULL
+                )""")
+            conexion.execute('CREATE INDEX IF NOT EXISTS trabajos_estado ON trabajos (estado)')
+            self._propietario = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+            # Al iniciar el proceso se registran los trabajos que quedaron perdidos
+            self._expirar(conexion)
+            conexion.execute('COMMIT')
+            self._conexion = conexion
+            self._pid_conexion = os.getpid()
+        return self._conexion
+
+    def _escribir(self, conexion: sqlite3.Connection, trabajo: Trabajo) -> None:
+        marcadores = ', '.join('?' * len(COLUMNAS))
+        conexion.execute(f"INSERT OR REPLACE INTO trabajos ({', '.join(COLUMNAS)}) VALUES ({marcadores})",
+                         trabajo.a_fila())
+
+    def _guardar(self, trabajo: Trabajo) -> None:
+        # Cada avance también cuenta como latido
+        trabajo.latido = time.time()
+        with self._lock:
+            self._escribir(self._conectar(), trabajo)
+
+    def _expirar(self, conexion: sqlite3.Connection) -> None:
+        """Pasa a error los trabajos sin terminar de otros procesos cuyo latido venció."""
+        ahora = time.time()
+        conexion.execute(
+            "UPDATE trabajos SET estado = 'error', error = ?, terminado = ? "
+            "WHERE estado NOT IN ('completado', 'error') AND latido < ? AND propietario IS NOT ?",
+            (ERROR_PERDIDO, ahora, ahora - self.vencimiento_segundos, self._propietario))
+
+    def _vencido(self, trabajo: Trabajo) -> bool:
+        return not trabajo.finalizado and trabajo.latido < time.time() - self.vencimiento_segundos
+
+    def enviar(self, tipo: str, funcion: FuncionTrabajo, parametros: Optional[Dict[str, Any]] = None) -> Trabajo:
+        """
+        Encola un trabajo y retorna de inmediato.
+
+        Raises:
+            Sobrecarga: si ya hay max_pendientes trabajos sin terminar (en todos los procesos)
+        """
+        self.limpiar_vencidos()
+        trabajo = Trabajo(tipo, parametros or {})
+        trabajo._al_avanzar = self._guardar
+        with self._lock:
+            conexion = self._conectar()
+            trabajo.propietario = self._propietario
+            # Contar e insertar en una transacción: otro worker no puede encolar en el medio
+            conexion.execute('BEGIN IMMEDIATE')
+            try:
+                # Los trabajos perdidos (latido vencido) no ocupan lugar
+                self._expirar(conexion)
+                pendientes = conexion.execute(
+                    "SELECT COUNT(*) FROM trabajos WHERE estado NOT IN ('completado', 'error')").fetchone()[0]
+                if pendientes < self.max_pendientes:
+                    self._escribir(conexion, trabajo)
+            except Exception:
+                conexion.execute('ROLLBACK')
+                raise
+            conexion.execute('COMMIT')
+
+            if pendientes >= self.max_pendientes:
+                self.stats['rechazados'] += 1
+                raise Sobrecarga(f"Hay {pendientes} trabajos pendientes; reintentar más tarde", 5)
+            self.stats['enviados'] += 1
+            self._ejecutor().submit(self._ejecutar, trabajo, funcion)
+        return trabajo
+
+    def _ejecutar(self, trabajo: Trabajo, funcion: FuncionTrabajo) -> None:
+        trabajo.estado = 'ejecutando'
+        trabajo.iniciado = time.time()
+        self._guardar(trabajo)
+        try:
+            archivo = funcion(trabajo)
+        except Exception as e:
+            trabajo.error = str(e)
+            trabajo.terminado = time.time()
+            trabajo.estado = 'error'
+            self._guardar(trabajo)
+            with self._lock:
+                self.stats['errores'] += 1
+            print(f"Error en trabajo {trabajo.tipo} {trabajo.id}: {e}")
+            return
+
+        # Archivo y estado se registran juntos: quien lo ve 'completado' ya encuentra el archivo
+        trabajo.archivo = archivo
+        trabajo.etapa, trabajo.progreso = 'listo', 1.0
+        trabajo.terminado = time.time()
+        trabajo.estado = 'completado'
+        self._guardar(trabajo)
+        with self._lock:
+            self.stats['completados'] += 1
+
+    def obtener(self, id_trabajo: str) -> Optional[Trabajo]:
+        """Estado registrado del trabajo, lo ejecute este proceso u otro."""
+        with self._lock:
+            fila = self._conectar().execute(f"SELECT {', '.join(COLUMNAS)} FROM trabajos WHERE id = ?",
+                                            (id_trabajo,)).fetchone()
+        if not fila:
+            return None
+        trabajo = Trabajo.desde_fila(fila)
+        if self._vencido(trabajo):
+            # El registro lo actualiza el próximo latido; la consulta no escribe
+            trabajo.estado, trabajo.error = 'error', ERROR_PERDIDO
+            trabajo.terminado = trabajo.latido
+        return trabajo
+
+    def limpiar_vencidos(self) -> int:
+        """Descarta los trabajos terminados hace más de la retención y borra sus archivos."""
+        limite = time.time() - self.retencion_segundos
+        with self._lock:
+            conexion = self._conectar()
+            vencidos = conexion.execute(
+                "SELECT id, archivo FROM trabajos WHERE estado IN ('completado', 'error') AND terminado < ?",
+                (limite,)).fetchall()
+            conexion.executemany('DELETE FROM trabajos WHERE id = ?', [(id_trabajo,) for id_trabajo, _ in vencidos])
+
+        for _, archivo in vencidos:
+            if archivo:
+                try:
+                    os.remove(archivo)
+                except OSError:
+                    pass
+        return len(vencidos)
+
+    def estadisticas(self) -> Dict[str, int]:
+        """Trabajos enviados y terminados por este proceso; en curso, los de todos (sin los perdidos)."""
+        with self._lock:
+            estados = dict(self._conectar().execute(
+                'SELECT estado, COUNT(*) FROM trabajos WHERE latido >= ? GROUP BY estado',
+                (time.time() - self.vencimiento_segundos,)).fetchall())
+        return dict(self.stats, en_cola=estados.get('en_cola', 0), ejecutando=estados.get('ejecutando', 0),
+                    max_simultaneos=self.max_simultaneos, max_pendientes=self.max_pendientes)
+
+    def cerrar(self, esperar: bool = True) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=esperar)
+            self._pool = None
+        if self._hilo_latido is not None:
+            self._detener_latido.set()
+            self._hilo_latido.join()
+            self._hilo_latido = None
+        with self._lock:
+            if self._conexion is not None and self._pid_conexion == os.getpid():
+                self._conexion.close()
+            self._conexion = None
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Punto de entrada WSGI para producción (gunicorn con api/gunicorn.conf.py).
+
+El catálogo, los índices y los caches se construyen al importar este módulo
+en el proceso maestro; con preload_app los workers se crean por fork y
+comparten esas páginas por copy-on-write en lugar de cargar cada uno su copia.
+
+Lo compartido se conserva mientras el worker sólo busca: las búsquedas leen
+arreglos de numpy y tocan pocos registros. Las recomendaciones recorren todas
+las propiedades y al hacerlo escriben el contador de referencias de cada
+registro, así que copian casi todas sus páginas: con carga de /api/recomendar
+cada worker termina con memoria privada del orden del catálogo. Para medirlo:
+python scripts/medir_memoria_catalogo.py --fork
+"""
+
+import gc
+import os
+import sys
+
+sys.path.append(os.path.dirname(__file__))
+
+# Sin recolector durante la carga: evita recorrer millones de objetos recién
+# creados y escribir en sus encabezados (ver gc.freeze más abajo)
+gc.disable()
+
+from server import app, inicializar_datos, gestor_catalogo
+
+if not inicializar_datos():
+    raise RuntimeError("No se pudo cargar la base de datos de Citrino")
+gestor_catalogo.catalogo.sistema.preparar_memoria_compartida()
+
+# Mueve todo lo cargado a la generación permanente: el recolector de cada
+# worker no vuelve a tocar esos objetos (los contadores de referencias sí)
+gc.freeze()
+
+application = app
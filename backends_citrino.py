@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Backends de datos para el puente de chat Citrino.
+
+El puente necesita tres operaciones: buscar propiedades, recomendar según un
+perfil y obtener estadísticas del mercado. Hay dos formas de atenderlas:
+
+- BackendHTTP: contra el API Citrino (api/server.py), con una sesión
+  keep-alive y un pool de conexiones reutilizadas entre turnos del chat.
+- BackendEnProceso: llamando directamente a SistemaConsultaCitrino y al
+  motor de recomendación en el mismo proceso, sin serializar JSON ni abrir
+  conexiones. Sirve cuando el puente corre en el mismo host que los datos.
+
+Ambos reciben los mismos parámetros que los endpoints del API y retornan las
+propiedades con el mismo formato que sus respuestas.
+"""
+
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+API_URL = os.getenv("CITRINO_API_URL", "http://localhost:5000")
+
+# 'http' o 'proceso'
+BACKEND = os.getenv("CITRINO_BACKEND", "http")
+
+
+class BackendHTTP:
+    """Consultas al API Citrino con conexiones keep-alive reutilizadas."""
+
+    def __init__(self, api_url: str = API_URL, timeout: float = 30, max_conexiones: int = 4):
+        self.api_url = api_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        # Búsqueda y estadísticas pueden ir en paralelo: una conexión por cada una
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=max_conexiones)
+        self.session.mount('http://', adaptador)
+        self.session.mount('https://', adaptador)
+
+    def _resultado(self, response: requests.Response, campo: str, vacio: Any) -> Any:
+        if response.status_code == 200:
+            resultado = response.json()
+            if resultado.get('success'):
+                return resultado.get(campo, vacio)
+        return vacio
+
+    def buscar(self, parametros: Dict[str, Any]) -> List[Dict[str, Any]]:
+        response = self.session.post(f"{self.api_url}/api/buscar", json=parametros, timeout=self.timeout)
+        return self._resultado(response, 'propiedades', [])
+
+    def recomendar(self, perfil: Dict[str, Any]) -> List[Dict[str, Any]]:
+        response = self.session.post(f"{self.api_url}/api/recomendar", json=perfil, timeout=self.timeout)
+        return self._resultado(response, 'recomendaciones', [])
+
+    def estadisticas(self) -> Dict[str, Any]:
+        response = self.session.get(f"{self.api_url}/api/estadisticas", timeout=self.timeout)
+        return self._resultado(response, 'estadisticas', {})
+
+    def cerrar(self) -> None:
+        self.session.close()
+
+
+class BackendEnProceso:
+    """
+    Consultas directas al catálogo (sistema de consulta y motor original)
+    cargado en este proceso.
+    """
+
+    def __init__(self, ruta_base_datos: Optional[str] = None, ruta_guia_urbana: Optional[str] = None,
+                 catalogo=None):
+        """
+        Args:
+            ruta_base_datos: JSON de propiedades (por defecto CITRINO_BASE_DATOS)
+            ruta_guia_urbana: JSON de la guía urbana (por defecto CITRINO_GUIA_URBANA)
+            catalogo: Catálogo ya construido (p. ej. el del servidor si el puente corre dentro de él)
+        """
+        # Los módulos del API sólo se importan en este modo
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+        from catalogo import construir_catalogo
+
+        if catalogo is None:
+            ruta_base_datos = ruta_base_datos or os.getenv(
+                'CITRINO_BASE_DATOS', 'data/bd_final/propiedades_limpias.json')
+            ruta_guia_urbana = ruta_guia_urbana or os.getenv(
+                'CITRINO_GUIA_URBANA', 'data/guia_urbana_municipal_completa.json')
+            catalogo = construir_catalogo(ruta_base_datos, ruta_guia_urbana)
+        self.catalogo = catalogo
+
+    def buscar(self, parametros: Dict[str, Any]) -> List[Dict[str, Any]]:
+        from catalogo import filtros_desde_solicitud
+        from fragmentos import formatear_busqueda
+
+        pagina = self.catalogo.sistema.buscar_pagina(
+            filtros_desde_solicitud(parametros),
+            ordenar_por=parametros.get('ordenar_por') or None,
+            descendente=str(parametros.get('orden', 'asc')).lower() == 'desc',
+            limite=int(parametros.get('limite', 20)),
+            texto=parametros.get('texto') or None
+        )
+        return [formatear_busqueda(prop) for prop in pagina['propiedades']]
+
+    def recomendar(self, perfil: Dict[str, Any]) -> List[Dict[str, Any]]:
+        from catalogo import perfil_desde_solicitud
+        from fragmentos import formatear_recomendacion
+
+        recomendaciones = self.catalogo.motor_recomendacion.generar_recomendaciones(
+            perfil_desde_solicitud(perfil),
+            limite=perfil.get('limite', 10),
+            umbral_minimo=perfil.get('umbral_minimo', 0.3)
+        )
+        return [
+            dict(formatear_recomendacion(rec['propiedad']),
+                 compatibilidad=round(rec['compatibilidad'] * 100, 1),
+                 justificacion=rec.get('justificacion', ''))
+            for rec in recomendaciones
+        ]
+
+    def estadisticas(self) -> Dict[str, Any]:
+        from catalogo import estadisticas_catalogo
+        return estadisticas_catalogo(self.catalogo)
+
+    def cerrar(self) -> None:
+        pass
+
+
+def crear_backend(tipo: Optional[str] = None, **opciones):
+    """Backend 'http' (por defecto) o 'proceso' según el argumento o CITRINO_BACKEND."""
+    tipo = tipo or BACKEND
+    if tipo == 'http':
+        return BackendHTTP(**opciones)
+    if tipo == 'proceso':
+        return BackendEnProceso(**opciones)
+    raise ValueError(f"Backend no soportado: {tipo}")
@@ -4,21 +4,42 @@ Puente entre Cherry Studio y API Citrino
 Permite "chatear con la información" inmobiliaria
 """
 
-import requests
+import argparse
 import json
 import os
-from typing import Dict, Any, List
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
 import openai
 from datetime import datetime
 
+from backends_citrino import crear_backend
+from src.extractor_perfiles import extraer_perfil
+
+# Filtros que aplica /api/buscar: dos búsquedas con los mismos dan el mismo resultado
+CAMPOS_FILTRO = ("zona", "precio_min", "precio_max", "habitaciones_min")
+
 class ChatCitrinoBridge:
     """Clase puente para conversaciones con datos inmobiliarios"""
 
-    def __init__(self):
-        self.api_url = "http://localhost:5000"
-        self.api_recomendar = f"{self.api_url}/api/recomendar"
-        self.api_buscar = f"{self.api_url}/api/buscar"
-        self.api_estadisticas = f"{self.api_url}/api/estadisticas"
+    def __init__(self, backend=None, verbose: bool = False):
+        """
+        Args:
+            backend: BackendHTTP o BackendEnProceso (ver backends_citrino.py).
+                Por defecto el indicado en CITRINO_BACKEND ('http' si no se define).
+                cerrar() también lo cierra
+            verbose: Imprime el desglose de tiempos de cada turno
+        """
+        self.backend = backend or crear_backend()
+        self.verbose = verbose
+
+        # Extracción con LLM y estadísticas de un mismo turno
+        self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="turno")
+        # Búsqueda por reglas: en su propio hilo para que, si se descarta y sigue
+        # corriendo, no demore la extracción ni las estadísticas del turno siguiente
+        self._pool_reglas = ThreadPoolExecutor(max_workers=1, thread_name_prefix="busqueda-reglas")
+        self._busqueda_reglas = None
+        self.ultimo_turno: Dict[str, Any] = {}
 
         # Configurar cliente OpenRouter para modelos económicos
         api_key = os.getenv("OPENROUTER_API_KEY", "tu-api-key-openrouter")
@@ -109,27 +130,48 @@ Ejemplo: {{"presupuesto_min": 150000, "presupuesto_max": 250000, "zona": "Equipe
             # Fallback a parámetros básicos
             return {"consulta_tipo": "busqueda"}
 
+    def parametros_desde_reglas(self, consulta: str) -> Dict[str, Any]:
+        """Parámetros de búsqueda que reconocen las reglas de extractor_perfiles, sin LLM"""
+        perfil = extraer_perfil(consulta).perfil
+        presupuesto = perfil["presupuesto"]
+        preferencias = perfil["preferencias"]
+        return {
+            "presupuesto_min": presupuesto["min"] or None,
+            "presupuesto_max": presupuesto["max"] or None,
+            "zona": preferencias["ubicacion"],
+            "tipo_propiedad": preferencias["estilo_propiedad"],
+            "consulta_tipo": "busqueda"
+        }
+
+    def _parametros_api(self, parametros: Dict[str, Any]) -> Dict[str, Any]:
+        """Limpia los parámetros para la API (el presupuesto filtra por precio)"""
+        api_params = {}
+        for key, value in parametros.items():
+            if value is not None and value != "" and value != []:
+                if key in ["presupuesto_min", "presupuesto_max"]:
+                    api_params[key.replace("presupuesto", "precio")] = int(value)
+                elif key == "habitaciones_min":
+                    api_params[key] = int(value)
+                elif key == "zona":
+                    api_params["zona"] = value
+                elif key == "tipo_propiedad":
+                    api_params["tipo_propiedad"] = value
+
+        api_params["limite"] = 10
+        return api_params
+
+    def _filtros_efectivos(self, parametros: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Filtros que la búsqueda aplicaría con estos parámetros (None si no son válidos)"""
+        try:
+            api_params = self._parametros_api(parametros)
+        except (TypeError, ValueError):
+            return None
+        return {campo: api_params[campo] for campo in CAMPOS_FILTRO if api_params.get(campo)}
+
     def buscar_propiedades(self, parametros: Dict[str, Any]) -> List[Dict]:
-        """Realiza búsqueda de propiedades en la API"""
+        """Realiza búsqueda de propiedades en el backend"""
         try:
-            # Limpiar parámetros para la API
-            api_params = {}
-            for key, value in parametros.items():
-                if value is not None and value != "" and value != []:
-                    if key in ["presupuesto_min", "presupuesto_max", "habitaciones_min"]:
-                        api_params[key] = int(value)
-                    elif key == "zona":
-                        api_params["zona"] = value
-                    elif key == "tipo_propiedad":
-                        api_params["tipo_propiedad"] = value
-
-            api_params["limite"] = 10
-
-            response = requests.post(self.api_buscar, json=api_params, timeout=30)
-            if response.status_code == 200:
-                resultado = response.json()
-                if resultado.get('success'):
-                    return resultado.get('propiedades', [])
+            return self.backend.buscar(self._parametros_api(parametros))
         except Exception as e:
             print(f"Error en búsqueda: {e}")
 
@@ -151,11 +193,7 @@ Ejemplo: {{"presupuesto_min": 150000, "presupuesto_max": 250000, "zona": "Equipe
                 "necesidades": perfil.get("necesidades", [])
             }
 
-            response = requests.post(self.api_recomendar, json=api_perfil, timeout=30)
-            if response.status_code == 200:
-                resultado = response.json()
-                if resultado.get('success'):
-                    return resultado.get('recomendaciones', [])
+            return self.backend.recomendar(api_perfil)
         except Exception as e:
             print(f"Error en recomendación: {e}")
 
@@ -164,17 +202,14 @@ Ejemplo: {{"presupuesto_min": 150000, "presupuesto_max": 250000, "zona": "Equipe
     def obtener_estadisticas(self) -> Dict[str, Any]:
         """Obtiene estadísticas del mercado"""
         try:
-            response = requests.get(self.api_estadisticas, timeout=10)
-            if response.status_code == 200:
-                resultado = response.json()
-                if resultado.get('success'):
-                    return resultado.get('estadisticas', {})
-        except:
-            pass
+            return self.backend.estadisticas()
+        except Exception as e:
+            print(f"Error obteniendo estadísticas: {e}")
         return {}
 
-    def sintetizar_respuesta(self, consulta: str, parametros: Dict[str, Any], resultados: List[Dict]) -> str:
-        """Usa LLM para sintetizar resultados en respuesta conversacional"""
+    def sintetizar_respuesta(self, consulta: str, parametros: Dict[str, Any], resultados: List[Dict],
+                             estadisticas: Optional[Dict[str, Any]] = None) -> str:
+        """Usa LLM para sintetizar resultados (y el contexto del mercado) en respuesta conversacional"""
 
         # Preparar contexto de resultados
         contexto_resultados = ""
@@ -191,6 +226,14 @@ Ejemplo: {{"presupuesto_min": 150000, "presupuesto_max": 250000, "zona": "Equipe
         else:
             contexto_resultados = "No se encontraron propiedades que coincidan con los criterios."
 
+        contexto_mercado = "No disponible."
+        if estadisticas:
+            contexto_mercado = (
+                f"{estadisticas.get('total_propiedades', 0):,} propiedades en {estadisticas.get('total_zonas', 0)} zonas; "
+                f"precio promedio ${estadisticas.get('precio_promedio', 0):,.0f} "
+                f"(entre ${estadisticas.get('precio_minimo', 0):,.0f} y ${estadisticas.get('precio_maximo', 0):,.0f})"
+            )
+
         prompt = f"""
 Basado en esta consulta y resultados, genera una respuesta conversacional y profesional:
 
@@ -201,6 +244,8 @@ PARAMÉTROS EXTRAÍDOS: {json.dumps(parametros, indent=2)}
 RESULTADOS ENCONTRADOS:
 {contexto_resultados}
 
+CONTEXTO DEL MERCADO: {contexto_mercado}
+
 REQUISITOS DE RESPUESTA:
 1. Saludo profesional y personalizado
 2. Reconocimiento de lo que buscan
@@ -221,12 +266,45 @@ Longitud: 2-3 párrafos concisos pero completos.
         return self.consultar_llm(messages)
 
     def procesar_consulta(self, consulta: str) -> str:
-        """Procesa una consulta en lenguaje natural y devuelve respuesta"""
+        """
+        Procesa una consulta en lenguaje natural y devuelve respuesta.
 
-        print(f"\n🔄 Procesando consulta: '{consulta}'")
+        Mientras el LLM extrae los parámetros se piden las estadísticas del
+        mercado y se adelanta una búsqueda con los parámetros que reconocen las
+        reglas. Si el LLM llega a los mismos filtros se usa esa búsqueda; si
+        no, se busca de nuevo. No se adelanta otra búsqueda mientras siga
+        corriendo una descartada. Los tiempos del turno quedan en
+        self.ultimo_turno.
+        """
 
-        # 1. Extraer parámetros con LLM
-        parametros = self.extraer_parametros_busqueda(consulta)
+        print(f"\n🔄 Procesando consulta: '{consulta}'")
+        inicio = time.perf_counter()
+        tiempos: Dict[str, float] = {}
+
+        def medir(etapa, funcion, *args):
+            t = time.perf_counter()
+            try:
+                return funcion(*args)
+            finally:
+                tiempos[etapa] = time.perf_counter() - t
+
+        # 1. Extraer parámetros con LLM; en paralelo, estadísticas y búsqueda por reglas
+        extraccion = self._pool.submit(medir, "extraccion", self.extraer_parametros_busqueda, consulta)
+        estadisticas = self._pool.submit(medir, "estadisticas", self.obtener_estadisticas)
+        especulativos = self.parametros_desde_reglas(consulta)
+        filtros_reglas = self._filtros_efectivos(especulativos)
+        busqueda_reglas = None
+        especulacion = "sin_reglas"
+        if filtros_reglas:
+            if self._busqueda_reglas is not None and not self._busqueda_reglas.done():
+                especulacion = "ocupada"
+            else:
+                busqueda_reglas = self._pool_reglas.submit(medir, "busqueda_reglas", self.buscar_propiedades,
+                                                           especulativos)
+                self._busqueda_reglas = busqueda_reglas
+                especulacion = "descartada"
+
+        parametros = extraccion.result()
         print(f"📊 Parámetros extraídos: {parametros}")
 
         # 2. Determinar tipo de consulta y ejecutar
@@ -234,18 +312,47 @@ Longitud: 2-3 párrafos concisos pero completos.
 
         if consulta_tipo == "recomendacion":
             # Es una recomendación basada en perfil
-            resultados = self.recomendar_propiedades(parametros)
+            resultados = medir("busqueda", self.recomendar_propiedades, parametros)
+        elif busqueda_reglas is not None and self._filtros_efectivos(parametros) == filtros_reglas:
+            # La búsqueda adelantada ya es la que se pediría
+            especulacion = "usada"
+            resultados = medir("busqueda", busqueda_reglas.result)
         else:
             # Es una búsqueda directa
-            resultados = self.buscar_propiedades(parametros)
+            resultados = medir("busqueda", self.buscar_propiedades, parametros)
 
         print(f"🏠 Resultados encontrados: {len(resultados)}")
 
         # 3. Sintetizar respuesta con LLM
-        respuesta = self.sintetizar_respuesta(consulta, parametros, resultados)
+        mercado = medir("espera_estadisticas", estadisticas.result)
+        respuesta = medir("sintesis", self.sintetizar_respuesta, consulta, parametros, resultados, mercado)
+
+        tiempos["total"] = time.perf_counter() - inicio
+        self.ultimo_turno = {
+            "tiempos": {etapa: round(segundos, 3) for etapa, segundos in tiempos.items()},
+            "busqueda_reglas": especulacion
+        }
+        if self.verbose:
+            print(f"⏱️  Turno {tiempos['total']:.2f}s: extracción {tiempos['extraccion']:.2f}s, "
+                  f"búsqueda {tiempos['busqueda']:.2f}s (reglas: {especulacion}), "
+                  f"estadísticas {tiempos.get('estadisticas', 0):.2f}s "
+                  f"(espera {tiempos['espera_estadisticas']:.2f}s), síntesis {tiempos['sintesis']:.2f}s")
 
         return respuesta
 
+    def cerrar(self) -> None:
+        """Libera los hilos del puente y las conexiones del backend."""
+        self._pool.shutdown(wait=True)
+        # Una búsqueda por reglas descartada no se espera
+        self._pool_reglas.shutdown(wait=False, cancel_futures=True)
+        self.backend.cerrar()
+
+    def __enter__(self) -> 'ChatCitrinoBridge':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.cerrar()
+
     def iniciar_chat_interactivo(self):
         """Inicia chat interactivo para pruebas"""
         print("🏠 CHAT CITRINO - Asesor Inmobiliario Inteligente")
@@ -275,12 +382,23 @@ Longitud: 2-3 párrafos concisos pero completos.
 
 def main():
     """Función principal"""
+    parser = argparse.ArgumentParser(description="Chat Citrino Bridge")
+    parser.add_argument("--backend", choices=["http", "proceso"], default=None,
+                        help="'http' consulta el API; 'proceso' carga los datos en este proceso "
+                             "(por defecto CITRINO_BACKEND o 'http')")
+    parser.add_argument("--verbose", action="store_true",
+                        help="Mostrar el desglose de tiempos de cada turno")
+    args = parser.parse_args()
+
     print("🚀 Iniciando Chat Citrino Bridge...")
-    print("Asegúrate de tener el servidor API corriendo y la API key de OpenAI configurada")
+    if (args.backend or os.getenv("CITRINO_BACKEND", "http")) == "http":
+        print("Asegúrate de tener el servidor API corriendo y la API key de OpenAI configurada")
+    else:
+        print("Cargando los datos en este proceso (sin servidor API)")
     print()
 
-    bridge = ChatCitrinoBridge()
-    bridge.iniciar_chat_interactivo()
+    with ChatCitrinoBridge(crear_backend(args.backend), verbose=args.verbose) as bridge:
+        bridge.iniciar_chat_interactivo()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
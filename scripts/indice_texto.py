@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Índice invertido de texto completo para la base de datos de Citrino.
+
+Tokeniza nombre y descripción de cada propiedad sin acentos y en minúsculas,
+y ordena los resultados con BM25.
+"""
+
+import math
+import re
+import unicodedata
+from array import array
+from typing import Dict, List, Iterable, Tuple, Optional
+
+import numpy as np
+
+# Palabras vacías frecuentes en los avisos inmobiliarios
+PALABRAS_VACIAS = frozenset("""
+a al ante con de del desde el en entre es esta este hacia la las lo los mas o para
+por que se sin su sus un una uno unos unas y ya muy tiene cuenta
+""".split())
+
+PATRON_TOKEN = re.compile(r'[a-z0-9]+')
+
+# El nombre pesa más que la descripción al contar frecuencias
+PESO_NOMBRE = 2
+
+
+def normalizar_texto(texto: str) -> str:
+    """Pasa a minúsculas y elimina acentos (Amoblado -> amoblado, Urubó -> urubo)."""
+    descompuesto = unicodedata.normalize('NFKD', texto.lower())
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+def tokenizar(texto: str) -> List[str]:
+    """Divide un texto normalizado en tokens, sin palabras vacías ni tokens de una letra."""
+    if not texto:
+        return []
+    return [t for t in PATRON_TOKEN.findall(normalizar_texto(texto))
+            if len(t) > 1 and t not in PALABRAS_VACIAS]
+
+
+class IndiceTextoInvertido:
+    """Índice invertido con ranking BM25 y actualización incremental."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # token -> (filas, frecuencias) en arreglos compactos
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self.longitudes = array('f')
+        self._longitud_total = 0.0
+
+    @property
+    def total_documentos(self) -> int:
+        return len(self.longitudes)
+
+    def agregar_documento(self, fila: int, nombre: str = '', descripcion: str = '') -> None:
+        """
+        Indexa una propiedad. Las filas deben agregarse en orden creciente
+        y sin huecos, igual que en la lista de propiedades del catálogo.
+        """
+        if fila != len(self.longitudes):
+            raise ValueError(f"Fila fuera de orden: se esperaba {len(self.longitudes)}, se recibió {fila}")
+
+        frecuencias: Dict[str, int] = {}
+        for token in tokenizar(nombre):
+            frecuencias[token] = frecuencias.get(token, 0) + PESO_NOMBRE
+        for token in tokenizar(descripcion):
+            frecuencias[token] = frecuencias.get(token, 0) + 1
+
+        for token, frecuencia in frecuencias.items():
+            if token not in self.postings:
+                self.postings[token] = (array('I'), array('H'))
+            filas, tfs = self.postings[token]
+            filas.append(fila)
+            tfs.append(min(frecuencia, 65535))
+
+        longitud = float(sum(frecuencias.values()))
+        self.longitudes.append(longitud)
+        self._longitud_total += longitud
+
+    def agregar_documentos(self, documentos: Iterable[Tuple[int, str, str]]) -> None:
+        """Indexa varias propiedades (fila, nombre, descripcion)."""
+        for fila, nombre, descripcion in documentos:
+            self.agregar_documento(fila, nombre, descripcion)
+
+    def buscar(self, consulta: str, permitidos: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Busca los documentos que contienen algún término de la consulta.
+
+        Args:
+            consulta: Texto libre
+            permitidos: Máscara booleana opcional de filas admitidas
+
+        Returns:
+            Tupla (filas, puntajes) ordenada por puntaje BM25 descendente;
+            los empates se resuelven por número de fila.
+        """
+        terminos = set(tokenizar(consulta))
+        n = self.total_documentos
+        if not terminos or not n:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64)
+
+        # Copias: una vista sobre el array impediría agregar documentos mientras se busca
+        longitudes = np.array(self.longitudes, dtype=np.float64)
+        longitud_media = self._longitud_total / n or 1.0
+        puntajes = np.zeros(n, dtype=np.float64)
+
+        for termino in terminos:
+            if termino not in self.postings:
+                continue
+            filas_arr, tfs_arr = self.postings[termino]
+            filas = np.array(filas_arr, dtype=np.int64)
+            tfs = np.array(tfs_arr, dtype=np.float64)
+
+            df = len(filas)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            normalizacion = self.k1 * (1 - self.b + self.b * longitudes[filas] / longitud_media)
+            puntajes[filas] += idf * tfs * (self.k1 + 1) / (tfs + normalizacion)
+
+        if permitidos is not None:
+            puntajes[~permitidos] = 0.0
+
+        filas = np.flatnonzero(puntajes > 0)
+        orden = np.lexsort((filas, -puntajes[filas]))
+        filas = filas[orden].astype(np.int32)
+        return filas, puntajes[filas]
+
+    def terminos_consulta(self, consulta: str) -> List[str]:
+        """Retorna los términos normalizados y únicos de una consulta, ordenados."""
+        return sorted(set(tokenizar(consulta)))
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Mide la memoria residente de un worker del API con el catálogo cargado
+como diccionarios (json.load), como registros compactos y como registros
+compactos con los textos largos diferidos a un archivo lateral.
+
+Cada modo corre en un proceso aparte para que las mediciones no se mezclen.
+Si no se indica --ruta se genera un catálogo sintético replicando
+data/propiedades_ampliado.json hasta --propiedades registros.
+
+Con --fork mide en cambio lo que comparten los workers de gunicorn: carga
+como api/wsgi.py (preparar_memoria_compartida y gc.freeze), crea un worker
+por fork y reporta cuánta memoria privada ensucia y a qué ritmo responde,
+primero con búsquedas y después con recomendaciones.
+
+Uso:
+    python scripts/medir_memoria_catalogo.py --propiedades 76853
+    python scripts/medir_memoria_catalogo.py --ruta data/bd_final/propiedades_limpias.json
+    python scripts/medir_memoria_catalogo.py --fork --propiedades 20000
+"""
+
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+DIRECTORIO_SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+DIRECTORIO_RAIZ = os.path.join(DIRECTORIO_SCRIPTS, '..')
+
+sys.path.insert(0, DIRECTORIO_SCRIPTS)
+sys.path.insert(0, os.path.join(DIRECTORIO_RAIZ, 'src'))
+
+
+def memoria_residente_mb(campo: str = 'VmRSS') -> float:
+    """
+    Lee un campo de memoria de /proc/self/status (Linux). RssAnon excluye las
+    páginas de archivos mapeados, que el sistema puede descartar y que los
+    workers comparten. En otros sistemas usa el pico de ru_maxrss.
+    """
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for linea in f:
+                if linea.startswith(campo + ':'):
+                    return int(linea.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def generar_catalogo_sintetico(destino: str, total: int) -> None:
+    """Replica las propiedades de ejemplo hasta alcanzar `total` registros."""
+    with open(os.path.join(DIRECTORIO_RAIZ, 'data', 'propiedades_ampliado.json'), 'r', encoding='utf-8') as f:
+        base = json.load(f)
+
+    propiedades = []
+    for i in range(total):
+        prop = json.loads(json.dumps(base[i % len(base)]))
+        prop['id'] = f"prop_{i:06d}"
+        caract = prop.get('caracteristicas_principales', {})
+        if isinstance(caract.get('precio'), (int, float)):
+            caract['precio'] = caract['precio'] + i % 997
+        if not prop.get('descripcion'):
+            # Los avisos reales traen descripciones de cientos de caracteres
+            prop['descripcion'] = (
+                f"{prop.get('nombre', '')} con {caract.get('habitaciones', 0)} habitaciones, "
+                f"{caract.get('superficie_m2', 0)} m2 y excelente ubicación. Aviso {i}. "
+            ) * 6
+        propiedades.append(prop)
+
+    with open(destino, 'w', encoding='utf-8') as f:
+        json.dump(propiedades, f, ensure_ascii=False)
+
+
+MODOS = ('dict', 'compacto', 'diferido')
+
+PERFIL_CARGA = {
+    'composicion_familiar': {'adultos': 2, 'ninos': [{'edad': 8}], 'adultos_mayores': 0},
+    'presupuesto': {'min': 100000, 'max': 300000, 'tipo': 'compra'},
+    'necesidades': ['escuela_primaria', 'supermercado'],
+    'preferencias': {'ubicacion': 'Equipetrol', 'seguridad': 'alta'}
+}
+
+
+def memoria_privada_mb() -> float:
+    """Páginas propias del proceso (Private_Dirty): lo que un worker no comparte con el maestro."""
+    try:
+        with open('/proc/self/smaps_rollup', 'r') as f:
+            for linea in f:
+                if linea.startswith('Private_Dirty:'):
+                    return int(linea.split()[1]) / 1024
+    except OSError:
+        pass
+    return float('nan')
+
+
+def medir_fork(ruta: str, busquedas: int, recomendaciones: int) -> dict:
+    """
+    Carga el catálogo como el maestro de gunicorn y mide un worker creado por
+    fork: memoria privada y solicitudes por segundo de cada tipo de carga.
+    """
+    from sistema_consulta import SistemaConsultaCitrino
+    from recommendation_engine import RecommendationEngine
+    from recommendation_engine_mejorado import RecommendationEngineMejorado
+
+    gc.disable()
+    sistema = SistemaConsultaCitrino()
+    sistema.cargar_base_datos(ruta)
+    motor = RecommendationEngine()
+    motor.cargar_propiedades(sistema.propiedades)
+    motor_mejorado = RecommendationEngineMejorado()
+    motor_mejorado.cargar_propiedades(sistema.propiedades)
+    sistema.precalentar()
+    sistema.preparar_memoria_compartida()
+    gc.freeze()
+
+    lectura, escritura = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # Worker: como post_fork en api/gunicorn.conf.py
+        os.close(lectura)
+        gc.enable()
+        resultado = {'propiedades': len(sistema.propiedades), 'privada_inicial_mb': round(memoria_privada_mb(), 1)}
+
+        inicio = time.perf_counter()
+        for i in range(busquedas):
+            cursor = None
+            for _ in range(3):
+                pagina = sistema.buscar_pagina({'precio_max': 100000 + (i % 50) * 5000}, 'precio', limite=20,
+                                               cursor=cursor)
+                cursor = pagina.get('siguiente_cursor')
+            sistema.buscar_texto('piscina', limite=20)
+        resultado['busquedas_por_segundo'] = round(busquedas / (time.perf_counter() - inicio), 1)
+        resultado['privada_busquedas_mb'] = round(memoria_privada_mb(), 1)
+
+        inicio = time.perf_counter()
+        for i in range(recomendaciones):
+            perfil = dict(PERFIL_CARGA, id=f'carga_{i}')
+            (motor if i % 2 else motor_mejorado).generar_recomendaciones(perfil, limite=5)
+        resultado['recomendaciones_por_segundo'] = round(recomendaciones / (time.perf_counter() - inicio), 2)
+        resultado['privada_recomendaciones_mb'] = round(memoria_privada_mb(), 1)
+
+        os.write(escritura, json.dumps(resultado).encode('utf-8'))
+        os._exit(0)
+
+    os.close(escritura)
+    with os.fdopen(lectura, 'rb') as f:
+        datos = f.read()
+    os.waitpid(pid, 0)
+    return json.loads(datos)
+
+
+def medir_worker(ruta: str, modo: str) -> dict:
+    """Carga el catálogo como lo hace el API y reporta la memoria residente."""
+    from sistema_consulta import SistemaConsultaCitrino
+    from recommendation_engine import RecommendationEngine
+    from recommendation_engine_mejorado import RecommendationEngineMejorado
+
+    gc.collect()
+    rss_inicial = memoria_residente_mb()
+    anonima_inicial = memoria_residente_mb('RssAnon')
+    inicio = time.time()
+
+    sistema = SistemaConsultaCitrino()
+    sistema.cargar_base_datos(ruta, compacto=modo != 'dict', diferir_textos_largos=modo == 'diferido')
+    motor = RecommendationEngine()
+    motor.cargar_propiedades(sistema.propiedades)
+    motor_mejorado = RecommendationEngineMejorado()
+    motor_mejorado.cargar_propiedades(sistema.propiedades)
+
+    gc.collect()
+    return {
+        'modo': modo,
+        'propiedades': len(sistema.propiedades),
+        'segundos_carga': round(time.time() - inicio, 2),
+        'rss_inicial_mb': round(rss_inicial, 1),
+        'rss_final_mb': round(memoria_residente_mb(), 1),
+        'rss_catalogo_mb': round(memoria_residente_mb() - rss_inicial, 1),
+        'anonima_catalogo_mb': round(memoria_residente_mb('RssAnon') - anonima_inicial, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memoria residente del catálogo por worker')
+    parser.add_argument('--ruta', help='Archivo JSON del catálogo')
+    parser.add_argument('--propiedades', type=int, default=76853,
+                        help='Tamaño del catálogo sintético si no se indica --ruta')
+    parser.add_argument('--modo', choices=MODOS, help=argparse.SUPPRESS)
+    parser.add_argument('--fork', action='store_true',
+                        help='Medir la memoria privada de un worker creado por fork (Linux)')
+    parser.add_argument('--busquedas', type=int, default=300, help='Búsquedas del worker con --fork')
+    parser.add_argument('--recomendaciones', type=int, default=20,
+                        help='Recomendaciones del worker con --fork')
+    args = parser.parse_args()
+
+    if args.modo:
+        # Proceso hijo: una sola medición, resultado en JSON por stdout
+        print(json.dumps(medir_worker(args.ruta, args.modo)))
+        return
+
+    ruta = args.ruta
+    temporal = None
+    if not ruta:
+        temporal = tempfile.NamedTemporaryFile(suffix='.json', delete=False)
+        temporal.close()
+        ruta = temporal.name
+        print(f"Generando catálogo sintético de {args.propiedades} propiedades...")
+        generar_catalogo_sintetico(ruta, args.propiedades)
+
+    try:
+        if args.fork:
+            r = medir_fork(ruta, args.busquedas, args.recomendaciones)
+            print("=" * 60)
+            print(f"WORKER POR FORK ({r['propiedades']} propiedades)")
+            print("=" * 60)
+            print(f"Memoria privada al iniciar: {r['privada_inicial_mb']} MB")
+            print(f"Tras {args.busquedas} búsquedas: {r['privada_busquedas_mb']} MB "
+                  f"({r['busquedas_por_segundo']} búsquedas/s)")
+            print(f"Tras {args.recomendaciones} recomendaciones: {r['privada_recomendaciones_mb']} MB "
+                  f"({r['recomendaciones_por_segundo']} recomendaciones/s)")
+            return
+
+        resultados = []
+        for modo in MODOS:
+            salida = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--ruta', ruta, '--modo', modo],
+                capture_output=True, text=True, check=True
+            )
+            resultados.append(json.loads(salida.stdout.strip().splitlines()[-1]))
+    finally:
+        if temporal:
+            os.unlink(ruta)
+
+    print("=" * 60)
+    print("MEMORIA RESIDENTE POR WORKER")
+    print("=" * 60)
+    for r in resultados:
+        print(f"{r['modo']:>9}: {r['propiedades']} propiedades, "
+              f"catálogo {r['rss_catalogo_mb']} MB RSS / {r['anonima_catalogo_mb']} MB anónima "
+              f"(RSS total {r['rss_final_mb']} MB), "
+              f"carga {r['segundos_carga']} s")
+
+    base = resultados[0]['anonima_catalogo_mb']
+    if base > 0:
+        for r in resultados[1:]:
+            print(f"Reducción {r['modo']} (memoria anónima): "
+                  f"{100 * (1 - r['anonima_catalogo_mb'] / base):.1f}%")
+
+
+if __name__ == "__main__":
+    main()
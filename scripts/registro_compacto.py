@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Registros compactos para las propiedades del catálogo de Citrino.
+
+Cada propiedad del JSON es un anidamiento de diccionarios con muchas cadenas
+repetidas (zona, barrio, sector, fuente, estado_conservacion, ...). Aquí cada
+diccionario se reemplaza por un RegistroCompacto con __slots__: las claves
+viven una sola vez en una FormaRegistro compartida por todos los registros con
+la misma estructura, los valores en una tupla, las listas pasan a tuplas y las
+cadenas cortas se internan.
+
+RegistroCompacto es un Mapping de solo lectura, de modo que el código existente
+que usa prop.get('ubicacion', {}).get('zona') o prop['id'] sigue funcionando.
+
+Los textos largos (descripcion y similares) pueden moverse a un archivo lateral
+con AlmacenTextos: en el registro queda un TextoDiferido con el extracto ya
+calculado y el texto completo se lee del mmap sólo cuando alguien lo pide.
+"""
+
+import json
+import mmap
+import os
+import sys
+import tempfile
+from array import array
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+# Cadenas de hasta este largo se internan (zonas, fuentes, estados, fechas...).
+# Las descripciones largas casi nunca se repiten y no vale la pena internarlas.
+MAX_LARGO_INTERNADO = 64
+
+# Largo del extracto que muestra /api/buscar; los textos más largos se difieren
+LARGO_EXTRACTO = 300
+
+
+class FormaRegistro:
+    """Claves de un registro y su posición; se comparte entre registros iguales."""
+
+    __slots__ = ('claves', 'posiciones')
+
+    def __init__(self, claves: Tuple[str, ...]):
+        self.claves = claves
+        self.posiciones = {clave: i for i, clave in enumerate(claves)}
+
+
+# Formas ya vistas: tupla de claves -> FormaRegistro
+_FORMAS: Dict[Tuple[str, ...], FormaRegistro] = {}
+
+
+def _obtener_forma(claves: Tuple[str, ...]) -> FormaRegistro:
+    forma = _FORMAS.get(claves)
+    if forma is None:
+        forma = _FORMAS.setdefault(claves, FormaRegistro(tuple(sys.intern(c) for c in claves)))
+    return forma
+
+
+class RegistroCompacto(Mapping):
+    """Vista de diccionario de solo lectura sobre una tupla de valores."""
+
+    __slots__ = ('_forma', '_valores')
+
+    def __init__(self, forma: FormaRegistro, valores: Tuple[Any, ...]):
+        self._forma = forma
+        self._valores = valores
+
+    def __getitem__(self, clave: str) -> Any:
+        valor = self._valores[self._forma.posiciones[clave]]
+        if valor.__class__ is TextoDiferido:
+            return valor.cargar()
+        return valor
+
+    def get(self, clave: str, defecto: Any = None) -> Any:
+        posicion = self._forma.posiciones.get(clave)
+        if posicion is None:
+            return defecto
+        valor = self._valores[posicion]
+        if valor.__class__ is TextoDiferido:
+            return valor.cargar()
+        return valor
+
+    def __contains__(self, clave: object) -> bool:
+        return clave in self._forma.posiciones
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._forma.claves)
+
+    def __len__(self) -> int:
+        return len(self._valores)
+
+    def keys(self):
+        return self._forma.claves
+
+    def values(self):
+        return tuple(_resolver(v) for v in self._valores)
+
+    def items(self):
+        return zip(self._forma.claves, self.values())
+
+    def extracto(self, clave: str, largo: int = LARGO_EXTRACTO) -> str:
+        """
+        Retorna el texto truncado a `largo` caracteres (con '...' si se cortó)
+        sin leer el archivo lateral cuando el extracto ya está precalculado.
+        """
+        posicion = self._forma.posiciones.get(clave)
+        valor = '' if posicion is None else self._valores[posicion]
+        if valor.__class__ is TextoDiferido and largo == LARGO_EXTRACTO:
+            return valor.extracto
+        return extraer(_resolver(valor), largo)
+
+    def a_dict(self) -> Dict[str, Any]:
+        """Copia profunda a diccionarios y listas (para json.dump o modificaciones)."""
+        return {clave: _a_nativo(valor) for clave, valor in zip(self._forma.claves, self._valores)}
+
+    def __getstate__(self):
+        # Los textos diferidos viajan completos: el mmap no se puede serializar
+        return self._forma.claves, self.values()
+
+    def __setstate__(self, estado):
+        claves, valores = estado
+        self._forma = _obtener_forma(claves)
+        self._valores = valores
+
+    def __repr__(self) -> str:
+        return f"RegistroCompacto({dict(self.items())!r})"
+
+
+def extraer(texto: Optional[str], largo: int = LARGO_EXTRACTO) -> str:
+    """Trunca un texto a `largo` caracteres agregando '...' si se cortó."""
+    texto = texto or ''
+    return texto[:largo] + '...' if len(texto) > largo else texto
+
+
+def extracto_texto(propiedad: Mapping, clave: str = 'descripcion', largo: int = LARGO_EXTRACTO) -> str:
+    """Extracto de un campo de texto para registros compactos o diccionarios."""
+    if isinstance(propiedad, RegistroCompacto):
+        return propiedad.extracto(clave, largo)
+    return extraer(propiedad.get(clave, ''), largo)
+
+
+class TextoDiferido:
+    """Referencia a un texto guardado en un AlmacenTextos, con su extracto."""
+
+    __slots__ = ('almacen', 'indice', 'extracto')
+
+    def __init__(self, almacen: 'AlmacenTextos', indice: int, extracto: str):
+        self.almacen = almacen
+        self.indice = indice
+        self.extracto = extracto
+
+    def cargar(self) -> str:
+        return self.almacen.obtener(self.indice)
+
+
+class AlmacenTextos:
+    """
+    Archivo lateral con textos UTF-8 concatenados y un índice de offsets.
+
+    Durante la carga los textos se agregan con `agregar`; `finalizar` mapea el
+    archivo en memoria (mmap) y a partir de ahí se leen con `obtener`. El
+    archivo temporal se desvincula apenas se mapea, así que el sistema
+    operativo lo libera al terminar el proceso.
+    """
+
+    def __init__(self, directorio: Optional[str] = None):
+        descriptor, self._ruta = tempfile.mkstemp(prefix='citrino_textos_', suffix='.bin', dir=directorio)
+        self._archivo = os.fdopen(descriptor, 'wb')
+        self._offsets = array('q', [0])
+        self.offsets = None
+        self._mmap = None
+
+    def agregar(self, texto: str) -> int:
+        """Escribe un texto al final del archivo y retorna su índice."""
+        datos = texto.encode('utf-8')
+        self._archivo.write(datos)
+        self._offsets.append(self._offsets[-1] + len(datos))
+        return len(self._offsets) - 2
+
+    def finalizar(self) -> 'AlmacenTextos':
+        """Cierra la escritura y mapea el archivo para lectura."""
+        if self._archivo is None:
+            return self
+        self._archivo.close()
+        self._archivo = None
+        self.offsets = np.array(self._offsets, dtype=np.int64)
+        self._offsets = None
+        if self.bytes_totales:
+            with open(self._ruta, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            os.unlink(self._ruta)
+        except OSError:
+            # Windows no permite borrar un archivo mapeado; queda en el temporal
+            pass
+        return self
+
+    @property
+    def bytes_totales(self) -> int:
+        offsets = self._offsets if self.offsets is None else self.offsets
+        return int(offsets[-1])
+
+    def __len__(self) -> int:
+        offsets = self._offsets if self.offsets is None else self.offsets
+        return len(offsets) - 1
+
+    def obtener(self, indice: int) -> str:
+        if self.offsets is None:
+            raise RuntimeError("AlmacenTextos.obtener antes de finalizar la carga")
+        inicio, fin = int(self.offsets[indice]), int(self.offsets[indice + 1])
+        if inicio == fin:
+            return ''
+        return self._mmap[inicio:fin].decode('utf-8')
+
+
+def _resolver(valor: Any) -> Any:
+    return valor.cargar() if valor.__class__ is TextoDiferido else valor
+
+
+def _a_nativo(valor: Any) -> Any:
+    if valor.__class__ is TextoDiferido:
+        return valor.cargar()
+    if isinstance(valor, RegistroCompacto):
+        return valor.a_dict()
+    if isinstance(valor, tuple):
+        return [_a_nativo(v) for v in valor]
+    return valor
+
+
+def _compactar_valor(valor: Any, almacen: Optional[AlmacenTextos] = None) -> Any:
+    if isinstance(valor, str):
+        if len(valor) <= MAX_LARGO_INTERNADO:
+            return sys.intern(valor)
+        if almacen is not None and len(valor) > LARGO_EXTRACTO:
+            return TextoDiferido(almacen, almacen.agregar(valor), extraer(valor))
+        return valor
+    if isinstance(valor, list):
+        return tuple(_compactar_valor(v, almacen) for v in valor)
+    if isinstance(valor, dict):
+        return _registro_desde_dict(valor, almacen)
+    return valor
+
+
+def _registro_desde_dict(datos: Dict[str, Any], almacen: Optional[AlmacenTextos] = None) -> RegistroCompacto:
+    # Con object_hook los diccionarios internos ya llegan compactados
+    return RegistroCompacto(
+        _obtener_forma(tuple(datos)),
+        tuple(_compactar_valor(v, almacen) for v in datos.values())
+    )
+
+
+def compactar(valor: Any) -> Any:
+    """Convierte recursivamente diccionarios y listas a registros compactos."""
+    if isinstance(valor, RegistroCompacto):
+        return valor
+    return _compactar_valor(valor)
+
+
+def a_json(valor: Any) -> Any:
+    """Función `default` para json.dump con registros compactos."""
+    if isinstance(valor, RegistroCompacto):
+        return valor.a_dict()
+    raise TypeError(f"Object of type {type(valor).__name__} is not JSON serializable")
+
+
+def cargar_json_compacto(ruta: str, almacen: Optional[AlmacenTextos] = None) -> Any:
+    """
+    Carga un archivo JSON compactando cada objeto apenas se decodifica, sin
+    materializar antes el árbol completo de diccionarios.
+
+    Si se indica un AlmacenTextos, los textos más largos que el extracto se
+    escriben ahí en el momento de decodificarlos y nunca quedan residentes;
+    el almacén se finaliza antes de retornar.
+    """
+    with open(ruta, 'r', encoding='utf-8') as f:
+        datos = json.load(f, object_hook=lambda objeto: _registro_desde_dict(objeto, almacen))
+    if almacen is not None:
+        almacen.finalizar()
+    return datos
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Reproduce las solicitudes del log de solicitudes lentas del API contra un
+catálogo local, con perfilado.
+
+Cada registro se ejecuta con el cliente de pruebas de Flask sobre la misma
+aplicación del servidor: primero --repeticiones veces sin perfilar para medir
+la latencia local y después una vez bajo cProfile, dejando el .pstats en
+--salida. Así un pico de latencia de producción se convierte en un
+benchmark reproducible.
+
+Esas ejecuciones encuentran los caches ya llenos por las anteriores. Con
+--en-frio se vacían los caches del catálogo antes de medir y perfilar la
+primera ejecución, que es la que suele haber sido lenta en producción; las
+repeticiones quedan como referencia en caliente.
+
+Uso:
+    python scripts/reproducir_solicitudes_lentas.py logs/solicitudes_lentas.jsonl
+    python scripts/reproducir_solicitudes_lentas.py logs/solicitudes_lentas.jsonl* \\
+        --base-datos data/bd_final/propiedades_limpias.json --repeticiones 5
+    python scripts/reproducir_solicitudes_lentas.py logs/solicitudes_lentas.jsonl --en-frio
+"""
+
+import argparse
+import json
+import os
+import secrets
+import statistics
+import sys
+import time
+
+DIRECTORIO_RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(DIRECTORIO_RAIZ, 'api'))
+
+# Rutas que el API acepta como POST con cuerpo JSON
+RUTAS_REPRODUCIBLES = ('/api/buscar', '/api/recomendar', '/api/recomendar-mejorado')
+
+
+def preparar_servidor(ruta_base_datos, ruta_guia_urbana, directorio_perfiles):
+    """Carga el catálogo local en la aplicación del API y habilita el perfilado."""
+    import server
+    from perfilado import Perfilador
+
+    # Las solicitudes reproducidas no deben volver a escribirse en el log
+    server.registro_lentas.umbral_segundos = 0
+    server.ADMIN_TOKEN = secrets.token_hex(16)
+    server.perfilador = Perfilador(directorio_perfiles)
+    if not server.inicializar_datos(ruta_base_datos, ruta_guia_urbana):
+        raise RuntimeError(f"No se pudo cargar el catálogo: {server.estado_carga['error']}")
+    server.app.config['TESTING'] = True
+    return server
+
+
+def vaciar_caches(server):
+    """Deja el catálogo como recién cargado: sin resultados, puntajes ni fragmentos en cache."""
+    from fragmentos import FragmentosPropiedades
+
+    catalogo = server.gestor_catalogo.catalogo
+    catalogo.sistema.limpiar_cache_resultados()
+    catalogo.motor_recomendacion.limpiar_cache_completo()
+    catalogo.motor_mejorado._limpiar_cache()
+    catalogo.fragmentos = FragmentosPropiedades()
+    catalogo.respuestas.clear()
+
+
+def reproducir(server, registro, repeticiones, en_frio=False):
+    """
+    Ejecuta una solicitud registrada; retorna tiempos locales y el resumen del
+    perfil. Con en_frio la primera ejecución y la perfilada parten con los
+    caches vacíos.
+    """
+    cliente = server.app.test_client()
+    ruta = registro['ruta']
+    payload = registro.get('payload') or {}
+    parametros = registro.get('parametros') or {}
+    cabeceras_perfil = {'X-Admin-Token': server.ADMIN_TOKEN, 'X-Perfilar': '1'}
+
+    tiempo_frio = None
+    if en_frio:
+        vaciar_caches(server)
+        inicio = time.perf_counter()
+        cliente.post(ruta, json=payload, query_string=parametros)
+        tiempo_frio = time.perf_counter() - inicio
+        # El perfil también en frío: la ejecución anterior volvió a llenar los caches
+        vaciar_caches(server)
+        perfilada = cliente.post(ruta, json=payload, query_string=parametros, headers=cabeceras_perfil)
+
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        respuesta = cliente.post(ruta, json=payload, query_string=parametros)
+        tiempos.append(time.perf_counter() - inicio)
+
+    if not en_frio:
+        perfilada = cliente.post(ruta, json=payload, query_string=parametros, headers=cabeceras_perfil)
+    datos = perfilada.get_json(silent=True) or {}
+    return {
+        'codigo': perfilada.status_code,
+        'tiempo_frio': tiempo_frio,
+        'tiempos': tiempos,
+        'perfilado': datos.get('perfilado')
+    }
+
+
+def consulta_local(server, registro):
+    """Consulta que arma este código para el cuerpo registrado, para compararla con la del log."""
+    from catalogo import filtros_desde_solicitud
+
+    payload = registro.get('payload') or {}
+    if registro['ruta'] != '/api/buscar' or not isinstance(payload, dict):
+        return None
+    return server.gestor_catalogo.catalogo.sistema.normalizar_filtros(filtros_desde_solicitud(payload))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reproduce solicitudes lentas del API con perfilado')
+    parser.add_argument('archivos', nargs='+', help='Archivos JSONL del log (vigente y respaldos)')
+    parser.add_argument('--base-datos', help='JSON de propiedades (por defecto, el del registro)')
+    parser.add_argument('--guia-urbana', default=os.path.join(DIRECTORIO_RAIZ, 'data',
+                                                              'guia_urbana_municipal_completa.json'))
+    parser.add_argument('--repeticiones', type=int, default=3,
+                        help='Ejecuciones sin perfilar por solicitud')
+    parser.add_argument('--en-frio', action='store_true',
+                        help='Medir y perfilar la primera ejecución con los caches vacíos')
+    parser.add_argument('--salida', default='perfiles_reproduccion',
+                        help='Directorio para los archivos .pstats')
+    parser.add_argument('--limite', type=int, help='Máximo de solicitudes a reproducir')
+    parser.add_argument('--top', type=int, default=8, help='Funciones a mostrar por perfil')
+    args = parser.parse_args()
+
+    from solicitudes_lentas import leer_registros
+
+    registros = [r for r in leer_registros(args.archivos) if r.get('ruta') in RUTAS_REPRODUCIBLES]
+    if args.limite:
+        registros = registros[:args.limite]
+    if not registros:
+        print("No hay solicitudes reproducibles en los archivos indicados")
+        return
+
+    ruta_base_datos = args.base_datos or registros[0]['catalogo']['ruta']
+    print(f"Cargando catálogo {ruta_base_datos}...")
+    server = preparar_servidor(ruta_base_datos, args.guia_urbana, args.salida)
+
+    version_local = server.gestor_catalogo.catalogo.version
+    for i, registro in enumerate(registros, 1):
+        catalogo = registro.get('catalogo', {})
+        print("=" * 70)
+        print(f"[{i}/{len(registros)}] {registro['ruta']} ({registro.get('marca', '')}) "
+              f"original {registro['duracion_segundos'] * 1000:.1f} ms")
+        if catalogo.get('version') is not None and catalogo['version'] != version_local:
+            print("  Advertencia: el catálogo local no tiene los mismos datos que en producción")
+        consulta = registro.get('consulta') or {}
+        if consulta.get('filtros') is not None:
+            print(f"  Filtros normalizados: {consulta['filtros']}")
+            local = consulta_local(server, registro)
+            if local is not None and json.loads(json.dumps(local)) != consulta['filtros']:
+                print(f"  Advertencia: localmente los filtros se normalizan distinto: {local}")
+        if registro.get('etapas'):
+            etapas = ', '.join(f"{etapa} {segundos * 1000:.1f} ms"
+                               for etapa, segundos in sorted(registro['etapas'].items()))
+            print(f"  Etapas originales: {etapas}")
+
+        resultado = reproducir(server, registro, args.repeticiones, args.en_frio)
+        if resultado['tiempo_frio'] is not None:
+            print(f"  Local en frío: {resultado['tiempo_frio'] * 1000:.1f} ms")
+        if resultado['tiempos']:
+            print(f"  Local: mediana {statistics.median(resultado['tiempos']) * 1000:.1f} ms, "
+                  f"máximo {max(resultado['tiempos']) * 1000:.1f} ms "
+                  f"({len(resultado['tiempos'])} ejecuciones, código {resultado['codigo']})")
+
+        perfilado = resultado['perfilado']
+        if not perfilado:
+            print(f"  Sin perfil (código {resultado['codigo']})")
+            continue
+        print(f"  Perfil: {perfilado['archivo']}")
+        for fila in perfilado['top_funciones'][:args.top]:
+            print(f"    {fila['tiempo_acumulado'] * 1000:9.2f} ms  {fila['llamadas']:>8}  {fila['funcion']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,20 +4,66 @@ Sistema de consulta y análisis para la base de datos integrada de Citrino.
 """
 
 import json
+import heapq
+import base64
+import bisect
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
 import os
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Dict, List, Any, Optional, Tuple, Callable, Union
 from datetime import datetime
 import logging
 
+from indice_texto import IndiceTextoInvertido
+from registro_compacto import cargar_json_compacto, a_json, extracto_texto, AlmacenTextos
+
 # Configuración de logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Criterios de ordenamiento con permutación precalculada
+CRITERIOS_ORDEN = ('precio', 'superficie', 'precio_m2', 'fecha')
+
+# Columnas numéricas extraídas de caracteristicas_principales
+CAMPOS_NUMERICOS = {
+    'precio': 'precio',
+    'superficie': 'superficie_m2',
+    'habitaciones': 'habitaciones',
+    'banos': 'banos_completos'
+}
+
+# Campos de fecha en orden de preferencia según la fuente de los datos
+CAMPOS_FECHA = ('fecha_registro', 'fecha_integracion', 'fecha_incorporacion')
+
+# Filtros numéricos soportados por buscar_por_filtros
+FILTROS_NUMERICOS = ('precio_min', 'precio_max', 'superficie_min', 'superficie_max',
+                     'habitaciones_min', 'banos_min')
+
+# Memoria máxima por defecto del cache de resultados (ids de filas)
+MAX_BYTES_CACHE_RESULTADOS = 32 * 1024 * 1024
+
+# Búsquedas paginadas cuyos ids se conservan aunque el cache de resultados
+# los desaloje o no los admita por tamaño, para que las páginas siguientes
+# no vuelvan a recorrer el catálogo
+MAX_PAGINACIONES_ABIERTAS = 16
+
+
+def _a_numero(valor: Any) -> float:
+    """Convierte un valor a float; los valores inválidos quedan como NaN."""
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return float('nan')
+
+
 class SistemaConsultaCitrino:
     """Sistema de consulta y análisis para la base de datos de Citrino."""
 
-    def __init__(self):
+    def __init__(self, max_bytes_cache: int = MAX_BYTES_CACHE_RESULTADOS):
         self.propiedades = []
         self.indices = {
             'zona': {},
@@ -26,17 +72,106 @@ class SistemaConsultaCitrino:
             'fuente': {}
         }
         self.estadisticas_globales = {}
-
-    def cargar_base_datos(self, ruta: str = 'data/bd_final/propiedades_limpias.json') -> None:
-        """Carga la base de datos integrada."""
+        # Índice invertido sobre nombre y descripción
+        self.indice_texto = IndiceTextoInvertido()
+        # Archivo lateral con los textos largos de las propiedades (si se difirieron)
+        self.almacen_textos = None
+        # Versión del catálogo: se incrementa con cada carga o actualización
+        self.version_catalogo = 0
+        # Columnas numéricas/categóricas por fila para filtrado vectorizado
+        self.columnas = {}
+        self._categorias = {'zona': [], 'fuente': []}
+        # Permutaciones de filas ordenadas ascendentemente por criterio
+        self.ordenamientos = {}
+        # Posición de cada fila en su permutación (se calcula al paginar)
+        self._rangos = {}
+        # Cache LRU de resultados: filtros normalizados -> ids de filas ordenados
+        self.max_bytes_cache = max_bytes_cache
+        self._cache_resultados = OrderedDict()
+        self._cache_bytes = 0
+        self._cache_lock = threading.Lock()
+        self._cache_stats = {'hits': 0, 'misses': 0, 'evicciones': 0}
+        # Ids de las últimas búsquedas con página siguiente (LRU por cantidad)
+        self._paginaciones = OrderedDict()
+
+    def cargar_base_datos(self, ruta: str = 'data/bd_final/propiedades_limpias.json',
+                          compacto: bool = True, diferir_textos_largos: bool = True) -> None:
+        """
+        Carga la base de datos integrada.
+
+        Con compacto=True cada propiedad queda como RegistroCompacto (vista de
+        diccionario de solo lectura, con cadenas internadas); con False se
+        conservan los diccionarios tal como los entrega json.load.
+
+        Con diferir_textos_largos=True (sólo en modo compacto) la descripción y
+        demás textos de más de 300 caracteres se escriben durante la carga en un
+        archivo lateral mapeado en memoria; en el registro queda el extracto
+        que usa el API y el texto completo se lee sólo cuando se pide.
+        """
         logger.info(f"Cargando base de datos desde {ruta}...")
 
-        with open(ruta, 'r', encoding='utf-8') as f:
-            self.propiedades = json.load(f)
+        almacen = None
+        if compacto:
+            almacen = AlmacenTextos() if diferir_textos_largos else None
+            propiedades = cargar_json_compacto(ruta, almacen)
+        else:
+            with open(ruta, 'r', encoding='utf-8') as f:
+                propiedades = json.load(f)
+
+        self.cargar_propiedades(propiedades)
+
+        if almacen is not None:
+            self.almacen_textos = almacen
+            logger.info(f"Textos diferidos: {len(almacen)} "
+                        f"({almacen.bytes_totales / 1024:.0f} KB en archivo lateral)")
+
+    def cargar_propiedades(self, propiedades: List[Dict[str, Any]]) -> None:
+        """Reemplaza el catálogo completo y reconstruye índices y ordenamientos."""
+        self.propiedades = propiedades
+        self.almacen_textos = None
+        self.version_catalogo += 1
+        self.limpiar_cache_resultados()
 
         logger.info(f"Cargadas {len(self.propiedades)} propiedades")
         self.crear_indices()
+        self.crear_columnas()
+        self.crear_ordenamientos()
+        self.crear_indice_texto()
+        self.calcular_estadisticas_globales()
+
+    def agregar_propiedades(self, nuevas: List[Dict[str, Any]]) -> None:
+        """
+        Agrega propiedades al catálogo manteniendo sincronizados índices y
+        ordenamientos sin reordenar las filas existentes.
+        """
+        if not nuevas:
+            return
+
+        # Nueva lista para no alterar la que comparten los motores de recomendación
+        inicio = len(self.propiedades)
+        self.propiedades = self.propiedades + list(nuevas)
+        self.version_catalogo += 1
+        self.limpiar_cache_resultados()
+
+        for fila, prop in enumerate(nuevas, inicio):
+            self._indexar_propiedad(prop)
+            self.indice_texto.agregar_documento(fila, prop.get('nombre') or '', prop.get('descripcion') or '')
+
+        nuevas_columnas = self._extraer_columnas(nuevas)
+        for nombre, valores in nuevas_columnas.items():
+            self.columnas[nombre] = np.concatenate([self.columnas[nombre], valores])
+
+        # Intercalar las filas nuevas en cada permutación existente
+        ids_nuevos = np.arange(inicio, len(self.propiedades), dtype=np.int32)
+        for criterio, permutacion in self.ordenamientos.items():
+            claves = self.columnas[criterio]
+            orden_nuevos = ids_nuevos[np.argsort(claves[ids_nuevos], kind='stable')]
+            posiciones = np.searchsorted(claves[permutacion], claves[orden_nuevos], side='right')
+            self.ordenamientos[criterio] = np.insert(permutacion, posiciones, orden_nuevos)
+        self._rangos = {}
+
         self.calcular_estadisticas_globales()
+        logger.info(f"Agregadas {len(nuevas)} propiedades (total: {len(self.propiedades)})")
 
     def crear_indices(self) -> None:
         """Crea índices para búsqueda rápida."""
@@ -51,42 +186,176 @@ class SistemaConsultaCitrino:
         }
 
         for prop in self.propiedades:
-            # Índice por zona
-            zona = prop.get('ubicacion', {}).get('zona', 'Otra')
-            if zona not in self.indices['zona']:
-                self.indices['zona'][zona] = []
-            self.indices['zona'][zona].append(prop)
-
-            # Índice por precio
-            precio = prop.get('caracteristicas_principales', {}).get('precio', 0)
-            rango_precio = self.clasificar_rango_precio(precio)
-            if rango_precio not in self.indices['precio']:
-                self.indices['precio'][rango_precio] = []
-            self.indices['precio'][rango_precio].append(prop)
-
-            # Índice por tipo
-            nombre = prop.get('nombre', '').lower()
-            if 'departamento' in nombre or 'depto' in nombre:
-                tipo = 'Departamento'
-            elif 'casa' in nombre:
-                tipo = 'Casa'
-            elif 'townhouse' in nombre:
-                tipo = 'Townhouse'
-            else:
-                tipo = 'Otro'
-
-            if tipo not in self.indices['tipo']:
-                self.indices['tipo'][tipo] = []
-            self.indices['tipo'][tipo].append(prop)
-
-            # Índice por fuente
-            fuente = prop.get('fuente', '')
-            if fuente not in self.indices['fuente']:
-                self.indices['fuente'][fuente] = []
-            self.indices['fuente'][fuente].append(prop)
+            self._indexar_propiedad(prop)
 
         logger.info("Índices creados exitosamente")
 
+    def precalentar(self) -> None:
+        """
+        Calcula por adelantado lo que las primeras consultas harían de forma
+        perezosa: posiciones para paginar por cada criterio y el resultado sin
+        filtros en el cache.
+        """
+        for criterio in self.ordenamientos:
+            self._clave_posicion(criterio, False)
+            self.buscar_ids_por_filtros({}, ordenar_por=criterio)
+        self.buscar_ids_por_filtros({})
+        logger.info(f"Sistema precalentado (versión {self.version_catalogo})")
+
+    def preparar_memoria_compartida(self) -> None:
+        """
+        Deja las estructuras calientes listas para compartirse entre procesos
+        por copy-on-write: arreglos contiguos y de solo lectura (una escritura
+        accidental copiaría la página en el worker) y rangos ya calculados.
+        Debe llamarse en el proceso maestro, después de precalentar.
+
+        Cubre lo que usan las búsquedas. Los registros de las propiedades son
+        objetos de Python: quien los recorre (los motores de recomendación)
+        actualiza sus contadores de referencias y copia sus páginas.
+        """
+        def _fijar(arreglo: np.ndarray) -> np.ndarray:
+            arreglo = np.ascontiguousarray(arreglo)
+            arreglo.setflags(write=False)
+            return arreglo
+
+        self.columnas = {nombre: _fijar(valores) for nombre, valores in self.columnas.items()}
+        self.ordenamientos = {criterio: _fijar(perm) for criterio, perm in self.ordenamientos.items()}
+        for criterio in self.ordenamientos:
+            self._clave_posicion(criterio, False)
+        self._rangos = {criterio: _fijar(rango) for criterio, rango in self._rangos.items()}
+
+    def _indexar_propiedad(self, prop: Dict[str, Any]) -> None:
+        """Agrega una propiedad a los índices por zona, precio, tipo y fuente."""
+        # Índice por zona
+        zona = prop.get('ubicacion', {}).get('zona', 'Otra')
+        if zona not in self.indices['zona']:
+            self.indices['zona'][zona] = []
+        self.indices['zona'][zona].append(prop)
+
+        # Índice por precio
+        precio = prop.get('caracteristicas_principales', {}).get('precio', 0)
+        rango_precio = self.clasificar_rango_precio(precio)
+        if rango_precio not in self.indices['precio']:
+            self.indices['precio'][rango_precio] = []
+        self.indices['precio'][rango_precio].append(prop)
+
+        # Índice por tipo
+        nombre = prop.get('nombre', '').lower()
+        if 'departamento' in nombre or 'depto' in nombre:
+            tipo = 'Departamento'
+        elif 'casa' in nombre:
+            tipo = 'Casa'
+        elif 'townhouse' in nombre:
+            tipo = 'Townhouse'
+        else:
+            tipo = 'Otro'
+
+        if tipo not in self.indices['tipo']:
+            self.indices['tipo'][tipo] = []
+        self.indices['tipo'][tipo].append(prop)
+
+        # Índice por fuente
+        fuente = prop.get('fuente', '')
+        if fuente not in self.indices['fuente']:
+            self.indices['fuente'][fuente] = []
+        self.indices['fuente'][fuente].append(prop)
+
+    def crear_indice_texto(self) -> None:
+        """Construye el índice invertido de texto sobre nombre y descripción."""
+        logger.info("Creando índice de texto...")
+        self.indice_texto = IndiceTextoInvertido()
+        self.indice_texto.agregar_documentos(
+            (fila, prop.get('nombre') or '', prop.get('descripcion') or '')
+            for fila, prop in enumerate(self.propiedades)
+        )
+        logger.info(f"Índice de texto creado: {len(self.indice_texto.postings)} términos")
+
+    def crear_columnas(self) -> None:
+        """Extrae columnas numéricas y categóricas para filtrado y ordenamiento vectorizado."""
+        self._categorias = {'zona': [], 'fuente': []}
+        self.columnas = self._extraer_columnas(self.propiedades)
+
+    def _extraer_columnas(self, propiedades: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+        """Construye los arreglos por columna para una lista de propiedades."""
+        valores = {nombre: [] for nombre in CAMPOS_NUMERICOS}
+        garaje, fechas = [], []
+        codigos = {'zona': [], 'fuente': []}
+        posiciones = {campo: {v: i for i, v in enumerate(cats)} for campo, cats in self._categorias.items()}
+
+        for prop in propiedades:
+            caract = prop.get('caracteristicas_principales', {})
+            for nombre, campo in CAMPOS_NUMERICOS.items():
+                valores[nombre].append(_a_numero(caract.get(campo, 0)))
+            garaje.append(bool(caract.get('cochera_garaje', False)))
+            fechas.append(next((str(prop[c]) for c in CAMPOS_FECHA if prop.get(c)), ''))
+
+            categoricos = {
+                'zona': prop.get('ubicacion', {}).get('zona', '') or '',
+                'fuente': prop.get('fuente', '') or ''
+            }
+            for campo, valor in categoricos.items():
+                if valor not in posiciones[campo]:
+                    posiciones[campo][valor] = len(self._categorias[campo])
+                    self._categorias[campo].append(valor)
+                codigos[campo].append(posiciones[campo][valor])
+
+        columnas = {nombre: np.array(lista, dtype=np.float64) for nombre, lista in valores.items()}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            columnas['precio_m2'] = np.where(columnas['superficie'] > 0,
+                                             columnas['precio'] / columnas['superficie'], 0.0)
+        columnas['fecha'] = np.array(fechas, dtype=str)
+        columnas['garaje'] = np.array(garaje, dtype=bool)
+        for campo, lista in codigos.items():
+            columnas[campo] = np.array(lista, dtype=np.int32)
+        return columnas
+
+    def crear_ordenamientos(self) -> None:
+        """Precalcula las permutaciones de filas para los criterios de ordenamiento comunes."""
+        self.ordenamientos = {
+            criterio: np.argsort(self.columnas[criterio], kind='stable').astype(np.int32)
+            for criterio in CRITERIOS_ORDEN
+        }
+        self._rangos = {}
+
+    def _permutacion(self, criterio: str, descendente: bool = False) -> np.ndarray:
+        """Retorna la permutación del criterio; los valores inválidos (NaN) siempre van al final."""
+        permutacion = self.ordenamientos[criterio]
+        if not descendente:
+            return permutacion
+
+        columna = self.columnas[criterio]
+        nulos = int(np.count_nonzero(np.isnan(columna))) if columna.dtype.kind == 'f' else 0
+        validos = len(permutacion) - nulos
+        if not nulos:
+            return permutacion[::-1]
+        return np.concatenate([permutacion[:validos][::-1], permutacion[validos:]])
+
+    def ordenar_ids(self, ids: np.ndarray, ordenar_por: Optional[str] = None,
+                    descendente: bool = False) -> np.ndarray:
+        """
+        Ordena un conjunto de filas usando la permutación precalculada del criterio.
+
+        Args:
+            ids: Índices de filas a ordenar (en cualquier orden)
+            ordenar_por: Criterio de CRITERIOS_ORDEN o None para orden del archivo
+            descendente: Invierte el orden
+
+        Returns:
+            Índices de filas ordenados
+        """
+        if not ordenar_por:
+            return ids[::-1] if descendente else ids
+        if ordenar_por not in self.ordenamientos:
+            raise ValueError(f"Criterio de ordenamiento no soportado: {ordenar_por}")
+
+        permutacion = self._permutacion(ordenar_por, descendente)
+        if len(ids) == len(self.propiedades):
+            return permutacion
+
+        seleccion = np.zeros(len(self.propiedades), dtype=bool)
+        seleccion[ids] = True
+        return permutacion[seleccion[permutacion]]
+
     def clasificar_rango_precio(self, precio: float) -> str:
         """Clasifica el precio en rangos."""
         if precio < 50000:
@@ -120,15 +389,336 @@ class SistemaConsultaCitrino:
             'total_tipos': len(self.indices['tipo'])
         }
 
-    def buscar_por_filtros(self, filtros: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Busca propiedades según filtros especificados."""
-        resultados = []
+    def buscar_por_filtros(self, filtros: Dict[str, Any], ordenar_por: Optional[str] = None,
+                           descendente: bool = False, texto: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Busca propiedades según filtros especificados, opcionalmente ordenadas."""
+        ids = self.buscar_ids_por_filtros(filtros, ordenar_por, descendente, texto)
+        return [self.propiedades[i] for i in ids]
+
+    def buscar_texto(self, texto: str, filtros: Optional[Dict[str, Any]] = None,
+                     limite: int = 20) -> List[Dict[str, Any]]:
+        """
+        Busca propiedades por palabras en nombre y descripción.
+
+        Args:
+            texto: Palabras a buscar ("piscina amoblado", "vista al parque")
+            filtros: Filtros estructurados opcionales (mismo formato que buscar_por_filtros)
+            limite: Número máximo de resultados
+
+        Returns:
+            Lista de {'propiedad', 'relevancia'} ordenada por puntaje BM25
+        """
+        permitidos = self._mascara_filtros(self.normalizar_filtros(filtros)) if filtros else None
+        ids, puntajes = self.indice_texto.buscar(texto, permitidos)
+        return [
+            {'propiedad': self.propiedades[i], 'relevancia': round(float(p), 4)}
+            for i, p in zip(ids[:limite], puntajes[:limite])
+        ]
+
+    def buscar_ids_por_filtros(self, filtros: Dict[str, Any], ordenar_por: Optional[str] = None,
+                               descendente: bool = False, texto: Optional[str] = None) -> np.ndarray:
+        """
+        Retorna los índices de filas que cumplen los filtros.
+
+        Aplica los mismos criterios que cumple_filtros sobre las columnas
+        precalculadas y ordena con la permutación del criterio indicado.
+        Si se indica texto, solo quedan las filas que contienen algún término
+        y, sin criterio de orden, se ordenan por relevancia.
+        El resultado se guarda en el cache de resultados, indexado por la
+        forma normalizada de los filtros y la versión del catálogo; el
+        arreglo retornado es de solo lectura.
+        """
+        normalizados = self.normalizar_filtros(filtros)
+        terminos = ' '.join(self.indice_texto.terminos_consulta(texto)) if texto else None
+        clave = self._clave_busqueda(normalizados, terminos, ordenar_por, descendente)
+
+        with self._cache_lock:
+            ids = self._cache_resultados.get(clave)
+            if ids is not None:
+                self._cache_resultados.move_to_end(clave)
+                self._cache_stats['hits'] += 1
+                return ids
+            ids = self._paginaciones.get(clave)
+            if ids is not None:
+                self._paginaciones.move_to_end(clave)
+                self._cache_stats['hits'] += 1
+                return ids
+            self._cache_stats['misses'] += 1
+
+        mascara = self._mascara_filtros(normalizados)
+        if terminos is not None:
+            ids, _ = self.indice_texto.buscar(terminos, mascara)
+            if ordenar_por:
+                ids = self.ordenar_ids(ids, ordenar_por, descendente)
+            elif descendente:
+                ids = ids[::-1]
+        else:
+            ids = np.flatnonzero(mascara).astype(np.int32)
+            ids = self.ordenar_ids(ids, ordenar_por, descendente)
+        ids = np.ascontiguousarray(ids)
+        ids.setflags(write=False)
+        self._guardar_en_cache(clave, ids)
+        return ids
+
+    def normalizar_filtros(self, filtros: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Retorna la forma canónica de un diccionario de filtros.
+
+        Descarta los filtros que buscar_por_filtros ignora, pasa textos a
+        minúsculas, ordena las listas de zonas y convierte los límites a
+        float, de modo que búsquedas equivalentes compartan la misma clave.
+        Los límites que no son números ("abc", listas) se descartan.
+        """
+        normalizados = {}
+
+        zona = filtros.get('zona')
+        if isinstance(zona, str):
+            normalizados['zona'] = zona.strip().lower()
+        elif isinstance(zona, list):
+            # Los elementos que no son texto no coinciden con ninguna zona
+            normalizados['zona'] = sorted({z.strip().lower() for z in zona if isinstance(z, str)})
+
+        if isinstance(filtros.get('fuente'), str):
+            normalizados['fuente'] = filtros['fuente'].strip().lower()
+
+        for campo in FILTROS_NUMERICOS:
+            if campo in filtros:
+                try:
+                    valor = float(filtros[campo])
+                except (TypeError, ValueError):
+                    logger.warning(f"Filtro {campo} ignorado: {filtros[campo]!r} no es un número")
+                    continue
+                # NaN no es comparable con ningún precio: se ignora igual que un texto
+                if valor == valor:
+                    normalizados[campo] = valor
+
+        if 'tiene_garaje' in filtros:
+            normalizados['tiene_garaje'] = bool(filtros['tiene_garaje'])
+
+        return normalizados
+
+    def _clave_busqueda(self, normalizados: Dict[str, Any], terminos: Optional[str],
+                        ordenar_por: Optional[str], descendente: bool) -> Tuple:
+        """Clave del cache de resultados para una búsqueda ya normalizada."""
+        return (self.version_catalogo, self._clave_filtros(normalizados, terminos),
+                ordenar_por or '', bool(descendente))
+
+    @staticmethod
+    def _clave_filtros(normalizados: Dict[str, Any], terminos: Optional[str] = None) -> str:
+        """Serializa filtros normalizados (y términos de texto) de forma determinista."""
+        if terminos is not None:
+            normalizados = dict(normalizados, _texto=terminos)
+        return json.dumps(normalizados, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+
+    def _guardar_en_cache(self, clave: Tuple, ids: np.ndarray) -> None:
+        """Guarda un resultado respetando el límite de memoria (desaloja los menos usados)."""
+        tamano = ids.nbytes + sys.getsizeof(clave[1])
+        if tamano > self.max_bytes_cache:
+            return
+
+        with self._cache_lock:
+            if clave[0] != self.version_catalogo or clave in self._cache_resultados:
+                return
+            self._cache_resultados[clave] = ids
+            self._cache_bytes += tamano
+            while self._cache_bytes > self.max_bytes_cache:
+                clave_antigua, ids_antiguos = self._cache_resultados.popitem(last=False)
+                self._cache_bytes -= ids_antiguos.nbytes + sys.getsizeof(clave_antigua[1])
+                self._cache_stats['evicciones'] += 1
+
+    def limpiar_cache_resultados(self) -> None:
+        """Vacía el cache de resultados (se invoca al cambiar la versión del catálogo)."""
+        with self._cache_lock:
+            self._cache_resultados.clear()
+            self._paginaciones.clear()
+            self._cache_bytes = 0
+
+    def estadisticas_cache(self) -> Dict[str, Any]:
+        """Retorna tasa de aciertos, entradas y memoria del cache de resultados."""
+        with self._cache_lock:
+            consultas = self._cache_stats['hits'] + self._cache_stats['misses']
+            return {
+                'hits': self._cache_stats['hits'],
+                'misses': self._cache_stats['misses'],
+                'evicciones': self._cache_stats['evicciones'],
+                'hit_rate': self._cache_stats['hits'] / consultas if consultas else 0.0,
+                'entradas': len(self._cache_resultados),
+                'bytes': self._cache_bytes,
+                'max_bytes': self.max_bytes_cache,
+                'version_catalogo': self.version_catalogo
+            }
+
+    def buscar_pagina(self, filtros: Dict[str, Any], ordenar_por: Optional[str] = None,
+                      descendente: bool = False, limite: int = 20,
+                      cursor: Optional[str] = None, texto: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Retorna una página de resultados con paginación por cursor.
+
+        El cursor es opaco para el cliente y codifica la versión del catálogo,
+        el criterio de orden, la firma de los filtros y la última fila entregada.
+        La página siguiente se ubica con búsqueda binaria sobre el orden de la
+        permutación, por lo que cuesta O(limite + log n) sobre la lista de ids.
+        En búsquedas de texto ordenadas por relevancia el cursor guarda además
+        la posición, ya que ese orden no tiene permutación precalculada.
+
+        Los ids de la búsqueda se calculan una vez (O(n)) en la primera página.
+        Mientras haya página siguiente quedan además entre las últimas
+        MAX_PAGINACIONES_ABIERTAS búsquedas paginadas, aunque el cache de
+        resultados los desaloje o no los admita por tamaño; solo una búsqueda
+        que salió de ambos vuelve a recorrer el catálogo al pedir otra página.
+
+        Args:
+            filtros: Filtros de búsqueda (mismo formato que buscar_por_filtros)
+            ordenar_por: Criterio de CRITERIOS_ORDEN o None para orden del archivo
+            descendente: Invierte el orden
+            limite: Tamaño de página
+            cursor: Cursor retornado por la página anterior, o None para la primera
+            texto: Palabras a buscar en nombre y descripción (opcional)
+
+        Returns:
+            Diccionario con 'propiedades', 'total' y 'siguiente_cursor'
+
+        Raises:
+            ValueError: Si el cursor es inválido o pertenece a otra búsqueda o versión
+        """
+        firma = self._firma_busqueda(filtros, ordenar_por, descendente, texto)
+        por_relevancia = bool(texto) and not ordenar_por
+
+        # El cursor se valida antes de buscar: uno inválido no cuesta un recorrido
+        datos = None
+        if cursor:
+            datos = self._decodificar_cursor(cursor)
+            if datos.get('v') != self.version_catalogo:
+                raise ValueError("El catálogo cambió desde que se generó el cursor; reinicie la paginación")
+            if (datos.get('f') != firma or datos.get('o') != (ordenar_por or '')
+                    or not 0 <= datos['r'] < len(self.propiedades)):
+                raise ValueError("El cursor no corresponde a esta búsqueda")
+
+        terminos = ' '.join(self.indice_texto.terminos_consulta(texto)) if texto else None
+        clave_busqueda = self._clave_busqueda(self.normalizar_filtros(filtros), terminos,
+                                              ordenar_por, descendente)
+        ids = self.buscar_ids_por_filtros(filtros, ordenar_por, descendente, texto)
+
+        inicio = 0
+        if datos is not None:
+            if por_relevancia:
+                inicio = int(datos.get('p', 0))
+                if not 0 < inicio <= len(ids) or ids[inicio - 1] != datos['r']:
+                    raise ValueError("El cursor no corresponde a esta búsqueda")
+            else:
+                clave = self._clave_posicion(ordenar_por, descendente)
+                inicio = bisect.bisect_right(ids, clave(datos['r']), key=clave)
+
+        pagina = ids[inicio:inicio + max(0, limite)]
+        siguiente = None
+        if len(pagina) and inicio + len(pagina) < len(ids):
+            estado = {
+                'v': self.version_catalogo,
+                'o': ordenar_por or '',
+                'f': firma,
+                'r': int(pagina[-1])
+            }
+            if por_relevancia:
+                estado['p'] = inicio + len(pagina)
+            siguiente = self._codificar_cursor(estado)
+            self._conservar_paginacion(clave_busqueda, ids)
 
-        for prop in self.propiedades:
-            if self.cumple_filtros(prop, filtros):
-                resultados.append(prop)
+        return {
+            'propiedades': [self.propiedades[i] for i in pagina],
+            'total': int(len(ids)),
+            'siguiente_cursor': siguiente
+        }
 
-        return resultados
+    def _conservar_paginacion(self, clave: Tuple, ids: np.ndarray) -> None:
+        """Guarda los ids de una búsqueda con página siguiente entre las paginaciones abiertas."""
+        with self._cache_lock:
+            if clave[0] != self.version_catalogo:
+                return
+            self._paginaciones[clave] = ids
+            self._paginaciones.move_to_end(clave)
+            while len(self._paginaciones) > MAX_PAGINACIONES_ABIERTAS:
+                self._paginaciones.popitem(last=False)
+
+    def _clave_posicion(self, ordenar_por: Optional[str], descendente: bool) -> Callable[[int], int]:
+        """Retorna una función fila -> posición, creciente en el orden de la búsqueda."""
+        if not ordenar_por:
+            return (lambda fila: -int(fila)) if descendente else int
+
+        if ordenar_por not in self._rangos:
+            rango = np.empty(len(self.propiedades), dtype=np.int64)
+            rango[self.ordenamientos[ordenar_por]] = np.arange(len(self.propiedades))
+            self._rangos[ordenar_por] = rango
+        rango = self._rangos[ordenar_por]
+
+        if not descendente:
+            return lambda fila: int(rango[fila])
+
+        # Descendente: filas válidas en orden inverso y luego los NaN (ver _permutacion)
+        columna = self.columnas[ordenar_por]
+        nulos = int(np.count_nonzero(np.isnan(columna))) if columna.dtype.kind == 'f' else 0
+        validos = len(self.propiedades) - nulos
+        return lambda fila: validos - 1 - int(rango[fila]) if rango[fila] < validos else int(rango[fila])
+
+    def _firma_busqueda(self, filtros: Dict[str, Any], ordenar_por: Optional[str],
+                        descendente: bool, texto: Optional[str] = None) -> str:
+        """Firma corta de los filtros, el texto y el orden, para validar cursores."""
+        terminos = self.indice_texto.terminos_consulta(texto) if texto else None
+        serializado = json.dumps([self.normalizar_filtros(filtros), terminos, ordenar_por or '', bool(descendente)],
+                                 sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(serializado.encode('utf-8')).hexdigest()[:16]
+
+    @staticmethod
+    def _codificar_cursor(datos: Dict[str, Any]) -> str:
+        """Codifica el estado de paginación en un token opaco."""
+        crudo = json.dumps(datos, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(crudo).decode('ascii').rstrip('=')
+
+    @staticmethod
+    def _decodificar_cursor(cursor: str) -> Dict[str, Any]:
+        """Decodifica un cursor generado por _codificar_cursor."""
+        try:
+            relleno = '=' * (-len(cursor) % 4)
+            datos = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+            datos['r'] = int(datos['r'])
+            return datos
+        except (ValueError, TypeError, KeyError):
+            raise ValueError("Cursor inválido")
+
+    def _mascara_filtros(self, filtros: Dict[str, Any]) -> np.ndarray:
+        """Evalúa los filtros de forma vectorizada y retorna una máscara booleana por fila."""
+        col = self.columnas
+        mascara = np.ones(len(self.propiedades), dtype=bool)
+
+        for campo in ('zona', 'fuente'):
+            if campo not in filtros:
+                continue
+            buscados = filtros[campo]
+            if isinstance(buscados, str):
+                buscados = [buscados]
+            elif not isinstance(buscados, list) or campo == 'fuente':
+                continue
+            buscados = [b.strip().lower() for b in buscados]
+            codigos = [i for i, valor in enumerate(self._categorias[campo])
+                       if any(b in valor.lower() for b in buscados)]
+            mascara &= np.isin(col[campo], codigos)
+
+        # Las comparaciones con NaN son falsas, igual que los errores en cumple_filtros
+        limites = (
+            ('precio_min', 'precio', np.greater_equal),
+            ('precio_max', 'precio', np.less_equal),
+            ('superficie_min', 'superficie', np.greater_equal),
+            ('superficie_max', 'superficie', np.less_equal),
+            ('habitaciones_min', 'habitaciones', np.greater_equal),
+            ('banos_min', 'banos', np.greater_equal)
+        )
+        for filtro, columna, comparar in limites:
+            if filtro in filtros:
+                mascara &= comparar(col[columna], filtros[filtro])
+
+        if 'tiene_garaje' in filtros:
+            mascara &= col['garaje'] == bool(filtros['tiene_garaje'])
+
+        return mascara
 
     def cumple_filtros(self, propiedad: Dict[str, Any], filtros: Dict[str, Any]) -> bool:
         """Verifica si una propiedad cumple con los filtros."""
@@ -196,14 +786,7 @@ class SistemaConsultaCitrino:
 
     def buscar_por_zona(self, zona: str) -> List[Dict[str, Any]]:
         """Busca propiedades por zona."""
-        resultados = []
-
-        for prop in self.propiedades:
-            zona_prop = prop.get('ubicacion', {}).get('zona', '').lower()
-            if zona.lower() in zona_prop:
-                resultados.append(prop)
-
-        return resultados
+        return [self.propiedades[i] for i in self.buscar_ids_por_filtros({'zona': zona})]
 
     def buscar_por_rango_precio(self, precio_min: float, precio_max: float) -> List[Dict[str, Any]]:
         """Busca propiedades por rango de precio."""
@@ -216,40 +799,63 @@ class SistemaConsultaCitrino:
 
         return resultados
 
-    def obtener_top_propiedades(self, n: int = 10, criterio: str = 'precio') -> List[Dict[str, Any]]:
-        """Obtiene las top N propiedades según un criterio."""
-        if criterio == 'precio':
-            return sorted(self.propiedades,
-                         key=lambda x: x.get('caracteristicas_principales', {}).get('precio', 0),
-                         reverse=True)[:n]
-        elif criterio == 'superficie':
-            return sorted(self.propiedades,
-                         key=lambda x: x.get('caracteristicas_principales', {}).get('superficie_m2', 0),
-                         reverse=True)[:n]
+    def obtener_top_propiedades(self, n: int = 10,
+                                criterio: Union[str, Callable[[Dict[str, Any]], Any]] = 'precio',
+                                descendente: bool = True) -> List[Dict[str, Any]]:
+        """
+        Obtiene las top N propiedades según un criterio.
+
+        Los criterios de CRITERIOS_ORDEN usan la permutación precalculada,
+        las demás columnas numéricas usan selección parcial con argpartition
+        y un criterio arbitrario (función sobre la propiedad) usa heapq.
+        """
+        if n <= 0 or not self.propiedades:
+            return []
+
+        if callable(criterio):
+            seleccionar = heapq.nlargest if descendente else heapq.nsmallest
+            return seleccionar(n, self.propiedades, key=criterio)
+
+        if criterio in self.ordenamientos:
+            ids = self._permutacion(criterio, descendente)[:n]
+        elif criterio in self.columnas and self.columnas[criterio].dtype.kind == 'f':
+            ids = self._seleccion_parcial(self.columnas[criterio], n, descendente)
         else:
             return []
 
+        return [self.propiedades[i] for i in ids]
+
+    @staticmethod
+    def _seleccion_parcial(valores: np.ndarray, n: int, descendente: bool) -> np.ndarray:
+        """Selecciona los n índices extremos de una columna sin ordenarla completa."""
+        claves = np.where(np.isnan(valores), np.inf, -valores if descendente else valores)
+        if n < len(claves):
+            candidatos = np.argpartition(claves, n - 1)[:n]
+        else:
+            candidatos = np.arange(len(claves))
+        return candidatos[np.argsort(claves[candidatos], kind='stable')]
+
     def obtener_estadisticas_por_zona(self, zona: str) -> Dict[str, Any]:
         """Obtiene estadísticas específicas por zona."""
-        propiedades_zona = self.buscar_por_zona(zona)
+        ids = self.buscar_ids_por_filtros({'zona': zona})
 
-        if not propiedades_zona:
+        if not len(ids):
             return {}
 
-        precios = [prop.get('caracteristicas_principales', {}).get('precio', 0)
-                   for prop in propiedades_zona if prop.get('caracteristicas_principales', {}).get('precio', 0) > 0]
+        precios = self.columnas['precio'][ids]
+        precios = precios[precios > 0]
 
-        superficies = [prop.get('caracteristicas_principales', {}).get('superficie_m2', 0)
-                       for prop in propiedades_zona if prop.get('caracteristicas_principales', {}).get('superficie_m2', 0) > 0]
+        superficies = self.columnas['superficie'][ids]
+        superficies = superficies[superficies > 0]
 
         return {
             'zona': zona,
-            'total_propiedades': len(propiedades_zona),
-            'precio_promedio': sum(precios) / len(precios) if precios else 0,
-            'precio_minimo': min(precios) if precios else 0,
-            'precio_maximo': max(precios) if precios else 0,
-            'superficie_promedio': sum(superficies) / len(superficies) if superficies else 0,
-            'precio_m2_promedio': sum(precios) / sum(superficies) if precios and superficies else 0
+            'total_propiedades': int(len(ids)),
+            'precio_promedio': float(precios.mean()) if len(precios) else 0,
+            'precio_minimo': float(precios.min()) if len(precios) else 0,
+            'precio_maximo': float(precios.max()) if len(precios) else 0,
+            'superficie_promedio': float(superficies.mean()) if len(superficies) else 0,
+            'precio_m2_promedio': float(precios.sum() / superficies.sum()) if len(precios) and len(superficies) else 0
         }
 
     def obtener_comparativo_zonas(self, zonas: List[str]) -> Dict[str, Any]:
@@ -263,18 +869,19 @@ class SistemaConsultaCitrino:
 
         return comparativo
 
-    def exportar_resultados(self, resultados: List[Dict[str, Any]], formato: str = 'json', nombre_archivo: str = None) -> str:
+    def exportar_resultados(self, resultados: List[Dict[str, Any]], formato: str = 'json', nombre_archivo: str = None,
+                            directorio: str = 'data/resultados') -> str:
         """Exporta resultados a diferentes formatos."""
         if not nombre_archivo:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             nombre_archivo = f"resultados_busqueda_{timestamp}"
 
-        os.makedirs('data/resultados', exist_ok=True)
+        os.makedirs(directorio, exist_ok=True)
 
         if formato == 'json':
-            ruta = f"data/resultados/{nombre_archivo}.json"
+            ruta = os.path.join(directorio, f"{nombre_archivo}.json")
             with open(ruta, 'w', encoding='utf-8') as f:
-                json.dump(resultados, f, indent=2, ensure_ascii=False)
+                json.dump(resultados, f, indent=2, ensure_ascii=False, default=a_json)
 
         elif formato == 'csv':
             # Convertir a DataFrame para exportar a CSV
@@ -292,7 +899,7 @@ class SistemaConsultaCitrino:
                 })
 
             df = pd.DataFrame(datos_csv)
-            ruta = f"data/resultados/{nombre_archivo}.csv"
+            ruta = os.path.join(directorio, f"{nombre_archivo}.csv")
             df.to_csv(ruta, index=False, encoding='utf-8')
 
         elif formato == 'excel':
@@ -308,11 +915,11 @@ class SistemaConsultaCitrino:
                     'Baños': prop.get('caracteristicas_principales', {}).get('banos_completos', 0),
                     'Zona': prop.get('ubicacion', {}).get('zona', ''),
                     'Fuente': prop.get('fuente', ''),
-                    'Descripción': prop.get('descripcion', '')[:200] + '...' if len(prop.get('descripcion', '')) > 200 else prop.get('descripcion', '')
+                    'Descripción': extracto_texto(prop, 'descripcion', 200)
                 })
 
             df = pd.DataFrame(datos_excel)
-            ruta = f"data/resultados/{nombre_archivo}.xlsx"
+            ruta = os.path.join(directorio, f"{nombre_archivo}.xlsx")
             df.to_excel(ruta, index=False)
 
         else:
@@ -16,6 +16,7 @@ import os
 
 from .recommendation_engine import RecommendationEngine
 from .llm_integration import LLMIntegration, LLMConfig
+from .extractor_perfiles import ParserPerfiles, UMBRAL_CONFIANZA, extraer_perfil
 
 app = typer.Typer(help="Sistema de Recomendación Inmobiliaria para Citrino")
 console = Console()
@@ -39,7 +40,8 @@ def recomendar(
     perfil: str = typer.Option(..., help="Perfil del prospecto (ruta a archivo JSON o descripción en texto)"),
     limite: int = typer.Option(5, help="Número máximo de recomendaciones"),
     formato: str = typer.Option("tabla", help="Formato de salida (tabla, json, detallado)"),
-    usar_llm: bool = typer.Option(True, help="Usar LLM para procesamiento de lenguaje natural")
+    usar_llm: bool = typer.Option(True, help="Usar LLM para procesamiento de lenguaje natural"),
+    umbral_confianza: float = typer.Option(UMBRAL_CONFIANZA, help="Confianza de las reglas desde la que no se consulta al LLM")
 ):
     """
     Genera recomendaciones de propiedades basadas en el perfil del prospecto.
@@ -48,19 +50,7 @@ def recomendar(
     engine = RecommendationEngine()
 
     # Inicializar LLM integration si está habilitado
-    llm_integration = None
-    if usar_llm:
-        try:
-            llm_integration = LLMIntegration()
-            if llm_integration.validar_configuracion():
-                config_info = llm_integration.obtener_info_configuracion()
-                console.print(f"[green]LLM configurado: {config_info['provider']} - {config_info['model']}[/green]")
-            else:
-                console.print("[yellow]LLM no configurado, usando procesamiento básico[/yellow]")
-                llm_integration = None
-        except Exception as e:
-            console.print(f"[yellow]Error inicializando LLM ({e}), usando procesamiento básico[/yellow]")
-            llm_integration = None
+    llm_integration = _inicializar_llm() if usar_llm else None
 
     # Cargar propiedades
     ruta_propiedades = "data/propiedades.json"
@@ -84,7 +74,7 @@ def recomendar(
     else:
         # Si no es un archivo, asumir que es una descripción en texto
         console.print("[blue]Analizando perfil desde descripción...[/blue]")
-        perfil_data = _parsear_perfil_desde_texto(perfil, llm_integration)
+        perfil_data = _parsear_perfil_desde_texto(perfil, llm_integration, umbral_confianza)
 
     # Generar recomendaciones
     console.print("\n[bold blue]Generando recomendaciones...[/bold blue]")
@@ -103,104 +93,59 @@ def recomendar(
         _mostrar_recomendaciones_detalladas(recomendaciones)
 
 
-def _parsear_perfil_desde_texto(texto: str, llm_integration: Optional[LLMIntegration] = None) -> dict:
+def _inicializar_llm() -> Optional[LLMIntegration]:
+    """Crea la integración LLM si está configurada; None si no."""
+    try:
+        llm_integration = LLMIntegration()
+        if llm_integration.validar_configuracion():
+            config_info = llm_integration.obtener_info_configuracion()
+            console.print(f"[green]LLM configurado: {config_info['provider']} - {config_info['model']}[/green]")
+            return llm_integration
+        console.print("[yellow]LLM no configurado, usando procesamiento básico[/yellow]")
+    except Exception as e:
+        console.print(f"[yellow]Error inicializando LLM ({e}), usando procesamiento básico[/yellow]")
+    return None
+
+
+def _parsear_perfil_desde_texto(texto: str, llm_integration: Optional[LLMIntegration] = None,
+                                umbral_confianza: float = UMBRAL_CONFIANZA,
+                                parser: Optional[ParserPerfiles] = None) -> dict:
     """
     Parsea una descripción en lenguaje natural a un perfil estructurado.
-    Utiliza LLM cuando está disponible, con fallback a procesamiento básico.
+    Primero aplica las reglas; el LLM sólo se consulta si la confianza de
+    las reglas no alcanza el umbral, para completar los campos faltantes.
     """
-    # Intentar usar LLM si está configurado
-    if llm_integration and llm_integration.validar_configuracion():
-        try:
-            console.print("[blue]Analizando con LLM...[/blue]")
-            perfil = llm_integration.parsear_perfil_desde_texto(texto)
-            console.print("[green]Perfil generado con LLM[/green]")
-            return perfil
-        except Exception as e:
-            console.print(f"[yellow]Error con LLM ({e}), usando procesamiento básico[/yellow]")
+    if parser is None:
+        if llm_integration and not llm_integration.validar_configuracion():
+            llm_integration = None
+        parser = ParserPerfiles(llm_integration, umbral_confianza)
 
-    # Fallback a procesamiento básico sin LLM
-    console.print("[yellow]Usando procesamiento básico (LLM no disponible)[/yellow]")
-    return _parsear_perfil_basico(texto)
+    cache = parser.llm_integration.cache if parser.llm_integration is not None else None
+    aciertos = cache.stats['aciertos'] if cache is not None else 0
+    try:
+        perfil, detalle = parser.parsear(texto)
+    except Exception as e:
+        console.print(f"[yellow]Error con LLM ({e}), usando procesamiento básico[/yellow]")
+        return _parsear_perfil_basico(texto)
+
+    confianza = detalle['confianza']
+    if detalle['fuente'] == 'reglas':
+        console.print(f"[green]Perfil generado por reglas (confianza {confianza:.2f}), sin llamada al LLM[/green]")
+    elif detalle['fuente'] == 'reglas+llm':
+        origen = "cache LLM" if cache is not None and cache.stats['aciertos'] > aciertos else "LLM"
+        faltantes = ', '.join(detalle['faltantes']) or 'ninguno'
+        console.print(f"[green]Perfil completado con {origen} (confianza de reglas {confianza:.2f}; "
+                      f"faltaban: {faltantes})[/green]")
+    else:
+        console.print(f"[yellow]Usando procesamiento básico (LLM no disponible, confianza {confianza:.2f})[/yellow]")
+    return perfil
 
 
 def _parsear_perfil_basico(texto: str) -> dict:
     """
     Genera un perfil básico usando reglas simples.
     """
-    texto_lower = texto.lower()
-
-    # Análisis simple de composición familiar
-    adultos = 2  # valor por defecto
-    ninos = []
-    adultos_mayores = 0
-
-    if "solo" in texto_lower or "individual" in texto_lower:
-        adultos = 1
-    elif "pareja" in texto_lower or "matrimonio" in texto_lower:
-        adultos = 2
-    elif "familia" in texto_lower:
-        adultos = 2
-        if "hijo" in texto_lower or "niño" in texto_lower:
-            ninos = [{"edad": 8}]  # edad estimada
-
-    # Análisis simple de presupuesto
-    presupuesto_min = None
-    presupuesto_max = None
-
-    # Buscar números en el texto
-    import re
-    numeros = re.findall(r'\b(\d+(?:\.\d+)?)\s*[kK]?\b', texto)
-    if numeros:
-        # Convertir a números y asumir que son miles si tienen 'k' o son < 1000
-        valores = []
-        for num in numeros:
-            valor = float(num)
-            if valor < 1000:
-                valor *= 1000  # asumir miles
-            valores.append(valor)
-
-        if valores:
-            presupuesto_min = min(valores) * 0.8  # 20% menos como mínimo
-            presupuesto_max = max(valores) * 1.2  # 20% más como máximo
-
-    # Necesidades básicas según palabras clave
-    necesidades = []
-    if "escuela" in texto_lower or "colegio" in texto_lower:
-        necesidades.append("escuela_primaria")
-    if "universidad" in texto_lower:
-        necesidades.append("universidad")
-    if "supermercado" in texto_lower or "mercado" in texto_lower:
-        necesidades.append("supermercado")
-    if "hospital" in texto_lower or "clinica" in texto_lower:
-        necesidades.append("hospital")
-
-    # Preferencias de ubicación
-    ubicacion = None
-    if "norte" in texto_lower:
-        ubicacion = "norte"
-    elif "sur" in texto_lower:
-        ubicacion = "sur"
-    elif "centro" in texto_lower:
-        ubicacion = "centro"
-
-    return {
-        "composicion_familiar": {
-            "adultos": adultos,
-            "ninos": ninos,
-            "adultos_mayores": adultos_mayores
-        },
-        "presupuesto": {
-            "min": presupuesto_min,
-            "max": presupuesto_max,
-            "tipo": "compra"
-        },
-        "necesidades": necesidades,
-        "preferencias": {
-            "ubicacion": ubicacion,
-            "seguridad": "alta",
-            "caracteristicas_deseadas": []
-        }
-    }
+    return extraer_perfil(texto).perfil
 
 
 def _mostrar_recomendaciones_tabla(recomendaciones: list):
@@ -296,6 +241,82 @@ def listar_propiedades():
     console.print(table)
 
 
+@app.command()
+def analizar_perfiles(
+    archivo: str = typer.Argument(..., help="Archivo de texto con una descripción por línea"),
+    usar_llm: bool = typer.Option(True, help="Consultar al LLM cuando las reglas no alcanzan la confianza"),
+    umbral_confianza: float = typer.Option(UMBRAL_CONFIANZA, help="Confianza de las reglas desde la que no se consulta al LLM"),
+    salida: Optional[str] = typer.Option(None, help="Guardar los perfiles generados en este archivo JSON"),
+    concurrencia: int = typer.Option(8, help="Llamadas simultáneas al LLM")
+):
+    """Convierte descripciones a perfiles e informa cuántas se resolvieron sin LLM."""
+    try:
+        with open(archivo, 'r', encoding='utf-8') as f:
+            textos = [linea.strip() for linea in f if linea.strip()]
+    except FileNotFoundError:
+        console.print(f"[red]Error: No se encontró el archivo {archivo}[/red]")
+        return
+
+    parser = ParserPerfiles(_inicializar_llm() if usar_llm else None, umbral_confianza)
+    table = Table(title="Perfiles analizados")
+    table.add_column("#", style="cyan", no_wrap=True)
+    table.add_column("Descripción", style="magenta")
+    table.add_column("Confianza", style="green")
+    table.add_column("Fuente", style="blue")
+    table.add_column("Faltantes", style="yellow")
+
+    # Las descripciones que las reglas no resuelven van al LLM en paralelo
+    try:
+        parseados = parser.parsear_lote(textos, max_concurrentes=concurrencia)
+    except Exception as e:
+        console.print(f"[yellow]Error con LLM ({e}), usando procesamiento básico[/yellow]")
+        parser = ParserPerfiles(None, umbral_confianza)
+        parseados = parser.parsear_lote(textos)
+
+    resultados = []
+    for i, (texto, (perfil, detalle)) in enumerate(zip(textos, parseados), 1):
+        resultados.append({'texto': texto, 'perfil': perfil, **detalle})
+        table.add_row(str(i), texto[:60], f"{detalle['confianza']:.2f}", detalle['fuente'],
+                      ', '.join(detalle['faltantes']))
+    console.print(table)
+
+    stats = parser.estadisticas()
+    console.print(f"[bold]Resueltos sin LLM: {stats['reglas'] + stats['sin_llm_disponible']}/{stats['total']} "
+                  f"({stats['fraccion_sin_llm']:.0%}); con LLM: {stats['llm']}[/bold]")
+
+    if salida:
+        with open(salida, 'w', encoding='utf-8') as f:
+            json.dump({'estadisticas': stats, 'perfiles': resultados}, f, ensure_ascii=False, indent=2)
+        console.print(f"[green]Perfiles guardados en {salida}[/green]")
+
+
+@app.command()
+def cache_llm(
+    limpiar: bool = typer.Option(False, help="Borrar todas las entradas del cache")
+):
+    """Muestra el estado del cache persistente de perfiles del LLM."""
+    llm_integration = LLMIntegration()
+    cache = llm_integration.cache
+    if cache is None:
+        console.print("[yellow]Cache LLM desactivado (defina LLM_CACHE_PATH para activarlo)[/yellow]")
+        return
+
+    if limpiar:
+        borradas = cache.limpiar()
+        console.print(f"[green]Cache LLM limpiado: {borradas} entradas borradas[/green]")
+        return
+
+    stats = cache.estadisticas()
+    table = Table(title="Cache LLM")
+    table.add_column("Dato", style="cyan")
+    table.add_column("Valor", style="green")
+    table.add_row("Archivo", stats['ruta'])
+    table.add_row("Entradas", f"{stats['entradas']} / {stats['max_entradas']}")
+    table.add_row("TTL", f"{stats['ttl_segundos'] / 3600:.0f} horas")
+    table.add_row("Versión del prompt", llm_integration.obtener_info_configuracion()['prompt_version'])
+    console.print(table)
+
+
 @app.command()
 def ayuda():
     """Muestra información de ayuda y ejemplos de uso."""
@@ -317,6 +338,13 @@ Ejemplos de uso:
   python -m src.cli recomendar --perfil perfil.json --formato json
   python -m src.cli recomendar --perfil perfil.json --formato detallado
 
+[green]5. Analizar un archivo de descripciones (una por línea):[/green]
+  python -m src.cli analizar-perfiles prospectos.txt --umbral-confianza 0.7
+
+[green]6. Ver o limpiar el cache de perfiles del LLM:[/green]
+  python -m src.cli cache-llm
+  python -m src.cli cache-llm --limpiar
+
 [bold]Opciones de formato:[/bold]
   • [cyan]tabla[/cyan]: Formato de tabla compacta (por defecto)
   • [cyan]json[/cyan]: Formato JSON para integración
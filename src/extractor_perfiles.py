@@ -0,0 +1,438 @@
+"""
+Extracción de perfiles por reglas con puntaje de confianza.
+
+Las descripciones cortas y explícitas ("familia con 2 niños, 150 mil,
+Equipetrol") se resuelven con expresiones regulares en microsegundos. El
+extractor informa qué campos encontró y una confianza entre 0 y 1; el LLM
+sólo se consulta cuando la confianza queda bajo el umbral, y en ese caso
+sólo para completar los campos que las reglas no encontraron (o el perfil
+entero si el texto tiene negaciones o matices que las reglas no entienden).
+"""
+
+import os
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+# Confianza mínima para responder sin LLM (configurable con LLM_UMBRAL_CONFIANZA)
+UMBRAL_CONFIANZA = float(os.getenv("LLM_UMBRAL_CONFIANZA", "0.7"))
+
+# Aporte de cada campo a la confianza; suman 1
+PESOS_CAMPOS = {
+    "presupuesto": 0.35,
+    "composicion_familiar": 0.25,
+    "ubicacion": 0.25,
+    "necesidades": 0.15,
+}
+
+# Textos largos suelen traer matices que las reglas no ven
+PALABRAS_TEXTO_LARGO = 30
+FACTOR_TEXTO_LARGO = 0.85
+FACTOR_AMBIGUO = 0.6
+
+# Nombre canónico de las zonas, por forma normalizada (sin acentos, minúsculas)
+ZONAS_CONOCIDAS = {
+    "equipetrol": "Equipetrol",
+    "las palmas": "Las Palmas",
+    "urubo": "Urubó",
+    "urbari": "Urbari",
+    "sirari": "Sirari",
+    "san isidro": "San Isidro",
+    "los lotes": "Los Lotes",
+    "sevillas": "Sevillas",
+    "san aurelio": "San Aurelio",
+    "la ramada": "La Ramada",
+    "remanso": "Remanso",
+    "plan 3000": "Plan 3000",
+    "centro historico": "Centro Histórico",
+    "zona norte": "Zona Norte",
+    "zona sur": "Zona Sur",
+    "zona este": "Zona Este",
+    "zona oeste": "Zona Oeste",
+    "centro": "Centro",
+    "norte": "Zona Norte",
+    "sur": "Zona Sur",
+}
+
+NECESIDADES = {
+    "escuela_primaria": ("escuela", "colegio", "kinder"),
+    "universidad": ("universidad", "facultad"),
+    "supermercado": ("supermercado", "mercado"),
+    "hospital": ("hospital", "clinica"),
+    "farmacia": ("farmacia",),
+    "transporte": ("transporte", "micro", "parada"),
+    "gym": ("gimnasio", "gym"),
+    "parque": ("parque", "plaza", "area verde"),
+}
+
+CARACTERISTICAS = {
+    "amoblado": ("amoblado", "amueblado"),
+    "estacionamiento": ("estacionamiento", "garaje", "cochera", "parqueo"),
+    "ascensor": ("ascensor",),
+    "piscina": ("piscina",),
+    "planta_baja": ("planta baja",),
+    "espacioso": ("espacioso", "amplio", "amplia"),
+    "jardin": ("jardin", "patio"),
+}
+
+TIPOS_PROPIEDAD = {
+    "departamento": ("departamento", "depto", "apartamento", "monoambiente"),
+    "casa": ("casa", "duplex", "chalet"),
+    "terreno": ("terreno", "lote"),
+    "oficina": ("oficina", "local comercial"),
+}
+
+NUMEROS_TEXTO = {"un": 1, "una": 1, "uno": 1, "dos": 2, "tres": 3, "cuatro": 4, "cinco": 5}
+
+_NUM = r"(\d+(?:[.,]\d+)*|un|una|uno|dos|tres|cuatro|cinco)"
+_RE_NINOS = re.compile(_NUM + r"\s+(?:ninos|ninas|hijos|hijas|chicos|nenes|bebes)\b")
+_RE_ADULTOS = re.compile(_NUM + r"\s+adultos\b(?!\s+mayores)")
+_RE_MAYORES = re.compile(_NUM + r"\s+(?:adultos mayores|abuelos|jubilados)\b")
+_RE_EDADES = re.compile(r"\bde\s+(\d{1,2}(?:\s*(?:,|y)\s*\d{1,2})*)\s+anos\b")
+
+# Montos: número con separadores y unidad opcional; se descartan los que
+# cuentan personas, años, ambientes, anillos o superficie. Las listas de edades
+# ("de 8, 10 y 12 años") se descartan sólo si terminan en "años": en
+# "150 mil, 2 niños" el monto sigue valiendo
+_UNIDAD = r"(k\b|mil\b|millones\b|millon\b)?"
+_NO_MONTO = (r"(?!\s*(?:(?:,|y)\s*\d{1,2}\s*)+anos\b)"
+             r"(?!\s*(?:ninos|ninas|hijos|hijas|chicos|adultos|anos|habitaciones|dormitorios|cuartos|"
+             r"banos|pisos|anillo|m2|mts|metros|personas|do\b|ro\b|er\b|to\b|vo\b|mo\b))")
+_RE_MONTO = re.compile(r"(?<![\w.,])(\$|usd|us\$|bs\.?)?\s*(\d+(?:[.,]\d+)*)\s*" + _UNIDAD + _NO_MONTO)
+_RE_RANGO = re.compile(
+    r"(?<![\w.,])(\d+(?:[.,]\d+)*)\s*" + _UNIDAD + r"\s*(?:-|a|y|hasta)\s*\$?\s*(\d+(?:[.,]\d+)*)\s*" + _UNIDAD
+    + _NO_MONTO
+)
+
+# Moneda escrita después del número ("800 usd", "150.000 dolares")
+_RE_MONEDA_DESPUES = re.compile(r"(?:usd|us\$|\$us|dolares|dolar|bs\b|bolivianos)")
+# Palabras que anuncian un monto aunque no tenga moneda ni unidad
+_RE_MARCADOR = re.compile(
+    r"(?:hasta|maximo|max\.?|no mas de|menos de|tope|desde|minimo|mas de|presupuesto(?: es)?(?: de)?:?"
+    r"|alrededor de|unos|cerca de|aproximadamente|aprox\.?|precio(?: de)?|pagar|invertir)\s*$"
+)
+# Números que nombran algo: "plan 3000", "calle 5"
+_RE_REFERENCIA = re.compile(r"\b(?:plan|calle|avenida|av\.?|km|nro\.?|numero|uv|manzano)\s*$")
+# Palabras que pueden seguir a un monto sin unidad
+_CONECTORES = ("y", "o", "a", "hasta", "e")
+
+# Expresiones que las reglas no interpretan bien
+_RE_AMBIGUO = re.compile(
+    r"\b(?:no\s+(?:en|quiero|me|cerca|tan|muy|mas)|excepto|salvo|menos\s+en|pero|aunque|quizas|tal vez|o bien)\b"
+)
+
+# Negaciones que excluyen la zona que las sigue en la misma cláusula
+_RE_NEGACION_ZONA = re.compile(r"\b(?:no|ni|excepto|salvo|menos|lejos de|fuera de|evitar)\b")
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas sin acentos, para comparar palabras clave."""
+    sin_acentos = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in sin_acentos if not unicodedata.combining(c)).lower()
+
+
+def _entero(token: str) -> int:
+    return NUMEROS_TEXTO.get(token) or int(float(token.replace(",", ".")))
+
+
+def _contiene(texto: str, palabras: Tuple[str, ...]) -> bool:
+    return any(re.search(rf"\b{re.escape(p)}", texto) for p in palabras)
+
+
+def _monto(numero: str, unidad: Optional[str], en_miles: bool = True) -> float:
+    """
+    Convierte '150', '150.000', '1,5' con su unidad a dólares. Sin unidad,
+    los montos menores a 1000 se asumen en miles salvo en alquileres.
+    """
+    if unidad:
+        valor = float(numero.replace(".", "").replace(",", ".")) if re.fullmatch(r"\d{1,3}(\.\d{3})+", numero) \
+            else float(numero.replace(",", "."))
+        multiplicador = 1_000_000 if unidad.startswith("millon") else 1000
+        return valor * multiplicador
+    # Sin unidad los separadores son de miles
+    valor = float(re.sub(r"[.,]", "", numero))
+    return valor * 1000 if en_miles and valor < 1000 else valor
+
+
+def _clase_monto(texto: str, inicio: int, fin: int, con_unidad: bool) -> Optional[str]:
+    """
+    'explicito' si el número tiene moneda, unidad o un marcador de presupuesto
+    delante; 'suelto' si es un número sin más; None si cuenta otra cosa
+    ("a 5 cuadras", "2 autos", "plan 3000").
+    """
+    despues = texto[fin:].lstrip()
+    if con_unidad or _RE_MONEDA_DESPUES.match(despues):
+        return "explicito"
+    antes = texto[max(0, inicio - 25):inicio]
+    if _RE_REFERENCIA.search(antes):
+        return None
+    palabra = re.match(r"[a-z]+", despues)
+    if palabra and palabra.group(0) not in _CONECTORES:
+        return None
+    return "explicito" if _RE_MARCADOR.search(antes) else "suelto"
+
+
+@dataclass
+class ResultadoExtraccion:
+    """Perfil extraído por reglas, con los campos encontrados y la confianza."""
+    perfil: Dict[str, Any]
+    confianza: float
+    detectados: List[str] = field(default_factory=list)
+    faltantes: List[str] = field(default_factory=list)
+    ambiguo: bool = False
+
+
+def _extraer_composicion(texto: str) -> Tuple[Dict[str, Any], bool]:
+    adultos, ninos, mayores = 2, [], 0
+    detectado = False
+
+    if re.search(r"\b(?:solo|sola|soltero|soltera|individual|una persona)\b", texto):
+        adultos, detectado = 1, True
+    elif re.search(r"\b(?:pareja|matrimonio|esposa|esposo|casados|familia)\b", texto):
+        detectado = True
+
+    coincidencia = _RE_ADULTOS.search(texto)
+    if coincidencia:
+        adultos, detectado = _entero(coincidencia.group(1)), True
+
+    coincidencia = _RE_MAYORES.search(texto)
+    if coincidencia:
+        mayores, detectado = _entero(coincidencia.group(1)), True
+    elif re.search(r"\b(?:abuel[oa]s?|adultos? mayor(?:es)?|tercera edad|jubilad[oa]s?)\b", texto):
+        mayores, detectado = 1, True
+
+    if re.search(r"\bsin\s+(?:hijos|ninos)\b", texto):
+        detectado = True
+    else:
+        edades = _RE_EDADES.search(texto)
+        cantidad = _RE_NINOS.search(texto)
+        if edades:
+            ninos = [{"edad": int(e)} for e in re.findall(r"\d{1,2}", edades.group(1))]
+        if cantidad:
+            n = _entero(cantidad.group(1))
+            # Edad estimada para los niños sin edad mencionada
+            ninos += [{"edad": 8}] * max(0, n - len(ninos))
+        elif not ninos and re.search(r"\b(?:hijos?|hijas?|ninos?|ninas?|bebe)\b", texto):
+            ninos = [{"edad": 8}]
+        detectado = detectado or bool(ninos)
+
+    return {"adultos": adultos, "ninos": ninos, "adultos_mayores": mayores}, detectado
+
+
+def _extraer_presupuesto(texto: str) -> Tuple[Dict[str, Any], bool, bool]:
+    """
+    Presupuesto del texto, si se encontró y si hay montos que se contradicen.
+
+    Se prefieren los montos con moneda, unidad o marcador ("hasta 120k") a
+    los números sueltos; los números seguidos de un sustantivo no son montos.
+    """
+    tipo = "alquiler" if re.search(r"\b(?:alquil\w*|renta|arriendo|anticretico|mensual(?:es)?)\b", texto) \
+        else "compra"
+    presupuesto = {"min": None, "max": None, "tipo": tipo}
+    en_miles = tipo == "compra"
+
+    for rango in _RE_RANGO.finditer(texto):
+        # "de 2 a 3 autos" no es un rango de precios
+        if not _clase_monto(texto, rango.start(), rango.end(), bool(rango.group(2) or rango.group(4))):
+            continue
+        numero_min, unidad_min, numero_max, unidad_max = rango.groups()
+        # "250-300K": la unidad del segundo valor vale para ambos
+        minimo = _monto(numero_min, unidad_min or unidad_max, en_miles)
+        maximo = _monto(numero_max, unidad_max or unidad_min, en_miles)
+        if 0 < minimo <= maximo:
+            presupuesto.update(min=minimo, max=maximo)
+            return presupuesto, True, False
+
+    explicitos, sueltos = [], []
+    for m in _RE_MONTO.finditer(texto):
+        clase = _clase_monto(texto, m.start(), m.end(), bool(m.group(1) or m.group(3)))
+        if clase:
+            (explicitos if clase == "explicito" else sueltos).append(
+                (m.start(), _monto(m.group(2), m.group(3), en_miles)))
+    montos = explicitos or sueltos
+    if not montos:
+        return presupuesto, False, False
+
+    conflicto = len({valor for _, valor in montos}) > 1
+    inicio, valor = montos[0]
+    antes = texto[max(0, inicio - 15):inicio]
+    if re.search(r"(?:hasta|maximo|max\.?|no mas de|menos de|tope)\s*$", antes):
+        presupuesto.update(min=0, max=valor)
+    elif re.search(r"(?:desde|minimo|mas de)\s*$", antes):
+        presupuesto.update(min=valor, max=valor * 1.5)
+    else:
+        # "alrededor de X": ±20%, como el perfil básico
+        presupuesto.update(min=valor * 0.8, max=valor * 1.2)
+    return presupuesto, True, conflicto
+
+
+def _zona_negada(texto: str, inicio: int) -> bool:
+    """True si la zona que empieza en `inicio` está negada en su cláusula ("no quiero Equipetrol")."""
+    clausula = re.split(r"[.,;:]|\b(?:pero|sino|prefiero)\b", texto[:inicio])[-1]
+    return bool(_RE_NEGACION_ZONA.search(clausula))
+
+
+def _extraer_ubicacion(texto: str) -> Optional[str]:
+    # Las zonas de varias palabras van primero en el diccionario: "zona norte" antes que "norte"
+    for clave, zona in ZONAS_CONOCIDAS.items():
+        for coincidencia in re.finditer(rf"\b{re.escape(clave)}\b", texto):
+            # Una zona negada no es la preferida: sin LLM es mejor no tener zona
+            if not _zona_negada(texto, coincidencia.start()):
+                return zona
+    return None
+
+
+def _palabras_clave(texto: str, tabla: Dict[str, Tuple[str, ...]]) -> List[str]:
+    return [nombre for nombre, palabras in tabla.items() if _contiene(texto, palabras)]
+
+
+def extraer_perfil(texto: str) -> ResultadoExtraccion:
+    """
+    Extrae un perfil estructurado de una descripción usando sólo reglas.
+
+    Args:
+        texto: Descripción del prospecto en lenguaje natural
+
+    Returns:
+        ResultadoExtraccion con el perfil (mismo formato que el del LLM), los
+        campos encontrados y la confianza
+    """
+    normalizado = normalizar(texto)
+
+    composicion, con_composicion = _extraer_composicion(normalizado)
+    presupuesto, con_presupuesto, montos_en_conflicto = _extraer_presupuesto(normalizado)
+    ubicacion = _extraer_ubicacion(normalizado)
+    necesidades = _palabras_clave(normalizado, NECESIDADES)
+    tipos = _palabras_clave(normalizado, TIPOS_PROPIEDAD)
+
+    encontrados = {
+        "presupuesto": con_presupuesto,
+        "composicion_familiar": con_composicion,
+        "ubicacion": ubicacion is not None,
+        "necesidades": bool(necesidades),
+    }
+    detectados = [campo for campo, encontrado in encontrados.items() if encontrado]
+    faltantes = [campo for campo, encontrado in encontrados.items() if not encontrado]
+
+    confianza = sum(PESOS_CAMPOS[campo] for campo in detectados)
+    # Montos que se contradicen ("150k o 200k") quedan para el LLM, como las negaciones
+    ambiguo = montos_en_conflicto or bool(_RE_AMBIGUO.search(normalizado))
+    if ambiguo:
+        confianza *= FACTOR_AMBIGUO
+    if len(normalizado.split()) > PALABRAS_TEXTO_LARGO:
+        confianza *= FACTOR_TEXTO_LARGO
+
+    perfil = {
+        "composicion_familiar": composicion,
+        "presupuesto": presupuesto,
+        "necesidades": necesidades,
+        "preferencias": {
+            "ubicacion": ubicacion,
+            "seguridad": "alta" if re.search(r"\bsegur[oa]s?\b|\bseguridad\b", normalizado) else None,
+            "estilo_propiedad": tipos[0] if tipos else None,
+            "caracteristicas_deseadas": _palabras_clave(normalizado, CARACTERISTICAS)
+        }
+    }
+    return ResultadoExtraccion(perfil, round(confianza, 3), detectados, faltantes, ambiguo)
+
+
+def completar_perfil(resultado: ResultadoExtraccion, perfil_llm: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Combina el perfil de reglas con el del LLM: los campos que las reglas
+    encontraron se conservan y el LLM aporta los faltantes. Con texto ambiguo
+    manda el LLM.
+    """
+    if resultado.ambiguo:
+        return perfil_llm
+
+    perfil = {
+        "composicion_familiar": dict(resultado.perfil["composicion_familiar"]),
+        "presupuesto": dict(resultado.perfil["presupuesto"]),
+        "necesidades": list(resultado.perfil["necesidades"]),
+        "preferencias": dict(resultado.perfil["preferencias"]),
+    }
+    preferencias_llm = perfil_llm.get("preferencias") or {}
+    for campo in resultado.faltantes:
+        if campo == "ubicacion":
+            perfil["preferencias"]["ubicacion"] = preferencias_llm.get("ubicacion")
+        elif perfil_llm.get(campo):
+            perfil[campo] = perfil_llm[campo]
+
+    # Preferencias secundarias: las del LLM si las reglas no encontraron ninguna
+    for clave in ("seguridad", "estilo_propiedad", "caracteristicas_deseadas"):
+        if not perfil["preferencias"].get(clave) and preferencias_llm.get(clave):
+            perfil["preferencias"][clave] = preferencias_llm[clave]
+    return perfil
+
+
+class ParserPerfiles:
+    """
+    Convierte descripciones a perfiles consultando al LLM sólo cuando las
+    reglas no alcanzan la confianza mínima. Cuenta cuántas se resolvieron
+    sin llamar al LLM.
+    """
+
+    def __init__(self, llm_integration=None, umbral_confianza: float = UMBRAL_CONFIANZA):
+        self.llm_integration = llm_integration
+        self.umbral_confianza = umbral_confianza
+        self.stats = {"reglas": 0, "llm": 0, "sin_llm_disponible": 0}
+
+    def parsear(self, texto: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        Returns:
+            (perfil, detalle) donde detalle indica la fuente ('reglas',
+            'reglas+llm' o 'reglas_sin_llm'), la confianza y los faltantes
+        """
+        resultado = extraer_perfil(texto)
+        detalle = {"confianza": resultado.confianza, "faltantes": resultado.faltantes,
+                   "ambiguo": resultado.ambiguo}
+
+        if resultado.confianza >= self.umbral_confianza:
+            self.stats["reglas"] += 1
+            return resultado.perfil, dict(detalle, fuente="reglas")
+
+        if self.llm_integration is None:
+            self.stats["sin_llm_disponible"] += 1
+            return resultado.perfil, dict(detalle, fuente="reglas_sin_llm")
+
+        perfil_llm = self.llm_integration.parsear_perfil_desde_texto(texto)
+        self.stats["llm"] += 1
+        return completar_perfil(resultado, perfil_llm), dict(detalle, fuente="reglas+llm")
+
+    def parsear_lote(self, textos: List[str], **opciones_lote) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """
+        Como `parsear` para varias descripciones: las que las reglas no
+        resuelven van al LLM en un solo lote concurrente
+        (LLMIntegration.parsear_perfiles_lote, que recibe `opciones_lote`).
+        """
+        resultados = [extraer_perfil(texto) for texto in textos]
+        salida: List[Optional[Tuple[Dict[str, Any], Dict[str, Any]]]] = [None] * len(textos)
+        pendientes = []
+        for i, resultado in enumerate(resultados):
+            detalle = {"confianza": resultado.confianza, "faltantes": resultado.faltantes,
+                       "ambiguo": resultado.ambiguo}
+            if resultado.confianza >= self.umbral_confianza:
+                self.stats["reglas"] += 1
+                salida[i] = (resultado.perfil, dict(detalle, fuente="reglas"))
+            elif self.llm_integration is None:
+                self.stats["sin_llm_disponible"] += 1
+                salida[i] = (resultado.perfil, dict(detalle, fuente="reglas_sin_llm"))
+            else:
+                pendientes.append((i, detalle))
+
+        if pendientes:
+            perfiles_llm = self.llm_integration.parsear_perfiles_lote([textos[i] for i, _ in pendientes],
+                                                                      **opciones_lote)
+            for (i, detalle), perfil_llm in zip(pendientes, perfiles_llm):
+                self.stats["llm"] += 1
+                salida[i] = (completar_perfil(resultados[i], perfil_llm), dict(detalle, fuente="reglas+llm"))
+        return salida
+
+    def estadisticas(self) -> Dict[str, Any]:
+        """Conteo por fuente y fracción de descripciones resueltas sin llamar al LLM."""
+        total = sum(self.stats.values())
+        sin_llm = self.stats["reglas"] + self.stats["sin_llm_disponible"]
+        return dict(self.stats, total=total,
+                    fraccion_sin_llm=round(sin_llm / total, 3) if total else 0.0,
+                    umbral_confianza=self.umbral_confianza)
@@ -0,0 +1,231 @@
+"""
+Cliente asíncrono del LLM para procesar muchas descripciones a la vez.
+
+Cada llamada HTTP sigue siendo la de `requests`, pero corre en un pool de
+hilos propio y la concurrencia la limita un semáforo: con N descripciones el
+tiempo total se acerca al de la llamada más lenta y no a la suma. Cada
+llamada tiene su timeout y los errores transitorios (conexión, timeout, 429,
+5xx) se reintentan con espera exponencial y jitter.
+
+El timeout se aplica dentro del hilo, leyendo la respuesta con un límite
+total: una llamada abandonada no retiene su lugar en el pool hasta que el
+servidor termine de responder.
+"""
+
+import asyncio
+import copy
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from .llm_cache import normalizar_texto
+    from .llm_integration import PROMPT_VERSION
+except ImportError:
+    # Importado como módulo suelto (tests y scripts agregan src/ al path)
+    from llm_cache import normalizar_texto
+    from llm_integration import PROMPT_VERSION
+
+MAX_CONCURRENTES = 8
+REINTENTOS = 3
+TIMEOUT_SEGUNDOS = 30.0
+ESPERA_BASE = 0.5
+ESPERA_MAXIMA = 8.0
+
+# El timeout de asyncio es sólo un respaldo: normalmente vence antes el del hilo
+MARGEN_TIMEOUT = 1.0
+BLOQUE_LECTURA = 16 * 1024
+
+CODIGOS_REINTENTABLES = (429, 500, 502, 503, 504)
+
+
+class ErrorTransitorio(ConnectionError):
+    """Error que puede resolverse reintentando; `reintentar_en` viene de Retry-After."""
+
+    def __init__(self, mensaje: str, reintentar_en: Optional[float] = None):
+        super().__init__(mensaje)
+        self.reintentar_en = reintentar_en
+
+
+class TiempoAgotado(ErrorTransitorio):
+    """La llamada superó timeout_segundos; el hilo ya la abandonó."""
+
+
+class ClienteLLMAsync:
+    """
+    Envía los prompts de una LLMIntegration en paralelo acotado. Usa su
+    configuración (proveedor, modelo, base_url, headers), su prompt y su
+    cache de perfiles.
+    """
+
+    def __init__(self, llm_integration, max_concurrentes: int = MAX_CONCURRENTES,
+                 reintentos: int = REINTENTOS, timeout_segundos: float = TIMEOUT_SEGUNDOS,
+                 espera_base: float = ESPERA_BASE, espera_maxima: float = ESPERA_MAXIMA):
+        self.llm = llm_integration
+        self.max_concurrentes = max(1, max_concurrentes)
+        self.reintentos = max(0, reintentos)
+        self.timeout_segundos = timeout_segundos
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self.stats = {'llamadas': 0, 'reintentos': 0, 'timeouts': 0, 'errores': 0,
+                      'aciertos_cache': 0, 'duplicados': 0}
+
+        # Una conexión keep-alive por llamada simultánea
+        self.session = requests.Session()
+        self.session.headers.update(llm_integration.session.headers)
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrentes)
+        self.session.mount('http://', adaptador)
+        self.session.mount('https://', adaptador)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_concurrentes, thread_name_prefix='llm')
+        self._semaforo: Optional[asyncio.Semaphore] = None
+
+    async def _en_hilo(self, funcion: Callable, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._pool, funcion, *args)
+
+    def _leer_cuerpo(self, response: requests.Response, limite: float) -> bytes:
+        """Lee la respuesta por bloques y la abandona al pasar el límite (time.monotonic)."""
+        # read1 entrega lo que ya llegó; iter_content esperaría a llenar cada bloque
+        # (urllib3 anterior a 2.3 no tiene read1)
+        leer = getattr(response.raw, 'read1', response.raw.read)
+        cuerpo = bytearray()
+        while True:
+            bloque = leer(BLOQUE_LECTURA, decode_content=True)
+            if not bloque:
+                return bytes(cuerpo)
+            cuerpo += bloque
+            if time.monotonic() > limite:
+                raise TiempoAgotado(f"Timeout de {self.timeout_segundos}s leyendo la respuesta del LLM")
+
+    def _post(self, prompt: str) -> str:
+        """
+        Llamada bloqueante; corre en el pool de hilos. El timeout de requests
+        acota la conexión y cada lectura; el cuerpo se lee con el límite total.
+        """
+        limite = time.monotonic() + self.timeout_segundos
+        try:
+            with self.session.post(self.llm._url_chat(), json=self.llm._payload(prompt),
+                                   timeout=self.timeout_segundos, stream=True) as response:
+                if response.status_code in CODIGOS_REINTENTABLES:
+                    reintentar_en = response.headers.get('Retry-After')
+                    raise ErrorTransitorio(f"{self.llm.config.provider} respondió {response.status_code}",
+                                           float(reintentar_en) if reintentar_en and reintentar_en.isdigit() else None)
+                response.raise_for_status()
+                cuerpo = self._leer_cuerpo(response, limite)
+        except requests.exceptions.Timeout:
+            raise TiempoAgotado(f"Timeout de {self.timeout_segundos}s esperando al LLM")
+        except requests.exceptions.ConnectionError as e:
+            raise ErrorTransitorio(f"Error de conexión con {self.llm.config.provider}: {e}")
+        except requests.exceptions.RequestException as e:
+            raise ConnectionError(f"Error de {self.llm.config.provider}: {e}")
+
+        try:
+            return json.loads(cuerpo)["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            raise ValueError(f"Respuesta inesperada de {self.llm.config.provider}: {e}")
+
+    def _espera(self, intento: int, error: Exception) -> float:
+        """Espera exponencial con jitter completo; Retry-After manda si es mayor."""
+        espera = random.uniform(0, min(self.espera_maxima, self.espera_base * (2 ** intento)))
+        reintentar_en = getattr(error, 'reintentar_en', None)
+        return max(espera, min(reintentar_en, self.espera_maxima)) if reintentar_en else espera
+
+    async def completar(self, prompt: str) -> str:
+        """
+        Envía un prompt y retorna el texto de la respuesta.
+
+        Raises:
+            ConnectionError: si se agotaron los reintentos o el error no es transitorio
+            ValueError: si la respuesta no tiene el formato esperado
+        """
+        if self._semaforo is None:
+            self._semaforo = asyncio.Semaphore(self.max_concurrentes)
+
+        for intento in range(self.reintentos + 1):
+            # El semáforo se libera durante la espera entre reintentos
+            async with self._semaforo:
+                self.stats['llamadas'] += 1
+                try:
+                    return await asyncio.wait_for(self._en_hilo(self._post, prompt),
+                                                  self.timeout_segundos + MARGEN_TIMEOUT)
+                except asyncio.TimeoutError:
+                    self.stats['timeouts'] += 1
+                    error = TiempoAgotado(f"Timeout de {self.timeout_segundos}s esperando al LLM")
+                except ErrorTransitorio as e:
+                    if isinstance(e, TiempoAgotado):
+                        self.stats['timeouts'] += 1
+                    error = e
+
+            if intento < self.reintentos:
+                self.stats['reintentos'] += 1
+                await asyncio.sleep(self._espera(intento, error))
+
+        self.stats['errores'] += 1
+        raise ConnectionError(f"{error} (tras {self.reintentos + 1} intentos)")
+
+    async def parsear_perfil(self, texto: str) -> Dict[str, Any]:
+        """Versión asíncrona de LLMIntegration.parsear_perfil_desde_texto (mismo cache y respaldo)."""
+        if not texto or not texto.strip():
+            raise ValueError("El texto de entrada no puede estar vacío")
+
+        cache = self.llm.cache
+        modelo, version, origen = self.llm.config.model, PROMPT_VERSION, self.llm._origen_cache()
+        if cache is not None:
+            perfil = await self._en_hilo(cache.obtener, texto, modelo, version, origen)
+            if perfil is not None:
+                self.stats['aciertos_cache'] += 1
+                return perfil
+
+        try:
+            perfil = self.llm._parse_llm_response(await self.completar(self.llm._build_prompt(texto)))
+        except (ConnectionError, ValueError) as e:
+            print(f"Advertencia: Error procesando con LLM ({e}). Usando perfil básico.")
+            return self.llm._perfil_basico_desde_texto(texto)
+
+        if cache is not None:
+            await self._en_hilo(cache.guardar, texto, modelo, version, perfil, origen)
+        return perfil
+
+    async def parsear_perfiles_lote(self, textos: List[str]) -> List[Dict[str, Any]]:
+        """
+        Parsea varias descripciones en paralelo; el resultado respeta el orden
+        de entrada. Las descripciones repetidas dentro del lote (iguales salvo
+        mayúsculas y espacios) se envían una sola vez.
+
+        Raises:
+            ValueError: si alguna descripción está vacía (antes de enviar nada)
+        """
+        if any(not texto or not texto.strip() for texto in textos):
+            raise ValueError("El lote contiene descripciones vacías")
+
+        tareas: Dict[str, asyncio.Task] = {}
+        for texto in textos:
+            clave = normalizar_texto(texto)
+            if clave in tareas:
+                self.stats['duplicados'] += 1
+            else:
+                tareas[clave] = asyncio.ensure_future(self.parsear_perfil(texto))
+
+        await asyncio.gather(*tareas.values())
+        perfiles, entregados = [], set()
+        for texto in textos:
+            clave = normalizar_texto(texto)
+            perfil = tareas[clave].result()
+            # Los textos repetidos reciben copias independientes
+            perfiles.append(copy.deepcopy(perfil) if clave in entregados else perfil)
+            entregados.add(clave)
+        return perfiles
+
+    def cerrar(self) -> None:
+        self._pool.shutdown(wait=False)
+        self.session.close()
+
+    async def __aenter__(self) -> 'ClienteLLMAsync':
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.cerrar()
@@ -0,0 +1,162 @@
+"""
+Cache persistente de respuestas del LLM.
+
+Guarda en un archivo SQLite los perfiles que el LLM generó a partir de una
+descripción, indexados por texto normalizado, modelo, versión del prompt y
+origen (proveedor y URL del endpoint): el mismo nombre de modelo servido por
+otro proveedor o por un servidor local puede responder distinto.
+Las descripciones repetidas (o iguales salvo mayúsculas y espacios) se
+responden desde el archivo sin volver a llamar al modelo, también entre
+invocaciones distintas de la CLI o procesos distintos.
+
+Las entradas vencen pasado el TTL y, al superar el máximo de entradas, se
+descartan las usadas hace más tiempo.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, Optional
+
+# Valores por defecto: 30 días y 5000 perfiles
+TTL_SEGUNDOS = 30 * 24 * 3600
+MAX_ENTRADAS = 5000
+
+_ESPACIOS = re.compile(r'\s+')
+
+
+def normalizar_texto(texto: str) -> str:
+    """Forma canónica de una descripción: NFKC, minúsculas y espacios simples."""
+    texto = unicodedata.normalize('NFKC', texto)
+    return _ESPACIOS.sub(' ', texto).strip().lower()
+
+
+def clave_cache(texto: str, modelo: str, version_prompt: str, origen: str = '') -> str:
+    """Clave de una entrada; cambia si cambia el modelo, el prompt o el origen."""
+    contenido = '\x00'.join((version_prompt, origen, modelo, normalizar_texto(texto)))
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+
+class CacheLLM:
+    """Cache SQLite con TTL, límite de entradas y contadores de aciertos."""
+
+    def __init__(self, ruta: str, ttl_segundos: float = TTL_SEGUNDOS,
+                 max_entradas: int = MAX_ENTRADAS):
+        self.ruta = ruta
+        self.ttl_segundos = ttl_segundos
+        self.max_entradas = max(1, max_entradas)
+        self._lock = threading.Lock()
+        self._conexion: Optional[sqlite3.Connection] = None
+        self.stats = {'aciertos': 0, 'fallos': 0, 'vencidas': 0, 'guardadas': 0, 'descartadas': 0}
+
+    def _conectar(self) -> sqlite3.Connection:
+        # Se abre al primer uso: crear LLMIntegration no debe tocar el disco
+        if self._conexion is None:
+            directorio = os.path.dirname(self.ruta)
+            if directorio:
+                os.makedirs(directorio, exist_ok=True)
+            conexion = sqlite3.connect(self.ruta, timeout=10, check_same_thread=False)
+            # WAL: varias CLI o workers pueden leer mientras otro escribe
+            conexion.execute('PRAGMA journal_mode=WAL')
+            conexion.execute("""
+                CREATE TABLE IF NOT EXISTS respuestas (
+                    clave TEXT PRIMARY KEY,
+                    modelo TEXT NOT NULL,
+                    version_prompt TEXT NOT NULL,
+                    texto TEXT NOT NULL,
+                    valor TEXT NOT NULL,
+                    creado REAL NOT NULL,
+                    usado REAL NOT NULL,
+                    aciertos INTEGER NOT NULL DEFAULT 0
+                )""")
+            conexion.execute('CREATE INDEX IF NOT EXISTS respuestas_usado ON respuestas (usado)')
+            conexion.commit()
+            self._conexion = conexion
+        return self._conexion
+
+    def obtener(self, texto: str, modelo: str, version_prompt: str, origen: str = '') -> Optional[Any]:
+        """Valor guardado para el texto, o None si no existe o venció."""
+        clave = clave_cache(texto, modelo, version_prompt, origen)
+        ahora = time.time()
+        with self._lock:
+            conexion = self._conectar()
+            fila = conexion.execute('SELECT valor, creado FROM respuestas WHERE clave = ?', (clave,)).fetchone()
+            if fila is None:
+                self.stats['fallos'] += 1
+                return None
+
+            valor, creado = fila
+            if ahora - creado > self.ttl_segundos:
+                conexion.execute('DELETE FROM respuestas WHERE clave = ?', (clave,))
+                conexion.commit()
+                self.stats['vencidas'] += 1
+                self.stats['fallos'] += 1
+                return None
+
+            conexion.execute('UPDATE respuestas SET usado = ?, aciertos = aciertos + 1 WHERE clave = ?',
+                             (ahora, clave))
+            conexion.commit()
+            self.stats['aciertos'] += 1
+        return json.loads(valor)
+
+    def guardar(self, texto: str, modelo: str, version_prompt: str, valor: Any, origen: str = '') -> None:
+        """Guarda un valor serializable a JSON y aplica el límite de entradas."""
+        ahora = time.time()
+        fila = (clave_cache(texto, modelo, version_prompt, origen), modelo, version_prompt,
+                normalizar_texto(texto), json.dumps(valor, ensure_ascii=False), ahora, ahora)
+        with self._lock:
+            conexion = self._conectar()
+            conexion.execute("""
+                INSERT OR REPLACE INTO respuestas (clave, modelo, version_prompt, texto, valor, creado, usado)
+                VALUES (?, ?, ?, ?, ?, ?, ?)""", fila)
+            self.stats['guardadas'] += 1
+            self._descartar_excedentes(conexion, ahora)
+            conexion.commit()
+
+    def _descartar_excedentes(self, conexion: sqlite3.Connection, ahora: float) -> None:
+        """Borra las vencidas y, si aún sobran, las usadas hace más tiempo."""
+        vencidas = conexion.execute('DELETE FROM respuestas WHERE creado < ?',
+                                    (ahora - self.ttl_segundos,)).rowcount
+        total = conexion.execute('SELECT COUNT(*) FROM respuestas').fetchone()[0]
+        sobrantes = total - self.max_entradas
+        if sobrantes > 0:
+            conexion.execute("""
+                DELETE FROM respuestas WHERE clave IN (
+                    SELECT clave FROM respuestas ORDER BY usado ASC LIMIT ?
+                )""", (sobrantes,))
+        self.stats['descartadas'] += vencidas + max(0, sobrantes)
+
+    def limpiar(self) -> int:
+        """Borra todas las entradas; retorna cuántas había."""
+        with self._lock:
+            conexion = self._conectar()
+            borradas = conexion.execute('DELETE FROM respuestas').rowcount
+            conexion.commit()
+        return borradas
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conectar().execute('SELECT COUNT(*) FROM respuestas').fetchone()[0]
+
+    def estadisticas(self) -> Dict[str, Any]:
+        """Contadores de este proceso más el tamaño actual del archivo."""
+        consultas = self.stats['aciertos'] + self.stats['fallos']
+        return dict(
+            self.stats,
+            entradas=len(self),
+            tasa_aciertos=round(self.stats['aciertos'] / consultas, 3) if consultas else 0.0,
+            ruta=self.ruta,
+            ttl_segundos=self.ttl_segundos,
+            max_entradas=self.max_entradas
+        )
+
+    def cerrar(self) -> None:
+        with self._lock:
+            if self._conexion is not None:
+                self._conexion.close()
+                self._conexion = None
@@ -7,10 +7,25 @@ en lenguaje natural a perfiles estructurados del sistema de recomendación.
 
 import os
 import json
+import asyncio
 import requests
 from typing import Dict, Any, Optional, List
 from dataclasses import dataclass
 
+try:
+    from .llm_cache import CacheLLM, TTL_SEGUNDOS, MAX_ENTRADAS
+except ImportError:
+    # Importado como módulo suelto (tests y scripts agregan src/ al path)
+    from llm_cache import CacheLLM, TTL_SEGUNDOS, MAX_ENTRADAS
+
+# Versión del prompt de perfiles: cambiarla al modificar _build_prompt invalida el cache
+PROMPT_VERSION = "perfil-v1"
+
+URLS_PROVEEDOR = {
+    "openrouter": "https://openrouter.ai/api/v1",
+    "openai": "https://api.openai.com/v1"
+}
+
 
 @dataclass
 class LLMConfig:
@@ -21,6 +36,9 @@ class LLMConfig:
     base_url: Optional[str] = None
     max_tokens: int = 1000
     temperature: float = 0.1
+    cache_path: Optional[str] = None  # None desactiva el cache persistente
+    cache_ttl_segundos: float = TTL_SEGUNDOS
+    cache_max_entradas: int = MAX_ENTRADAS
 
 
 class LLMIntegration:
@@ -35,6 +53,10 @@ class LLMIntegration:
         """
         self.config = config or self._config_from_env()
         self.session = requests.Session()
+        self.cache = None
+        if self.config.cache_path:
+            self.cache = CacheLLM(self.config.cache_path, self.config.cache_ttl_segundos,
+                                  self.config.cache_max_entradas)
 
         # Configurar headers por defecto
         if self.config.provider == "openrouter":
@@ -54,13 +76,31 @@ class LLMIntegration:
         provider = os.getenv("LLM_PROVIDER", "openrouter")
         api_key = os.getenv("OPENROUTER_API_KEY") or os.getenv("OPENAI_API_KEY")
         model = os.getenv("LLM_MODEL", "openai/gpt-3.5-turbo")
+        # El cache persistente sólo se usa si LLM_CACHE_PATH indica dónde guardarlo
+        cache_path = os.getenv("LLM_CACHE_PATH", "").strip()
+        cache_path = os.path.expanduser(cache_path) if cache_path else None
 
         return LLMConfig(
             provider=provider,
             api_key=api_key,
-            model=model
+            model=model,
+            base_url=os.getenv("LLM_BASE_URL") or None,
+            cache_path=cache_path,
+            cache_ttl_segundos=float(os.getenv("LLM_CACHE_TTL_SEGUNDOS", TTL_SEGUNDOS)),
+            cache_max_entradas=int(os.getenv("LLM_CACHE_MAX_ENTRADAS", MAX_ENTRADAS))
         )
 
+    def _url_chat(self) -> str:
+        """URL de chat completions; base_url reemplaza la del proveedor (proxies, servidores locales)."""
+        base = self.config.base_url or URLS_PROVEEDOR[self.config.provider]
+        return f"{base.rstrip('/')}/chat/completions"
+
+    def _origen_cache(self) -> str:
+        """Proveedor y endpoint efectivo: forman parte de la clave del cache junto al modelo."""
+        # Sin _url_chat: un proveedor desconocido debe llegar al error de "no soportado"
+        base = self.config.base_url or URLS_PROVEEDOR.get(self.config.provider, '')
+        return f"{self.config.provider} {base.rstrip('/')}"
+
     def _build_prompt(self, texto: str) -> str:
         """
         Construye el prompt para el LLM.
@@ -151,11 +191,9 @@ JSON:"""
         except Exception as e:
             raise ValueError(f"Error procesando respuesta: {e}")
 
-    def _call_openrouter(self, prompt: str) -> str:
-        """Realiza llamada a la API de OpenRouter."""
-        url = "https://openrouter.ai/api/v1/chat/completions"
-
-        payload = {
+    def _payload(self, prompt: str) -> Dict[str, Any]:
+        """Cuerpo de la solicitud de chat completions (igual para ambos proveedores)."""
+        return {
             "model": self.config.model,
             "messages": [
                 {
@@ -167,6 +205,11 @@ JSON:"""
             "temperature": self.config.temperature
         }
 
+    def _call_openrouter(self, prompt: str) -> str:
+        """Realiza llamada a la API de OpenRouter."""
+        url = self._url_chat()
+        payload = self._payload(prompt)
+
         try:
             response = self.session.post(url, json=payload, timeout=30)
             response.raise_for_status()
@@ -181,19 +224,8 @@ JSON:"""
 
     def _call_openai(self, prompt: str) -> str:
         """Realiza llamada a la API de OpenAI."""
-        url = "https://api.openai.com/v1/chat/completions"
-
-        payload = {
-            "model": self.config.model,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            "max_tokens": self.config.max_tokens,
-            "temperature": self.config.temperature
-        }
+        url = self._url_chat()
+        payload = self._payload(prompt)
 
         try:
             response = self.session.post(url, json=payload, timeout=30)
@@ -224,6 +256,12 @@ JSON:"""
         if not texto or not texto.strip():
             raise ValueError("El texto de entrada no puede estar vacío")
 
+        # Descripciones ya procesadas con este modelo, prompt y endpoint no llaman al LLM
+        if self.cache is not None:
+            perfil = self.cache.obtener(texto, self.config.model, PROMPT_VERSION, self._origen_cache())
+            if perfil is not None:
+                return perfil
+
         # Construir prompt
         prompt = self._build_prompt(texto)
 
@@ -239,6 +277,10 @@ JSON:"""
             # Parsear respuesta
             perfil = self._parse_llm_response(response_text)
 
+            # Sólo se guardan perfiles del LLM; el perfil básico de respaldo no
+            if self.cache is not None:
+                self.cache.guardar(texto, self.config.model, PROMPT_VERSION, perfil, self._origen_cache())
+
             return perfil
 
         except (ConnectionError, ValueError) as e:
@@ -246,6 +288,36 @@ JSON:"""
             print(f"Advertencia: Error procesando con LLM ({e}). Usando perfil básico.")
             return self._perfil_basico_desde_texto(texto)
 
+    def parsear_perfiles_lote(self, textos: List[str], max_concurrentes: int = 8,
+                              timeout_segundos: float = 30.0, reintentos: int = 3) -> List[Dict[str, Any]]:
+        """
+        Convierte varias descripciones a perfiles con llamadas concurrentes al LLM.
+
+        Hace hasta max_concurrentes llamadas a la vez, cada una con su
+        timeout y reintentos. Usa el mismo cache y el mismo perfil básico de
+        respaldo que parsear_perfil_desde_texto. Desde código asíncrono usar
+        directamente ClienteLLMAsync.parsear_perfiles_lote.
+
+        Args:
+            textos: Descripciones de los prospectos
+
+        Returns:
+            Lista de perfiles en el mismo orden que los textos
+        """
+        if self.config.provider not in URLS_PROVEEDOR:
+            raise ValueError(f"Proveedor no soportado: {self.config.provider}")
+
+        try:
+            from .llm_async import ClienteLLMAsync
+        except ImportError:
+            from llm_async import ClienteLLMAsync
+
+        async def procesar():
+            async with ClienteLLMAsync(self, max_concurrentes, reintentos, timeout_segundos) as cliente:
+                return await cliente.parsear_perfiles_lote(textos)
+
+        return asyncio.run(procesar())
+
     def _perfil_basico_desde_texto(self, texto: str) -> Dict[str, Any]:
         """
         Genera un perfil básico usando reglas simples cuando el LLM falla.
@@ -360,5 +432,8 @@ JSON:"""
             "model": self.config.model,
             "api_key_configurada": bool(self.config.api_key),
             "max_tokens": self.config.max_tokens,
-            "temperature": self.config.temperature
+            "temperature": self.config.temperature,
+            "base_url": self.config.base_url,
+            "prompt_version": PROMPT_VERSION,
+            "cache": self.cache.estadisticas() if self.cache is not None else None
         }
\ No newline at end of file
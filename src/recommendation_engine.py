@@ -5,7 +5,7 @@ Este módulo contiene la lógica para calcular compatibilidad entre
 perfiles de prospectos y propiedades disponibles.
 """
 
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Callable
 import numpy as np
 import pandas as pd
 from functools import lru_cache
@@ -35,6 +35,8 @@ class RecommendationEngine:
             'cache_hits': 0,
             'tiempo_total': 0.0
         }
+        # Callback opcional (etapa, segundos) para medir cada etapa de generar_recomendaciones
+        self.observador_etapas: Optional[Callable[[str, float], None]] = None
 
     def cargar_propiedades(self, propiedades: List[Dict[str, Any]]):
         """Carga las propiedades disponibles en el motor."""
@@ -52,7 +54,12 @@ class RecommendationEngine:
         """Genera una clave única para el cache."""
         # Usar IDs o hashes para crear clave única
         perfil_id = str(hash(str(sorted(perfil.items()))))
-        propiedad_id = propiedad.get('id', str(hash(str(sorted(propiedad.items())))))
+        # El respaldo se evalúa solo sin id: recorrer items() en un RegistroCompacto
+        # lee todas las descripciones diferidas del archivo lateral
+        if 'id' in propiedad:
+            propiedad_id = propiedad['id']
+        else:
+            propiedad_id = str(hash(str(sorted(propiedad.items()))))
         return f"{funcion}:{perfil_id}:{propiedad_id}"
 
     @lru_cache(maxsize=1000)
@@ -433,21 +440,28 @@ class RecommendationEngine:
             Lista de propiedades recomendadas con su compatibilidad
         """
         inicio_tiempo = time.time()
+        inicio_etapa = time.perf_counter()
 
         # Pre-filtrado rápido para reducir cálculos
         propiedades_filtradas = self._pre_filtrar_propiedades(perfil, umbral_minimo)
+        fin_prefiltro = time.perf_counter()
 
         recomendaciones = []
+        tiempo_justificacion = 0.0
 
         # Calcular compatibilidad solo para propiedades pre-filtradas
         for propiedad in propiedades_filtradas:
             compatibilidad = self.calcular_compatibilidad(perfil, propiedad)
             if compatibilidad >= umbral_minimo:
+                inicio_justificacion = time.perf_counter()
+                justificacion = self._generar_justificacion(perfil, propiedad, compatibilidad)
+                tiempo_justificacion += time.perf_counter() - inicio_justificacion
                 recomendaciones.append({
                     'propiedad': propiedad,
                     'compatibilidad': compatibilidad,
-                    'justificacion': self._generar_justificacion(perfil, propiedad, compatibilidad)
+                    'justificacion': justificacion
                 })
+        fin_scoring = time.perf_counter()
 
         # Ordenar por compatibilidad (descendente) - usar numpy para mejor rendimiento
         if recomendaciones:
@@ -459,6 +473,12 @@ class RecommendationEngine:
         if hasattr(self, 'stats'):
             self.stats['tiempo_total'] += tiempo_total
 
+        if self.observador_etapas:
+            self.observador_etapas('prefiltro', fin_prefiltro - inicio_etapa)
+            self.observador_etapas('scoring', fin_scoring - fin_prefiltro - tiempo_justificacion)
+            self.observador_etapas('justificacion', tiempo_justificacion)
+            self.observador_etapas('top_k', time.perf_counter() - fin_scoring)
+
         return recomendaciones[:limite]
 
     def _pre_filtrar_propiedades(self, perfil: Dict[str, Any], umbral_minimo: float) -> List[Dict[str, Any]]:
@@ -3,7 +3,7 @@ Motor de recomendación mejorado con georreferenciación real y guía urbana
 Implementa cálculo de distancias reales entre propiedades y servicios
 """
 
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Dict, List, Any, Optional, Tuple, Callable
 import numpy as np
 import pandas as pd
 import json
@@ -40,6 +40,11 @@ class RecommendationEngineMejorado:
             'tiempo_total': 0.0,
             'distancias_calculadas': 0
         }
+        # Callback opcional (etapa, segundos) para medir cada etapa de generar_recomendaciones;
+        # 'espacial' suma las búsquedas de servicios cercanos de toda la llamada
+        self.observador_etapas: Optional[Callable[[str, float], None]] = None
+        # Tiempo espacial acumulado por la llamada en curso de cada hilo
+        self._medicion = threading.local()
 
     def cargar_propiedades(self, propiedades: List[Dict[str, Any]]):
         """Carga las propiedades disponibles en el motor."""
@@ -90,7 +95,12 @@ class RecommendationEngineMejorado:
     def _generar_cache_key(self, perfil: Dict[str, Any], propiedad: Dict[str, Any], funcion: str) -> str:
         """Genera una clave única para el cache."""
         perfil_id = str(hash(str(sorted(perfil.items()))))
-        propiedad_id = propiedad.get('id', str(hash(str(sorted(propiedad.items())))))
+        # El respaldo se evalúa solo sin id: recorrer items() en un RegistroCompacto
+        # lee todas las descripciones diferidas del archivo lateral
+        if 'id' in propiedad:
+            propiedad_id = propiedad['id']
+        else:
+            propiedad_id = str(hash(str(sorted(propiedad.items()))))
         return f"{funcion}:{perfil_id}:{propiedad_id}"
 
     @staticmethod
@@ -126,6 +136,9 @@ class RecommendationEngineMejorado:
         if not propiedad_coords or 'lat' not in propiedad_coords or 'lng' not in propiedad_coords:
             return servicios_cercanos
 
+        midiendo = getattr(self._medicion, 'espacial', None) is not None
+        inicio = time.perf_counter() if midiendo else 0.0
+
         prop_lat = propiedad_coords['lat']
         prop_lng = propiedad_coords['lng']
 
@@ -145,7 +158,10 @@ class RecommendationEngineMejorado:
                         })
 
         self.stats['distancias_calculadas'] += 1
-        return sorted(servicios_cercanos, key=lambda x: x['distancia_km'])
+        servicios_cercanos.sort(key=lambda x: x['distancia_km'])
+        if midiendo:
+            self._medicion.espacial += time.perf_counter() - inicio
+        return servicios_cercanos
 
     def _mapear_necesidades_a_categorias(self, necesidades: List[str]) -> List[str]:
         """
@@ -511,6 +527,10 @@ class RecommendationEngineMejorado:
         if not self.propiedades:
             return []
 
+        inicio_etapa = time.perf_counter()
+        if self.observador_etapas:
+            self._medicion.espacial = 0.0
+
         # Optimización: Pre-filtrar propiedades por zona preferida
         zona_preferida = perfil.get('preferencias', {}).get('ubicacion', '').lower()
         propiedades_a_evaluar = self.propiedades
@@ -530,24 +550,39 @@ class RecommendationEngineMejorado:
             else:
                 print(f"No se encontraron propiedades en '{zona_preferida}', evaluando todas {len(self.propiedades)}")
 
+        fin_prefiltro = time.perf_counter()
+
         # Calcular compatibilidad para cada propiedad
         recomendaciones = []
+        tiempo_justificacion = 0.0
         for propiedad in propiedades_a_evaluar:
             compatibilidad = self.calcular_compatibilidad(perfil, propiedad)
 
             if compatibilidad >= (umbral_minimo * 100):  # Convertir umbral a porcentaje
                 # Generar justificación mejorada
+                inicio_justificacion = time.perf_counter()
                 justificacion = self._generar_justificacion_mejorada(perfil, propiedad, compatibilidad)
+                servicios_resumen = self._obtener_resumen_servicios_cercanos(perfil, propiedad)
+                tiempo_justificacion += time.perf_counter() - inicio_justificacion
 
                 recomendaciones.append({
                     'propiedad': propiedad,
                     'compatibilidad': compatibilidad,
                     'justificacion': justificacion,
-                    'servicios_cercanos': self._obtener_resumen_servicios_cercanos(perfil, propiedad)
+                    'servicios_cercanos': servicios_resumen
                 })
+        fin_scoring = time.perf_counter()
 
         # Ordenar por compatibilidad y limitar resultados
         recomendaciones.sort(key=lambda x: x['compatibilidad'], reverse=True)
+
+        if self.observador_etapas:
+            self.observador_etapas('prefiltro', fin_prefiltro - inicio_etapa)
+            self.observador_etapas('scoring', fin_scoring - fin_prefiltro - tiempo_justificacion)
+            self.observador_etapas('justificacion', tiempo_justificacion)
+            self.observador_etapas('top_k', time.perf_counter() - fin_scoring)
+            self.observador_etapas('espacial', self._medicion.espacial)
+            self._medicion.espacial = None
         return recomendaciones[:limite]
 
     def _generar_justificacion_mejorada(self, perfil: Dict[str, Any], propiedad: Dict[str, Any], compatibilidad: float) -> str:
@@ -0,0 +1,1065 @@
+"""
+Pruebas del servidor API con el cliente de pruebas de Flask.
+"""
+
+import json
+import threading
+import time
+import pytest
+import sys
+import os
+
+# Agregar el directorio api al path para importar el servidor
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'api'))
+
+import server
+from catalogo import Catalogo, construir_catalogo
+import metricas
+import trabajos
+from trabajos import Trabajo
+
+
+RUTA_PROPIEDADES = os.path.join(os.path.dirname(__file__), '..', 'data', 'propiedades_ampliado.json')
+RUTA_GUIA = os.path.join(os.path.dirname(__file__), '..', 'data', 'guia_urbana_municipal.json')
+
+
+@pytest.fixture(scope='module')
+def cliente():
+    """Cliente de pruebas con el catálogo ampliado cargado en el arranque."""
+    server.estado_carga['estado'] = 'pendiente'
+    assert server.inicializar_datos(RUTA_PROPIEDADES, RUTA_GUIA)
+    server.app.config['TESTING'] = True
+    return server.app.test_client()
+
+
+class TestArranque:
+    """Pruebas de la carga inicial y del endpoint de disponibilidad."""
+
+    def test_ready_tras_inicializar(self, cliente):
+        """Después de la carga /api/ready responde 200 con el catálogo."""
+        respuesta = cliente.get('/api/ready')
+        assert respuesta.status_code == 200
+        datos = respuesta.get_json()
+        assert datos['ready'] is True
+        assert datos['estado'] == 'listo'
+        assert datos['total_propiedades'] == 100
+
+    def test_ready_mientras_carga(self, cliente, monkeypatch):
+        """Durante la carga /api/ready responde 503 y /api/health sigue en 200."""
+        monkeypatch.setitem(server.estado_carga, 'estado', 'cargando')
+        respuesta = cliente.get('/api/ready')
+        assert respuesta.status_code == 503
+        assert respuesta.get_json()['estado'] == 'cargando'
+        assert cliente.get('/api/health').status_code == 200
+
+    def test_inicializar_es_idempotente(self, cliente):
+        """Una segunda inicialización no recarga el catálogo."""
+        version = server.gestor_catalogo.catalogo.version
+        assert server.inicializar_datos(RUTA_PROPIEDADES, RUTA_GUIA)
+        assert server.gestor_catalogo.catalogo.version == version
+
+    def test_error_de_carga(self, monkeypatch):
+        """Un archivo inexistente deja el estado en error y /api/ready en 503."""
+        monkeypatch.setattr(server, 'gestor_catalogo', server.GestorCatalogo(RUTA_PROPIEDADES, RUTA_GUIA))
+        monkeypatch.setattr(server, 'estado_carga', dict(server.estado_carga, estado='pendiente'))
+        assert not server.inicializar_datos('/no/existe.json', RUTA_GUIA)
+
+        respuesta = server.app.test_client().get('/api/ready')
+        assert respuesta.status_code == 503
+        assert respuesta.get_json()['estado'] == 'error'
+
+    def test_busqueda_sin_hook_de_carga(self, cliente):
+        """Las búsquedas usan los datos cargados en el arranque."""
+        respuesta = cliente.post('/api/buscar', json={'zona': 'Equipetrol', 'limite': 3})
+        assert respuesta.status_code == 200
+        datos = respuesta.get_json()
+        assert datos['success'] is True
+        assert len(datos['propiedades']) <= 3
+        assert all(p['zona'] == 'Equipetrol' for p in datos['propiedades'])
+
+    def test_zonas_que_no_son_texto(self, cliente):
+        """Los elementos de zona que no son texto no coinciden, sin error 400."""
+        respuesta = cliente.post('/api/buscar', json={'zona': ['Equipetrol', 5], 'limite': 3})
+        assert respuesta.status_code == 200
+        assert all(p['zona'] == 'Equipetrol' for p in respuesta.get_json()['propiedades'])
+
+        respuesta = cliente.post('/api/buscar', json={'zona': [5]})
+        assert respuesta.status_code == 200
+        assert respuesta.get_json()['propiedades'] == []
+
+    @pytest.mark.parametrize('valor', ['abc', [1], {'a': 1}])
+    def test_filtro_numerico_invalido(self, cliente, valor):
+        """Un límite que no es número es un error de la solicitud, no del servidor."""
+        respuesta = cliente.post('/api/buscar', json={'precio_max': valor})
+        assert respuesta.status_code == 400
+        datos = respuesta.get_json()
+        assert datos['success'] is False
+        assert "precio_max" in datos['error']
+
+
+class TestRecargaCatalogo:
+    """Pruebas de la recarga en caliente del catálogo."""
+
+    @pytest.fixture
+    def ruta_catalogo(self, tmp_path):
+        """Copia del catálogo ampliado en un directorio temporal."""
+        with open(RUTA_PROPIEDADES, 'r', encoding='utf-8') as f:
+            propiedades = json.load(f)
+        ruta = tmp_path / 'propiedades.json'
+        ruta.write_text(json.dumps(propiedades), encoding='utf-8')
+        return ruta, propiedades
+
+    @pytest.fixture
+    def gestor(self, ruta_catalogo, monkeypatch):
+        """Gestor propio cargado con la copia temporal, con token de administración."""
+        ruta, _ = ruta_catalogo
+        gestor = server.GestorCatalogo(str(ruta), RUTA_GUIA)
+        gestor.cargar()
+        monkeypatch.setattr(server, 'gestor_catalogo', gestor)
+        monkeypatch.setattr(server, 'ADMIN_TOKEN', 'secreto')
+        yield gestor
+        gestor.detener_vigilancia()
+
+    def test_requiere_token(self, gestor, monkeypatch):
+        """Sin token válido la recarga se rechaza."""
+        cliente = server.app.test_client()
+        assert cliente.post('/api/admin/recargar').status_code == 403
+        assert cliente.post('/api/admin/recargar', headers={'X-Admin-Token': 'otro'}).status_code == 403
+
+        monkeypatch.setattr(server, 'ADMIN_TOKEN', '')
+        assert cliente.post('/api/admin/recargar', headers={'X-Admin-Token': ''}).status_code == 403
+
+    def test_recarga_publica_version_nueva(self, gestor, ruta_catalogo):
+        """La recarga publica el archivo nuevo; quien tenía la versión anterior la sigue usando."""
+        ruta, propiedades = ruta_catalogo
+        anterior = gestor.catalogo
+        pagina = anterior.sistema.buscar_pagina({}, limite=10)
+
+        ruta.write_text(json.dumps(propiedades[:40]), encoding='utf-8')
+        cliente = server.app.test_client()
+        respuesta = cliente.post('/api/admin/recargar?esperar=1', headers={'X-Admin-Token': 'secreto'})
+        assert respuesta.status_code == 200
+        datos = respuesta.get_json()
+        assert datos['version_catalogo'] != datos['version_anterior']
+
+        assert cliente.get('/api/health').get_json()['total_propiedades'] == 40
+        # Un request en curso termina con la versión que tomó al empezar
+        assert len(anterior.sistema.propiedades) == 100
+        assert len(anterior.sistema.buscar_pagina({}, limite=10, cursor=pagina['siguiente_cursor'])['propiedades']) == 10
+
+        # Los cursores de la versión anterior ya no son válidos
+        respuesta = cliente.post('/api/buscar', json={'cursor': pagina['siguiente_cursor']})
+        assert respuesta.status_code == 400
+
+    def test_error_conserva_version_vigente(self, gestor, ruta_catalogo):
+        """Si el archivo nuevo es inválido se mantiene el catálogo publicado."""
+        ruta, _ = ruta_catalogo
+        vigente = gestor.catalogo
+        ruta.write_text('[{"id": ', encoding='utf-8')
+
+        respuesta = server.app.test_client().post('/api/admin/recargar?esperar=1',
+                                                  headers={'X-Admin-Token': 'secreto'})
+        assert respuesta.status_code == 500
+        assert gestor.catalogo is vigente
+        assert gestor.estado_recarga['error']
+
+    def test_una_recarga_a_la_vez(self, gestor):
+        """Mientras hay una recarga en curso no se inicia otra."""
+        gestor._lock_recarga.acquire()
+        try:
+            respuesta = server.app.test_client().post('/api/admin/recargar',
+                                                      headers={'X-Admin-Token': 'secreto'})
+            assert respuesta.status_code == 409
+        finally:
+            gestor._lock_recarga.release()
+
+    def test_vigilancia_de_archivo(self, gestor, ruta_catalogo):
+        """Al cambiar el archivo la vigilancia recarga el catálogo sola."""
+        ruta, propiedades = ruta_catalogo
+        version = gestor.catalogo.version
+        gestor.vigilar_archivo(intervalo=0.05)
+
+        ruta.write_text(json.dumps(propiedades[:10]), encoding='utf-8')
+        os.utime(ruta, (time.time() + 5, time.time() + 5))
+
+        limite = time.time() + 10
+        while gestor.catalogo.version == version and time.time() < limite:
+            time.sleep(0.05)
+        assert len(gestor.catalogo.sistema.propiedades) == 10
+
+    def test_version_segun_contenido(self, gestor, ruta_catalogo):
+        """Dos workers con los mismos archivos publican la misma versión; con otros datos, otra."""
+        ruta, propiedades = ruta_catalogo
+        otro = server.GestorCatalogo(str(ruta), RUTA_GUIA)
+        assert otro.cargar().version == gestor.catalogo.version
+
+        # Recargar sin cambios conserva la versión (y los cursores y ETags emitidos)
+        version = gestor.catalogo.version
+        assert gestor.recargar(esperar=True)
+        assert gestor.catalogo.version == version
+
+        ruta.write_text(json.dumps(propiedades[:30]), encoding='utf-8')
+        assert otro.cargar().version != version
+
+    def test_recarga_llega_a_otro_worker(self, gestor, ruta_catalogo):
+        """Otro gestor del mismo archivo (otro worker) carga los datos nuevos con su vigilancia."""
+        ruta, propiedades = ruta_catalogo
+        otro = server.GestorCatalogo(str(ruta), RUTA_GUIA)
+        otro.cargar()
+        gestor.vigilar_archivo(intervalo=0.05)
+        otro.vigilar_archivo(intervalo=0.05)
+        try:
+            ruta.write_text(json.dumps(propiedades[:30]), encoding='utf-8')
+            os.utime(ruta, (time.time() + 5, time.time() + 5))
+            mtime = os.path.getmtime(ruta)
+            assert gestor.recargar(esperar=True)
+
+            limite = time.time() + 10
+            while len(otro.catalogo.sistema.propiedades) != 30 and time.time() < limite:
+                time.sleep(0.05)
+            assert len(otro.catalogo.sistema.propiedades) == 30
+            assert otro.catalogo.version == gestor.catalogo.version
+
+            # La recarga no toca el archivo y quien la inició no la repite
+            time.sleep(0.2)
+            assert os.path.getmtime(ruta) == mtime
+            assert gestor.estado_recarga['recargas'] == 1
+        finally:
+            otro.detener_vigilancia()
+
+    @pytest.mark.parametrize('vigilar, alcance', [(False, 'este_worker'), (True, 'todos_los_workers')])
+    def test_alcance_de_la_recarga(self, gestor, vigilar, alcance):
+        """La respuesta indica si la recarga llega a los demás workers."""
+        if vigilar:
+            gestor.vigilar_archivo(intervalo=30)
+
+        respuesta = server.app.test_client().post('/api/admin/recargar?esperar=1',
+                                                  headers={'X-Admin-Token': 'secreto'})
+        assert respuesta.get_json()['alcance'] == alcance
+        assert respuesta.get_json()['intervalo_vigilancia'] == (30 if vigilar else None)
+
+    @pytest.mark.parametrize('entorno, workers, intervalo', [
+        (None, 1, 0), (None, 4, server.VIGILANCIA_WORKERS_SEGUNDOS), ('0', 4, 0), ('12', 1, 12),
+    ])
+    def test_vigilancia_por_defecto_con_varios_workers(self, monkeypatch, entorno, workers, intervalo):
+        """Con varios workers se vigila salvo que CITRINO_VIGILAR_SEGUNDOS diga otra cosa."""
+        if entorno is None:
+            monkeypatch.delenv('CITRINO_VIGILAR_SEGUNDOS', raising=False)
+            monkeypatch.setattr(server, 'INTERVALO_VIGILANCIA', 0.0)
+        else:
+            monkeypatch.setenv('CITRINO_VIGILAR_SEGUNDOS', entorno)
+            monkeypatch.setattr(server, 'INTERVALO_VIGILANCIA', float(entorno))
+        assert server.intervalo_vigilancia(workers) == intervalo
+
+
+class TestCacheHttp:
+    """Pruebas de ETag y peticiones condicionales en endpoints de solo lectura."""
+
+    @pytest.mark.parametrize('ruta', ['/api/estadisticas', '/api/zonas'])
+    def test_etag_y_304(self, cliente, ruta, monkeypatch):
+        """Con If-None-Match vigente se responde 304 sin reconstruir la respuesta."""
+        respuesta = cliente.get(ruta)
+        assert respuesta.status_code == 200
+        assert respuesta.get_json()['success'] is True
+        etag = respuesta.headers['ETag']
+        assert etag.startswith('"v')
+        assert 'max-age' in respuesta.headers['Cache-Control']
+
+        def no_construir(catalogo):
+            raise AssertionError("no debe reconstruirse")
+        monkeypatch.setattr(server, 'construir_estadisticas', no_construir)
+        monkeypatch.setattr(server, 'construir_zonas', no_construir)
+
+        condicional = cliente.get(ruta, headers={'If-None-Match': etag})
+        assert condicional.status_code == 304
+        assert condicional.data == b''
+        assert condicional.headers['ETag'] == etag
+
+        repetida = cliente.get(ruta)
+        assert repetida.status_code == 200
+        assert repetida.data == respuesta.data
+
+    def test_etag_cambia_con_la_version(self, cliente):
+        """Una versión nueva del catálogo invalida el ETag anterior."""
+        etag = cliente.get('/api/zonas').headers['ETag']
+        catalogo = server.gestor_catalogo.catalogo
+        nuevo = Catalogo(catalogo.sistema, catalogo.motor_recomendacion, catalogo.motor_mejorado)
+        server.gestor_catalogo.catalogo = nuevo
+        try:
+            catalogo.sistema.version_catalogo += 1
+            respuesta = cliente.get('/api/zonas', headers={'If-None-Match': etag})
+            assert respuesta.status_code == 200
+            assert respuesta.headers['ETag'] != etag
+        finally:
+            catalogo.sistema.version_catalogo -= 1
+            server.gestor_catalogo.catalogo = catalogo
+
+
+class TestCoalescencia:
+    """Pruebas de la coalescencia de recomendaciones idénticas concurrentes."""
+
+    def _esperar_coalescidas(self, coalescedor, cantidad):
+        limite = time.time() + 5
+        while coalescedor.stats['coalescidas'] < cantidad and time.time() < limite:
+            time.sleep(0.01)
+
+    def test_solicitudes_identicas_comparten_calculo(self, cliente, monkeypatch):
+        """Cinco solicitudes idénticas concurrentes ejecutan el motor una vez."""
+        coalescedor = server.Coalescedor()
+        monkeypatch.setattr(server, 'coalescedor', coalescedor)
+        llamadas = []
+
+        def calculo_lento(catalogo, data):
+            llamadas.append(data)
+            self._esperar_coalescidas(coalescedor, 4)
+            return {'success': True, 'recomendaciones': [], 'total_recomendaciones': 0}
+        monkeypatch.setattr(server, 'calcular_recomendaciones', calculo_lento)
+
+        perfil = {'presupuesto_max': 200000, 'adultos': 2, 'necesidades': ['seguridad']}
+        respuestas = []
+
+        def solicitar(cuerpo):
+            respuestas.append(server.app.test_client().post('/api/recomendar', json=cuerpo))
+
+        # Mismo perfil con las claves en distinto orden
+        cuerpos = [perfil] * 4 + [dict(reversed(list(perfil.items())))]
+        hilos = [threading.Thread(target=solicitar, args=(c,)) for c in cuerpos]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        assert len(llamadas) == 1
+        assert all(r.status_code == 200 for r in respuestas)
+        assert coalescedor.estadisticas() == {'ejecuciones': 1, 'coalescidas': 4, 'en_vuelo': 0}
+        assert cliente.get('/api/health').get_json()['coalescencia']['coalescidas'] == 4
+
+    def test_error_se_comparte(self):
+        """Si el cálculo falla, todas las solicitudes que esperaban reciben el error."""
+        coalescedor = server.Coalescedor()
+        errores = []
+
+        def falla():
+            self._esperar_coalescidas(coalescedor, 2)
+            raise ValueError("perfil inválido")
+
+        def ejecutar():
+            try:
+                coalescedor.ejecutar('clave', falla)
+            except ValueError as e:
+                errores.append(str(e))
+
+        hilos = [threading.Thread(target=ejecutar) for _ in range(3)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        assert errores == ['perfil inválido'] * 3
+        assert coalescedor.estadisticas()['en_vuelo'] == 0
+
+    def test_solicitudes_distintas_no_se_coalescen(self, cliente):
+        """Cuerpos distintos producen cálculos distintos."""
+        catalogo = server.gestor_catalogo.catalogo
+        assert (server.clave_solicitud('recomendar', catalogo, {'adultos': 1}) !=
+                server.clave_solicitud('recomendar', catalogo, {'adultos': 2}))
+        assert (server.clave_solicitud('recomendar', catalogo, {'a': 1, 'b': 2}) ==
+                server.clave_solicitud('recomendar', catalogo, {'b': 2, 'a': 1}))
+
+
+class TestMetricas:
+    """Pruebas del endpoint de métricas en formato Prometheus."""
+
+    def test_latencias_por_endpoint_y_etapa(self, cliente):
+        """Tras atender solicitudes se exponen histogramas y cuantiles por endpoint y etapa."""
+        cliente.post('/api/buscar', json={'zona': 'Equipetrol', 'limite': 5})
+        cliente.post('/api/recomendar', json={'presupuesto_max': 250000, 'adultos': 2, 'limite': 3})
+        cliente.post('/api/recomendar-mejorado', json={'presupuesto_max': 250000, 'adultos': 2,
+                                                       'necesidades': ['salud'], 'limite': 3})
+
+        respuesta = cliente.get('/api/metricas')
+        assert respuesta.status_code == 200
+        assert respuesta.content_type.startswith('text/plain')
+        texto = respuesta.get_data(as_text=True)
+        pid = f'pid="{os.getpid()}"'
+
+        assert '# TYPE citrino_solicitud_duracion_segundos histogram' in texto
+        assert f'citrino_solicitud_duracion_segundos_bucket{{endpoint="buscar_propiedades",{pid},le="+Inf"}}' in texto
+        assert (f'citrino_solicitud_duracion_segundos_ventana{{endpoint="recomendar_propiedades",{pid},'
+                f'quantile="0.99"}}') in texto
+        for motor in ('original', 'mejorado'):
+            for etapa in ('prefiltro', 'scoring', 'justificacion', 'top_k'):
+                assert f'citrino_etapa_duracion_segundos_count{{etapa="{etapa}",motor="{motor}",{pid}}}' in texto
+        assert 'etapa="serializacion",motor="api"' in texto
+        assert 'etapa="consulta",motor="busqueda"' in texto
+        assert f'citrino_catalogo_propiedades{{{pid}}} 100' in texto
+        assert f'citrino_cache_tasa_aciertos{{cache="busqueda",{pid}}}' in texto
+        # La propia solicitud de métricas está en curso al exportar
+        assert f'citrino_solicitudes_en_curso{{{pid}}} 1' in texto
+
+    def test_muestras_identifican_al_worker(self):
+        """Cada muestra lleva el pid y la ayuda aclara que el valor es de un solo worker."""
+        registro = server.RegistroMetricas()
+        registro.observar('prueba_segundos', 0.01, ayuda='Prueba', endpoint='x')
+        registro.incrementar('prueba_total', ayuda='Contador')
+        lineas = registro.exportar([('prueba_medidor', 'Medidor', {}, 1)]).splitlines()
+
+        muestras = [linea for linea in lineas if not linea.startswith('#')]
+        assert muestras and all(f'pid="{os.getpid()}"' in linea for linea in muestras)
+        ayudas = [linea for linea in lineas if linea.startswith('# HELP')]
+        assert all(linea.endswith(metricas.AYUDA_POR_PROCESO) for linea in ayudas)
+
+    def test_etapa_espacial(self, tmp_path):
+        """El motor mejorado reporta el tiempo espacial una vez por llamada."""
+        guia = tmp_path / 'guia.json'
+        guia.write_text(json.dumps({'servicios_consolidados': [{
+            'nombre': 'Hospital', 'categoria_principal': 'salud',
+            'coordenadas': {'lat': -17.7443, 'lng': -63.1588}
+        }]}), encoding='utf-8')
+
+        etapas = []
+        catalogo = construir_catalogo(RUTA_PROPIEDADES, str(guia),
+                                             observador_etapas=lambda *args: etapas.append(args))
+        catalogo.motor_mejorado.generar_recomendaciones(
+            {'presupuesto': {'min': 0, 'max': 300000}, 'necesidades': ['hospital']}, limite=3)
+
+        motores_etapas = {(motor, etapa) for motor, etapa, _ in etapas}
+        assert [etapa for motor, etapa, _ in etapas if motor == 'mejorado'].count('espacial') == 1
+        assert catalogo.motor_mejorado.stats['distancias_calculadas'] > 1
+        assert ('mejorado', 'scoring') in motores_etapas
+        assert all(segundos >= 0 for _, _, segundos in etapas)
+
+    def test_cuantiles(self):
+        """Los cuantiles se calculan sobre las observaciones, no como promedio."""
+        registro = server.RegistroMetricas()
+        for i in range(1, 101):
+            registro.observar('prueba_segundos', i / 1000, endpoint='x')
+        cuantiles = registro.cuantiles('prueba_segundos', endpoint='x')
+        assert cuantiles[0.5] == pytest.approx(0.0505)
+        assert cuantiles[0.99] == pytest.approx(0.09901)
+
+        texto = registro.exportar()
+        pid = f'pid="{os.getpid()}"'
+        assert f'citrino_prueba_segundos_bucket{{endpoint="x",{pid},le="0.05"}} 50' in texto
+        assert f'citrino_prueba_segundos_count{{endpoint="x",{pid}}} 100' in texto
+
+
+class TestPerfilado:
+    """Pruebas del perfilado bajo demanda de requests individuales."""
+
+    @pytest.fixture
+    def admin(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(server, 'ADMIN_TOKEN', 'secreto')
+        monkeypatch.setattr(server, 'perfilador', server.Perfilador(str(tmp_path)))
+        return {'X-Admin-Token': 'secreto', 'X-Perfilar': '1'}
+
+    def test_requiere_token(self, cliente, admin):
+        """Sin token de administración la marca de perfilado se rechaza."""
+        respuesta = cliente.post('/api/buscar?perfilar=1', json={'zona': 'Equipetrol'})
+        assert respuesta.status_code == 403
+
+    def test_sin_marca_no_perfila(self, cliente, admin, tmp_path):
+        """Sin la marca la respuesta no cambia y no se escribe ningún perfil."""
+        respuesta = cliente.post('/api/buscar', json={'zona': 'Equipetrol'},
+                                 headers={'X-Admin-Token': 'secreto'})
+        assert respuesta.status_code == 200
+        assert 'perfilado' not in respuesta.get_json()
+        assert 'X-Perfil-Archivo' not in respuesta.headers
+        assert list(tmp_path.iterdir()) == []
+
+    @pytest.mark.parametrize('ruta,cuerpo', [
+        ('/api/buscar', {'zona': 'Equipetrol', 'limite': 5}),
+        ('/api/recomendar', {'presupuesto_max': 250000, 'adultos': 2, 'limite': 3}),
+        ('/api/recomendar-mejorado', {'presupuesto_max': 250000, 'adultos': 2, 'limite': 3}),
+    ])
+    def test_perfil_en_respuesta_y_archivo(self, cliente, admin, tmp_path, ruta, cuerpo):
+        """La respuesta incluye las funciones más costosas y el .pstats queda guardado."""
+        import pstats
+
+        respuesta = cliente.post(ruta, json=cuerpo, headers=admin)
+        assert respuesta.status_code == 200
+        datos = respuesta.get_json()
+        assert datos['success'] is True
+
+        perfilado = datos['perfilado']
+        top = perfilado['top_funciones']
+        assert top and perfilado['total_llamadas'] > 0
+        acumulados = [fila['tiempo_acumulado'] for fila in top]
+        assert acumulados == sorted(acumulados, reverse=True)
+
+        archivo = tmp_path / respuesta.headers['X-Perfil-Archivo']
+        assert str(archivo) == perfilado['archivo']
+        assert pstats.Stats(str(archivo)).total_calls == perfilado['total_llamadas']
+
+    def test_un_perfil_a_la_vez(self, cliente, admin):
+        """Mientras otro request se perfila se responde 409."""
+        server.perfilador._lock.acquire()
+        try:
+            respuesta = cliente.post('/api/buscar', json={'zona': 'Equipetrol'}, headers=admin)
+        finally:
+            server.perfilador._lock.release()
+        assert respuesta.status_code == 409
+
+
+class TestSolicitudesLentas:
+    """Pruebas del log de solicitudes lentas y su reproducción."""
+
+    @pytest.fixture
+    def registro(self, monkeypatch, tmp_path):
+        registro = server.RegistroSolicitudesLentas(str(tmp_path / 'lentas.jsonl'), umbral_segundos=1e-9)
+        monkeypatch.setattr(server, 'registro_lentas', registro)
+        yield registro
+        registro.cerrar()
+
+    def test_registra_solicitud_reproducible(self, cliente, registro):
+        """El registro guarda cuerpo, catálogo, etapas y caches."""
+        from solicitudes_lentas import leer_registros
+
+        cuerpo = {'presupuesto_max': 250000, 'adultos': 2, 'limite': 3}
+        assert cliente.post('/api/recomendar', json=cuerpo).status_code == 200
+
+        registros = list(leer_registros([registro.ruta]))
+        assert len(registros) == 1
+        linea = registros[0]
+        assert linea['ruta'] == '/api/recomendar'
+        assert linea['payload'] == cuerpo
+        assert linea['codigo'] == 200
+        assert linea['catalogo']['version'] == server.gestor_catalogo.catalogo.version
+        assert linea['catalogo']['propiedades'] == 100
+        assert 'original.scoring' in linea['etapas']
+        assert 'api.serializacion' in linea['etapas']
+        assert set(linea['cache']) == {'busqueda', 'motor_original', 'motor_mejorado', 'coalescencia'}
+        assert linea['consulta']['perfil']['presupuesto']['max'] == 250000
+        assert linea['consulta']['degradada'] is None
+
+    def test_registra_filtros_normalizados(self, cliente, registro):
+        """De una búsqueda se guardan los filtros normalizados que usa el cache, no sólo el cuerpo."""
+        from solicitudes_lentas import leer_registros
+
+        cuerpo = {'zona': ['Las Palmas', ' EQUIPETROL'], 'precio_max': '250000', 'ordenar_por': 'precio'}
+        cliente.post('/api/buscar', json=cuerpo)
+
+        linea = next(leer_registros([registro.ruta]))
+        sistema = server.gestor_catalogo.catalogo.sistema
+        esperados = sistema.normalizar_filtros(server.filtros_desde_solicitud(cuerpo))
+        assert linea['payload'] == cuerpo
+        assert linea['consulta']['filtros'] == json.loads(json.dumps(esperados))
+        assert linea['consulta']['ordenar_por'] == 'precio'
+        assert linea['catalogo']['version'] == sistema.version_catalogo
+
+    def test_umbral(self, cliente, registro):
+        """Solicitudes bajo el umbral o con el registro desactivado no se escriben."""
+        registro.umbral_segundos = 60
+        cliente.post('/api/buscar', json={'zona': 'Equipetrol'})
+        registro.umbral_segundos = 0
+        cliente.post('/api/buscar', json={'zona': 'Equipetrol'})
+        assert registro.registradas == 0
+        assert not os.path.exists(registro.ruta)
+
+    def test_rotacion(self, tmp_path):
+        """Al superar el tamaño máximo el archivo rota y conserva respaldos."""
+        registro = server.RegistroSolicitudesLentas(str(tmp_path / 'lentas.jsonl'),
+                                                    max_bytes=200, respaldos=2)
+        for i in range(10):
+            registro.registrar({'ruta': '/api/buscar', 'payload': {'limite': i}})
+        registro.cerrar()
+        assert sorted(p.name for p in tmp_path.iterdir()) == [
+            'lentas.jsonl', 'lentas.jsonl.1', 'lentas.jsonl.2']
+
+    def test_reproducir(self, cliente, registro, tmp_path, monkeypatch):
+        """El script vuelve a ejecutar la solicitud registrada con perfilado."""
+        # preparar_servidor reemplaza el token y el perfilador del módulo
+        monkeypatch.setattr(server, 'ADMIN_TOKEN', server.ADMIN_TOKEN)
+        monkeypatch.setattr(server, 'perfilador', server.perfilador)
+        sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+        import reproducir_solicitudes_lentas
+        from solicitudes_lentas import leer_registros
+
+        cliente.post('/api/buscar', json={'zona': 'Equipetrol', 'limite': 5})
+        linea = next(leer_registros([registro.ruta]))
+
+        servidor = reproducir_solicitudes_lentas.preparar_servidor(
+            RUTA_PROPIEDADES, RUTA_GUIA, str(tmp_path / 'perfiles'))
+        resultado = reproducir_solicitudes_lentas.reproducir(servidor, linea, repeticiones=2)
+
+        assert resultado['codigo'] == 200
+        assert len(resultado['tiempos']) == 2
+        assert os.path.exists(resultado['perfilado']['archivo'])
+        assert resultado['tiempo_frio'] is None
+        # Las solicitudes reproducidas no vuelven al log
+        assert registro.registradas == 1
+
+        # En frío la primera ejecución y la perfilada no encuentran el resultado en cache
+        sistema = servidor.gestor_catalogo.catalogo.sistema
+        antes = sistema.estadisticas_cache()
+        resultado = reproducir_solicitudes_lentas.reproducir(servidor, linea, repeticiones=2, en_frio=True)
+        despues = sistema.estadisticas_cache()
+        assert resultado['tiempo_frio'] > 0
+        assert os.path.exists(resultado['perfilado']['archivo'])
+        assert despues['misses'] - antes['misses'] == 2
+        assert despues['hits'] - antes['hits'] == 2
+
+
+class TestFragmentos:
+    """Pruebas de las respuestas armadas con fragmentos preserializados."""
+
+    def test_busqueda_igual_al_formato(self, cliente):
+        """Cada propiedad de /api/buscar coincide con su formato y el fragmento se reutiliza."""
+        from fragmentos import formatear_busqueda
+
+        catalogo = server.gestor_catalogo.catalogo
+        cuerpo = {'zona': 'Equipetrol', 'limite': 5}
+        datos = cliente.post('/api/buscar', json=cuerpo).get_json()
+        pagina = catalogo.sistema.buscar_pagina({'zona': 'Equipetrol'}, limite=5)
+        assert datos['propiedades'] == [formatear_busqueda(p) for p in pagina['propiedades']]
+
+        prop = pagina['propiedades'][0]
+        assert catalogo.fragmentos.busqueda(prop).json is catalogo.fragmentos.busqueda(prop).json
+
+    def test_recomendacion_con_campos_de_la_consulta(self, cliente):
+        """El fragmento fijo se completa con compatibilidad y justificación por request."""
+        datos = cliente.post('/api/recomendar', json={'presupuesto_max': 250000, 'adultos': 2,
+                                                      'limite': 3}).get_json()
+        assert datos['total_recomendaciones'] == len(datos['recomendaciones']) > 0
+        for rec in datos['recomendaciones']:
+            assert set(rec) == {'id', 'nombre', 'precio', 'superficie_m2', 'habitaciones', 'banos',
+                                'zona', 'fuente', 'compatibilidad', 'justificacion'}
+            assert rec['justificacion'] in datos['briefing_personalizado']
+
+    def test_ensamblar_json(self):
+        """El ensamblado produce JSON equivalente a json.dumps, con o sin fragmentos guardados."""
+        from fragmentos import FragmentosPropiedades, ensamblar_json
+
+        prop = {'id': 'p1', 'nombre': 'Casa en Urubó', 'descripcion': 'ñ' * 400,
+                'caracteristicas_principales': {'precio': 150000}, 'ubicacion': {'zona': 'Urubó'}}
+        for fragmentos in (FragmentosPropiedades(), FragmentosPropiedades(max_fragmentos=0)):
+            payload = {
+                'success': True,
+                'cursor': None,
+                'propiedades': [fragmentos.busqueda(prop)],
+                'recomendaciones': [fragmentos.recomendacion(prop, 87.5, 'Cerca de "todo"')]
+            }
+            datos = json.loads(ensamblar_json(payload))
+            assert datos['propiedades'][0]['descripcion'] == 'ñ' * 300 + '...'
+            assert datos['recomendaciones'][0] == {
+                'id': 'p1', 'nombre': 'Casa en Urubó', 'precio': 150000, 'superficie_m2': 0,
+                'habitaciones': 0, 'banos': 0, 'zona': 'Urubó', 'fuente': '',
+                'compatibilidad': 87.5, 'justificacion': 'Cerca de "todo"'
+            }
+            assert datos['cursor'] is None
+        assert len(fragmentos) == 0
+
+
+class TestAdmision:
+    """Pruebas del control de admisión y de la degradación de solicitudes desmedidas."""
+
+    def test_cola_llena_y_espera_agotada(self):
+        """Con el lugar ocupado se espera en cola; sin lugar en cola se rechaza de inmediato."""
+        control = server.ControlAdmision(max_concurrentes=1, max_cola=1, espera_maxima=0.05)
+        with control.admitir():
+            errores = []
+
+            def esperar():
+                try:
+                    with control.admitir():
+                        pass
+                except server.Sobrecarga as e:
+                    errores.append(e)
+
+            hilo = threading.Thread(target=esperar)
+            hilo.start()
+            limite = time.time() + 5
+            while control.en_cola == 0 and time.time() < limite:
+                time.sleep(0.001)
+
+            inicio = time.perf_counter()
+            with pytest.raises(server.Sobrecarga):
+                with control.admitir():
+                    pass
+            assert time.perf_counter() - inicio < 0.05
+            hilo.join()
+
+        assert len(errores) == 1
+        estadisticas = control.estadisticas()
+        assert estadisticas['rechazadas_cola_llena'] == 1
+        assert estadisticas['rechazadas_espera'] == 1
+        assert estadisticas['en_ejecucion'] == 0 and estadisticas['en_cola'] == 0
+
+    def test_espera_y_admite_al_liberarse(self):
+        """Una solicitud en cola entra apenas se libera un lugar."""
+        control = server.ControlAdmision(max_concurrentes=1, max_cola=1, espera_maxima=5)
+        esperas = []
+
+        def esperar():
+            with control.admitir() as espera:
+                esperas.append(espera)
+
+        with control.admitir():
+            hilo = threading.Thread(target=esperar)
+            hilo.start()
+            while control.en_cola == 0:
+                time.sleep(0.001)
+            time.sleep(0.02)
+        hilo.join()
+        assert len(esperas) == 1 and esperas[0] >= 0.02
+        assert control.stats['admitidas'] == 2
+
+    def test_503_con_retry_after(self, cliente, monkeypatch):
+        """Sin lugar disponible el endpoint responde 503 con Retry-After."""
+        control = server.ControlAdmision(max_concurrentes=1, max_cola=0, espera_maxima=3)
+        monkeypatch.setattr(server, 'control_admision', control)
+        with control.admitir():
+            respuesta = cliente.post('/api/recomendar-mejorado', json={'presupuesto_max': 200000})
+        assert respuesta.status_code == 503
+        assert respuesta.headers['Retry-After'] == '3'
+        assert respuesta.get_json()['reintentar_en'] == 3
+
+        texto = cliente.get('/api/metricas').get_data(as_text=True)
+        pid = f'pid="{os.getpid()}"'
+        assert f'citrino_solicitudes_rechazadas_total{{endpoint="recomendar_propiedades_mejorado",{pid}}}' in texto
+        assert f'citrino_admision_en_cola{{{pid}}} 0' in texto
+
+    def test_solicitud_desmedida_se_degrada(self, cliente):
+        """Límites enormes o presupuestos desmedidos usan el motor original con el límite recortado."""
+        respuesta = cliente.post('/api/recomendar-mejorado', json={
+            'presupuesto_max': 250000, 'adultos': 2, 'limite': 10000, 'umbral_minimo': 0})
+        datos = respuesta.get_json()
+        assert respuesta.status_code == 200
+        assert datos['motor'] == 'original_degradado'
+        assert 'limite' in datos['degradada']
+        assert datos['total_recomendaciones'] <= server.LIMITE_MAXIMO_RECOMENDACIONES
+
+        datos = cliente.post('/api/recomendar', json={'presupuesto_max': 10 ** 9}).get_json()
+        assert 'presupuesto' in datos['degradada']
+
+        datos = cliente.post('/api/recomendar-mejorado', json={'presupuesto_max': 250000, 'limite': 3}).get_json()
+        assert datos['motor'] == 'mejorado_con_georreferenciacion'
+        assert 'degradada' not in datos
+
+
+class TestExportaciones:
+    """Pruebas de las exportaciones en segundo plano."""
+
+    @pytest.fixture
+    def cola(self, monkeypatch, tmp_path):
+        cola = server.ColaTrabajos(str(tmp_path), max_simultaneos=1, max_pendientes=2)
+        monkeypatch.setattr(server, 'cola_exportaciones', cola)
+        yield cola
+        cola.cerrar()
+
+    def _esperar(self, cliente, url):
+        limite = time.time() + 10
+        while time.time() < limite:
+            trabajo = cliente.get(url).get_json()['trabajo']
+            if trabajo['estado'] in ('completado', 'error'):
+                return trabajo
+            time.sleep(0.01)
+        raise AssertionError("La exportación no terminó")
+
+    def test_exportar_y_descargar(self, cliente, cola):
+        """La exportación responde 202, informa el progreso y se descarga al terminar."""
+        respuesta = cliente.post('/api/exportaciones', json={'zona': 'Equipetrol', 'formato': 'csv'})
+        assert respuesta.status_code == 202
+        url = respuesta.headers['Location']
+        assert url == respuesta.get_json()['trabajo']['estado_url']
+
+        trabajo = self._esperar(cliente, url)
+        assert trabajo['estado'] == 'completado'
+        assert trabajo['progreso'] == 1.0
+
+        descarga = cliente.get(trabajo['descarga_url'])
+        assert descarga.status_code == 200
+        assert 'attachment' in descarga.headers['Content-Disposition']
+        lineas = descarga.get_data(as_text=True).strip().splitlines()
+        esperadas = len(server.gestor_catalogo.catalogo.sistema.buscar_por_filtros({'zona': 'Equipetrol'}))
+        assert lineas[0].startswith('id,nombre,precio')
+        assert len(lineas) - 1 == trabajo['resumen']['total_resultados'] == esperadas
+        descarga.close()
+
+    def test_pendiente_y_no_encontrada(self, cliente, cola):
+        """Antes de terminar la descarga responde 409; un id desconocido, 404."""
+        liberar = threading.Event()
+        trabajo = cola.enviar('prueba', lambda t: liberar.wait(5) and None)
+        try:
+            respuesta = cliente.get(f'/api/exportaciones/{trabajo.id}/descarga')
+            assert respuesta.status_code == 409
+            assert respuesta.get_json()['trabajo']['descarga_url'] is None
+        finally:
+            liberar.set()
+        assert cliente.get('/api/exportaciones/desconocido').status_code == 404
+        assert cliente.get('/api/exportaciones/desconocido/descarga').status_code == 404
+
+    def test_tope_de_pendientes(self, cliente, cola):
+        """Superado el tope de trabajos pendientes se responde 503 con Retry-After."""
+        liberar = threading.Event()
+        for _ in range(2):
+            cola.enviar('prueba', lambda t: liberar.wait(5) and None)
+        try:
+            respuesta = cliente.post('/api/exportaciones', json={'formato': 'csv'})
+            assert respuesta.status_code == 503
+            assert 'Retry-After' in respuesta.headers
+        finally:
+            liberar.set()
+        assert cola.estadisticas()['rechazados'] == 1
+
+    def test_formato_invalido(self, cliente, cola):
+        """Un formato desconocido se rechaza sin encolar el trabajo."""
+        respuesta = cliente.post('/api/exportaciones', json={'formato': 'pdf'})
+        assert respuesta.status_code == 400
+        assert cola.estadisticas()['enviados'] == 0
+
+    def test_error_y_retencion(self, tmp_path):
+        """Un trabajo que falla queda en error; los vencidos se descartan con su archivo."""
+        cola = server.ColaTrabajos(str(tmp_path))
+        archivo = tmp_path / 'resultado.csv'
+        archivo.write_text('id\n', encoding='utf-8')
+
+        fallido = cola.enviar('prueba', lambda t: 1 / 0)
+        exitoso = cola.enviar('prueba', lambda t: str(archivo))
+        cola.cerrar()
+        assert fallido.estado == 'error' and 'division' in fallido.error
+        assert exitoso.estado == 'completado'
+
+        cola.retencion_segundos = -1
+        assert cola.limpiar_vencidos() == 2
+        assert cola.obtener(exitoso.id) is None
+        assert not archivo.exists()
+
+    def test_registro_compartido_entre_workers(self, tmp_path):
+        """Otra cola sobre el mismo directorio (otro worker) ve el estado, el archivo y el tope."""
+        archivo = tmp_path / 'resultado.csv'
+        archivo.write_text('id\n', encoding='utf-8')
+        worker_a = server.ColaTrabajos(str(tmp_path), max_pendientes=1)
+        worker_b = server.ColaTrabajos(str(tmp_path), max_pendientes=1)
+        liberar = threading.Event()
+
+        def exportar(trabajo):
+            trabajo.avanzar('exportando', 0.5)
+            liberar.wait(5)
+            return str(archivo)
+
+        trabajo = worker_a.enviar('prueba', exportar)
+        try:
+            limite = time.time() + 5
+            while worker_b.obtener(trabajo.id).etapa != 'exportando' and time.time() < limite:
+                time.sleep(0.01)
+            assert worker_b.obtener(trabajo.id).progreso == 0.5
+            with pytest.raises(server.Sobrecarga):
+                worker_b.enviar('prueba', lambda t: None)
+        finally:
+            liberar.set()
+            worker_a.cerrar()
+
+        visto = worker_b.obtener(trabajo.id)
+        assert visto.estado == 'completado'
+        assert visto.archivo == str(archivo)
+        worker_b.cerrar()
+
+    def test_trabajo_de_worker_perdido(self, tmp_path):
+        """Un trabajo pendiente cuyo latido venció pasa a error y libera el tope."""
+        cola = server.ColaTrabajos(str(tmp_path), max_pendientes=1, intervalo_latido=0.05)
+        perdido = Trabajo('prueba', {})
+        perdido.propietario = 'otro-host:123:abcd'
+        cola._guardar(perdido)
+        assert cola.obtener(perdido.id).estado == 'en_cola'
+        time.sleep(0.2)
+
+        visto = cola.obtener(perdido.id)
+        assert visto.estado == 'error' and visto.error == trabajos.ERROR_PERDIDO
+        assert cola.estadisticas()['en_cola'] == 0
+        cola.enviar('prueba', lambda t: None)
+        cola.cerrar()
+        # Al encolar quedó registrado el vencimiento
+        fila = cola._conectar().execute('SELECT estado FROM trabajos WHERE id = ?', (perdido.id,)).fetchone()
+        assert fila == ('error',)
+
+    def test_latido_mantiene_vivo_el_trabajo(self, tmp_path):
+        """Un trabajo largo sin avances no vence mientras su proceso late."""
+        worker_a = server.ColaTrabajos(str(tmp_path), intervalo_latido=0.05)
+        worker_b = server.ColaTrabajos(str(tmp_path), intervalo_latido=0.05)
+        liberar = threading.Event()
+        trabajo = worker_a.enviar('prueba', lambda t: liberar.wait(5) and None)
+        try:
+            time.sleep(0.4)
+            assert worker_b.obtener(trabajo.id).estado == 'ejecutando'
+        finally:
+            liberar.set()
+            worker_a.cerrar()
+            worker_b.cerrar()
+
+
+class TestNdjson:
+    """Pruebas de las respuestas NDJSON para consumidores masivos."""
+
+    NDJSON = {'Accept': 'application/x-ndjson'}
+
+    def test_busqueda_ndjson(self, cliente):
+        """Con Accept NDJSON se envían todas las coincidencias, una por línea y sin límite por defecto."""
+        catalogo = server.gestor_catalogo.catalogo
+        sistema = catalogo.sistema
+        fragmentos_antes = len(catalogo.fragmentos)
+        respuesta = cliente.post('/api/buscar', json={'precio_min': 1, 'ordenar_por': 'precio'},
+                                 headers=self.NDJSON)
+        assert respuesta.status_code == 200
+        assert respuesta.mimetype == 'application/x-ndjson'
+
+        lineas = [json.loads(l) for l in respuesta.get_data(as_text=True).splitlines()]
+        esperadas = sistema.buscar_por_filtros({'precio_min': 1}, ordenar_por='precio')
+        assert len(lineas) == len(esperadas) == int(respuesta.headers['X-Total-Coincidencias'])
+        assert len(lineas) > 20
+        assert [l['id'] for l in lineas] == [p['id'] for p in esperadas]
+        # El recorrido masivo no llena el cache de fragmentos
+        assert len(catalogo.fragmentos) == fragmentos_antes
+
+        limitada = cliente.post('/api/buscar', json={'precio_min': 1, 'limite': 3}, headers=self.NDJSON)
+        assert len(limitada.get_data(as_text=True).splitlines()) == 3
+
+    def test_json_por_defecto(self, cliente):
+        """Sin Accept NDJSON la búsqueda sigue respondiendo una página JSON."""
+        respuesta = cliente.post('/api/buscar', json={'limite': 3}, headers={'Accept': '*/*'})
+        assert respuesta.mimetype == 'application/json'
+        assert respuesta.get_json()['total_resultados'] == 3
+
+    def test_recomendaciones_en_lote(self, cliente):
+        """El lote responde un resultado por perfil, en orden y con errores aislados."""
+        cuerpo = {'motor': 'mejorado', 'perfiles': [
+            {'presupuesto_max': 250000, 'adultos': 2, 'limite': 2},
+            'perfil inválido',
+            {'presupuesto_max': 150000, 'limite': 1},
+        ]}
+        respuesta = cliente.post('/api/recomendar-lote', json=cuerpo, headers=self.NDJSON)
+        assert respuesta.mimetype == 'application/x-ndjson'
+        lineas = [json.loads(l) for l in respuesta.get_data(as_text=True).splitlines()]
+        assert [l['indice'] for l in lineas] == [0, 1, 2]
+        assert lineas[0]['success'] and lineas[0]['motor'] == 'mejorado_con_georreferenciacion'
+        assert lineas[1]['success'] is False
+        assert lineas[2]['total_recomendaciones'] <= 1
+
+        datos = cliente.post('/api/recomendar-lote', json=cuerpo).get_json()
+        assert datos['total_perfiles'] == 3
+        assert [r['success'] for r in datos['resultados']] == [True, False, True]
+
+    def test_lote_invalido(self, cliente):
+        """Lotes vacíos, demasiado grandes o con motor desconocido se rechazan con 400."""
+        assert cliente.post('/api/recomendar-lote', json={'perfiles': []}).status_code == 400
+        assert cliente.post('/api/recomendar-lote', json={
+            'perfiles': [{}] * (server.MAX_PERFILES_LOTE + 1)}).status_code == 400
+        assert cliente.post('/api/recomendar-lote', json={
+            'perfiles': [{}], 'motor': 'otro'}).status_code == 400
+
+
+class TestCompresion:
+    """Pruebas de la compresión negociada de respuestas."""
+
+    GZIP = {'Accept-Encoding': 'gzip'}
+
+    def test_respuesta_dinamica_comprimida(self, cliente):
+        """Las respuestas grandes se comprimen con gzip si el cliente lo acepta."""
+        import gzip
+
+        cuerpo = {'presupuesto_max': 250000, 'adultos': 2, 'limite': 5}
+        plana = cliente.post('/api/recomendar', json=cuerpo)
+        comprimida = cliente.post('/api/recomendar', json=cuerpo, headers=self.GZIP)
+        assert 'Content-Encoding' not in plana.headers
+        assert comprimida.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in comprimida.headers['Vary']
+        datos = comprimida.get_data()
+        assert len(datos) < len(plana.get_data())
+        assert json.loads(gzip.decompress(datos)) == plana.get_json()
+
+    def test_umbral_de_tamano(self, cliente, monkeypatch):
+        """Las respuestas chicas viajan sin comprimir."""
+        respuesta = cliente.get('/api/health', headers=self.GZIP)
+        assert 'Content-Encoding' not in respuesta.headers
+
+        monkeypatch.setattr(server, 'MINIMO_BYTES_COMPRESION', 1)
+        respuesta = cliente.get('/api/health', headers=self.GZIP)
+        assert respuesta.headers['Content-Encoding'] == 'gzip'
+
+    def test_precomprimida_por_version(self, cliente, monkeypatch):
+        """Las zonas se comprimen una vez por versión, con ETag propio y 304."""
+        import gzip
+
+        monkeypatch.setattr(server, 'MINIMO_BYTES_COMPRESION', 1)
+        llamadas = []
+        original = server.comprimir
+        monkeypatch.setattr(server, 'comprimir', lambda *a, **k: llamadas.append(k) or original(*a, **k))
+
+        plana = cliente.get('/api/zonas')
+        primera = cliente.get('/api/zonas', headers=self.GZIP)
+        segunda = cliente.get('/api/zonas', headers=self.GZIP)
+        assert primera.headers['Content-Encoding'] == 'gzip'
+        assert primera.get_data() == segunda.get_data()
+        assert gzip.decompress(primera.get_data()) == plana.get_data()
+        assert llamadas == [{'maximo': True}]
+
+        etag = primera.headers['ETag']
+        assert etag != plana.headers['ETag'] and etag.strip('"').endswith('-gzip')
+        no_modificada = cliente.get('/api/zonas', headers=dict(self.GZIP, **{'If-None-Match': etag}))
+        assert no_modificada.status_code == 304
+
+    def test_ndjson_comprimido_por_partes(self, cliente):
+        """La búsqueda NDJSON se comprime sin dejar de enviarse por partes."""
+        import gzip
+
+        encabezados = {'Accept': 'application/x-ndjson', 'Accept-Encoding': 'gzip'}
+        respuesta = cliente.post('/api/buscar', json={'precio_min': 1}, headers=encabezados)
+        assert respuesta.is_streamed
+        assert respuesta.headers['Content-Encoding'] == 'gzip'
+        lineas = gzip.decompress(respuesta.get_data()).decode('utf-8').splitlines()
+        assert len(lineas) == int(respuesta.headers['X-Total-Coincidencias'])
+        assert all(json.loads(l)['id'] for l in lineas)
+
+
+class TestFormatoBinario:
+    """Pruebas de las respuestas MessagePack columnares."""
+
+    MSGPACK = {'Accept': 'application/x-msgpack'}
+
+    def test_recomendaciones_columnares(self, cliente):
+        """Ids, compatibilidad y campos clave llegan como arreglos paralelos, sin justificaciones."""
+        pytest.importorskip('msgpack')
+        import formato_binario
+
+        cuerpo = {'presupuesto_max': 250000, 'adultos': 2, 'limite': 10}
+        json_resp = cliente.post('/api/recomendar', json=cuerpo)
+        binaria = cliente.post('/api/recomendar', json=cuerpo, headers=self.MSGPACK)
+        assert binaria.mimetype == 'application/x-msgpack'
+        assert len(binaria.get_data()) < len(json_resp.get_data()) / 5
+
+        esperadas = json_resp.get_json()['recomendaciones']
+        datos = formato_binario.decodificar(binaria.get_data())
+        columnas = datos['columnas']
+        assert datos['filas'] == datos['total_recomendaciones'] == len(esperadas)
+        assert columnas['id'] == [r['id'] for r in esperadas]
+        assert columnas['compatibilidad'].tolist() == [r['compatibilidad'] for r in esperadas]
+        assert columnas['zona'].tolist() == [r['zona'] for r in esperadas]
+        assert columnas['habitaciones'].dtype.kind == 'i'
+        assert 'briefing_personalizado' not in datos and 'justificacion' not in columnas
+
+    def test_busqueda_columnar(self, cliente):
+        """La página de búsqueda conserva totales y cursor en el formato columnar."""
+        pytest.importorskip('msgpack')
+        import formato_binario
+
+        cuerpo = {'ordenar_por': 'precio', 'limite': 7}
+        esperada = cliente.post('/api/buscar', json=cuerpo).get_json()
+        datos = formato_binario.decodificar(
+            cliente.post('/api/buscar', json=cuerpo, headers=self.MSGPACK).get_data())
+        assert datos['siguiente_cursor'] == esperada['siguiente_cursor']
+        assert datos['total_coincidencias'] == esperada['total_coincidencias']
+        assert datos['columnas']['id'] == [p['id'] for p in esperada['propiedades']]
+        assert datos['columnas']['precio'].tolist() == [float(p['precio']) for p in esperada['propiedades']]
+
+    def test_406_sin_msgpack(self, cliente, monkeypatch):
+        """Si msgpack no está instalado quien pide el formato recibe 406; JSON sigue igual."""
+        import formato_binario
+        monkeypatch.setattr(formato_binario, 'msgpack', None)
+
+        for ruta in ('/api/buscar', '/api/recomendar', '/api/recomendar-mejorado'):
+            respuesta = cliente.post(ruta, json={'limite': 2}, headers=self.MSGPACK)
+            assert respuesta.status_code == 406
+        assert cliente.post('/api/buscar', json={'limite': 2}).status_code == 200
+        preferida = cliente.post('/api/buscar', json={'limite': 2},
+                                 headers={'Accept': 'application/json, application/x-msgpack;q=0.5'})
+        assert preferida.status_code == 200
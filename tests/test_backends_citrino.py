@@ -0,0 +1,129 @@
+"""
+Pruebas de los backends del puente de chat: en proceso y HTTP contra el
+servidor API real en un puerto local.
+"""
+
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from werkzeug.serving import make_server
+
+# Agregar la raíz del proyecto y el directorio api al path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'api'))
+
+import server
+from backends_citrino import BackendEnProceso, BackendHTTP, crear_backend
+
+RUTA_PROPIEDADES = os.path.join(os.path.dirname(__file__), '..', 'data', 'propiedades_ampliado.json')
+RUTA_GUIA = os.path.join(os.path.dirname(__file__), '..', 'data', 'guia_urbana_municipal.json')
+
+
+class _ManejadorKeepAlive(BaseHTTPRequestHandler):
+    """
+    API mínimo en HTTP/1.1 que cuenta conexiones TCP. El servidor de
+    desarrollo de werkzeug cierra cada conexión, así que no sirve para esto.
+    """
+    protocol_version = 'HTTP/1.1'
+    conexiones = 0
+
+    def setup(self):
+        # Una instancia por conexión TCP aceptada
+        type(self).conexiones += 1
+        super().setup()
+
+    def _responder(self):
+        longitud = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(longitud)
+        cuerpo = json.dumps({'success': True, 'propiedades': [], 'estadisticas': {}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    do_GET = do_POST = _responder
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def url_api():
+    """Servidor API con el catálogo ampliado en un puerto libre."""
+    server.estado_carga['estado'] = 'pendiente'
+    assert server.inicializar_datos(RUTA_PROPIEDADES, RUTA_GUIA)
+    servidor = make_server('127.0.0.1', 0, server.app, threaded=True)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    yield f"http://127.0.0.1:{servidor.server_port}"
+    servidor.shutdown()
+
+
+@pytest.fixture(scope='module')
+def en_proceso():
+    return BackendEnProceso(RUTA_PROPIEDADES, RUTA_GUIA)
+
+
+@pytest.fixture
+def http(url_api):
+    backend = BackendHTTP(url_api)
+    yield backend
+    backend.cerrar()
+
+
+class TestBackends:
+    """Ambos backends responden lo mismo que el API."""
+
+    def test_buscar(self, en_proceso, http):
+        parametros = {'zona': 'Equipetrol', 'precio_max': 300000, 'limite': 5}
+        locales = en_proceso.buscar(parametros)
+
+        assert 0 < len(locales) <= 5
+        assert all(p['zona'] == 'Equipetrol' and p['precio'] <= 300000 for p in locales)
+        assert [p['id'] for p in locales] == [p['id'] for p in http.buscar(parametros)]
+
+    def test_recomendar(self, en_proceso, http):
+        perfil = {'presupuesto_min': 100000, 'presupuesto_max': 250000, 'adultos': 2,
+                  'ninos': [{'edad': 6}], 'zona_preferida': 'Equipetrol', 'necesidades': ['escuela_primaria']}
+        locales = en_proceso.recomendar(perfil)
+        remotas = http.recomendar(perfil)
+
+        assert locales
+        assert [(r['id'], r['compatibilidad']) for r in locales] == \
+            [(r['id'], r['compatibilidad']) for r in remotas]
+        assert {'justificacion', 'precio', 'zona'} <= set(locales[0])
+
+    def test_estadisticas(self, en_proceso, http):
+        locales = en_proceso.estadisticas()
+        assert locales['total_propiedades'] == 100
+        assert locales == http.estadisticas()
+
+    def test_http_reutiliza_conexiones(self):
+        servidor = ThreadingHTTPServer(('127.0.0.1', 0), _ManejadorKeepAlive)
+        threading.Thread(target=servidor.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+        backend = BackendHTTP(f"http://127.0.0.1:{servidor.server_port}")
+        try:
+            for _ in range(5):
+                backend.estadisticas()
+                backend.buscar({'limite': 1})
+        finally:
+            backend.cerrar()
+            servidor.shutdown()
+            servidor.server_close()
+
+        assert _ManejadorKeepAlive.conexiones == 1
+
+    def test_http_sin_servidor(self):
+        backend = BackendHTTP('http://127.0.0.1:1', timeout=1)
+        with pytest.raises(Exception):
+            backend.estadisticas()
+
+    def test_crear_backend(self, monkeypatch):
+        assert isinstance(crear_backend('http'), BackendHTTP)
+        with pytest.raises(ValueError):
+            crear_backend('grpc')
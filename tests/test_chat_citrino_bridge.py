@@ -0,0 +1,186 @@
+"""
+Pruebas del turno del puente de chat: pasos en paralelo, búsqueda
+adelantada por reglas y desglose de tiempos. El cliente de openai se
+reemplaza en sys.modules por uno que responde sin red.
+"""
+
+import importlib
+import json
+import os
+import sys
+import threading
+import types
+from types import SimpleNamespace
+
+import pytest
+
+# Agregar la raíz del proyecto al path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+CONSULTA = "Busco departamento en Equipetrol hasta 300 mil"
+# Lo mismo que reconocen las reglas en CONSULTA
+PARAMETROS_REGLAS = {"presupuesto_max": 300000, "zona": "Equipetrol", "tipo_propiedad": "departamento"}
+
+
+class _Completions:
+    """chat.completions simulado: extracción con `extraccion`, síntesis con texto fijo."""
+
+    def __init__(self):
+        self.extraccion = PARAMETROS_REGLAS
+        self.fallar_extraccion = False
+        self.antes_de_extraer = None
+        self.llamadas = []
+
+    def create(self, model, messages, **opciones):
+        self.llamadas.append(messages)
+        if "extractor" in messages[0]["content"]:
+            if self.antes_de_extraer:
+                self.antes_de_extraer()
+            if self.fallar_extraccion:
+                raise TimeoutError("sin respuesta del modelo")
+            contenido = json.dumps(self.extraccion)
+        else:
+            contenido = "Respuesta del asesor"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=contenido))])
+
+
+class _OpenAI:
+    def __init__(self, **opciones):
+        self.chat = SimpleNamespace(completions=_Completions())
+
+
+class BackendSimulado:
+    """Backend en memoria que registra las búsquedas; `bloquear` retiene las de `zona_lenta`."""
+
+    def __init__(self):
+        self.busquedas = []
+        self.busqueda_iniciada = threading.Event()
+        self.estadisticas_pedidas = threading.Event()
+        self.bloquear = threading.Event()
+        self.bloquear.set()
+        self.zona_lenta = None
+        self.fallar_estadisticas = False
+        self.cerrado = False
+
+    def buscar(self, parametros):
+        self.busquedas.append(parametros)
+        self.busqueda_iniciada.set()
+        if parametros.get("zona") == self.zona_lenta:
+            self.bloquear.wait(5)
+        return [{"id": f"p{len(self.busquedas)}", "nombre": "Departamento", "precio": 150000,
+                 "zona": parametros.get("zona", "")}]
+
+    def recomendar(self, perfil):
+        return []
+
+    def estadisticas(self):
+        self.estadisticas_pedidas.set()
+        if self.fallar_estadisticas:
+            raise ConnectionError("API no disponible")
+        return {"total_propiedades": 100, "total_zonas": 5, "precio_promedio": 150000,
+                "precio_minimo": 50000, "precio_maximo": 500000}
+
+    def cerrar(self):
+        self.cerrado = True
+
+
+@pytest.fixture
+def modulo(monkeypatch):
+    """chat_citrino_bridge importado con el openai simulado."""
+    openai = types.ModuleType("openai")
+    openai.OpenAI = _OpenAI
+    monkeypatch.setitem(sys.modules, "openai", openai)
+    monkeypatch.delitem(sys.modules, "chat_citrino_bridge", raising=False)
+    return importlib.import_module("chat_citrino_bridge")
+
+
+@pytest.fixture
+def backend():
+    return BackendSimulado()
+
+
+@pytest.fixture
+def bridge(modulo, backend):
+    """Puente cuya extracción espera a que hayan empezado las estadísticas y la búsqueda por reglas."""
+    puente = modulo.ChatCitrinoBridge(backend)
+    completions = puente.client.chat.completions
+    completions.solapados = []
+    completions.antes_de_extraer = lambda: completions.solapados.extend(
+        [backend.estadisticas_pedidas.wait(2), backend.busqueda_iniciada.wait(2)])
+    yield puente
+    backend.bloquear.set()
+    puente.cerrar()
+
+
+def _prompt_sintesis(bridge):
+    return bridge.client.chat.completions.llamadas[-1][1]["content"]
+
+
+class TestTurnoConcurrente:
+    """Estadísticas y búsqueda por reglas corren mientras el LLM extrae."""
+
+    def test_reutiliza_la_busqueda_por_reglas(self, bridge, backend):
+        respuesta = bridge.procesar_consulta(CONSULTA)
+
+        assert respuesta == "Respuesta del asesor"
+        # Ambos pasos empezaron antes de que el LLM respondiera
+        assert bridge.client.chat.completions.solapados == [True, True]
+        assert backend.busquedas == [{"precio_max": 300000, "zona": "Equipetrol",
+                                      "tipo_propiedad": "departamento", "limite": 10}]
+        assert bridge.ultimo_turno["busqueda_reglas"] == "usada"
+        assert {"extraccion", "estadisticas", "busqueda", "sintesis", "total"} <= set(bridge.ultimo_turno["tiempos"])
+        assert "100 propiedades en 5 zonas" in _prompt_sintesis(bridge)
+
+    def test_filtros_distintos_buscan_de_nuevo(self, bridge, backend):
+        bridge.client.chat.completions.extraccion = {"presupuesto_max": 300000, "zona": "Las Palmas"}
+        bridge.procesar_consulta(CONSULTA)
+
+        assert bridge.ultimo_turno["busqueda_reglas"] == "descartada"
+        assert backend.busquedas[-1] == {"precio_max": 300000, "zona": "Las Palmas", "limite": 10}
+        assert "Las Palmas" in _prompt_sintesis(bridge)
+
+    def test_llm_sin_filtros_no_usa_los_de_las_reglas(self, bridge, backend):
+        bridge.client.chat.completions.extraccion = {"consulta_tipo": "busqueda"}
+        bridge.procesar_consulta(CONSULTA)
+
+        assert bridge.ultimo_turno["busqueda_reglas"] == "descartada"
+        assert backend.busquedas[-1] == {"limite": 10}
+
+    def test_falla_un_paso(self, bridge, backend):
+        """Sin estadísticas ni extracción el turno igual responde."""
+        backend.fallar_estadisticas = True
+        bridge.client.chat.completions.fallar_extraccion = True
+        respuesta = bridge.procesar_consulta(CONSULTA)
+
+        assert respuesta == "Respuesta del asesor"
+        assert "CONTEXTO DEL MERCADO: No disponible." in _prompt_sintesis(bridge)
+        assert backend.busquedas[-1] == {"limite": 10}
+
+    def test_busqueda_descartada_en_curso(self, bridge, backend):
+        """Mientras una búsqueda descartada sigue corriendo no se adelanta otra."""
+        backend.zona_lenta = "Equipetrol"
+        backend.bloquear.clear()
+        bridge.client.chat.completions.extraccion = {"zona": "Las Palmas"}
+
+        bridge.procesar_consulta(CONSULTA)
+        assert bridge.ultimo_turno["busqueda_reglas"] == "descartada"
+        bridge.procesar_consulta(CONSULTA)
+        assert bridge.ultimo_turno["busqueda_reglas"] == "ocupada"
+        assert [b["zona"] for b in backend.busquedas].count("Equipetrol") == 1
+
+
+class TestCiclo:
+    """Desglose de tiempos opcional y cierre del puente."""
+
+    @pytest.mark.parametrize("verbose", [False, True])
+    def test_desglose_solo_en_verbose(self, modulo, backend, capsys, verbose):
+        with modulo.ChatCitrinoBridge(backend, verbose=verbose) as puente:
+            puente.procesar_consulta(CONSULTA)
+        assert ("⏱️" in capsys.readouterr().out) == verbose
+
+    def test_cerrar(self, modulo, backend):
+        with modulo.ChatCitrinoBridge(backend) as puente:
+            puente.procesar_consulta(CONSULTA)
+        assert backend.cerrado
+        with pytest.raises(RuntimeError):
+            puente._pool.submit(print)
@@ -0,0 +1,198 @@
+"""
+Pruebas del extractor de perfiles por reglas y de la decisión de consultar
+o no al LLM según la confianza.
+"""
+
+import os
+import sys
+from unittest.mock import MagicMock
+
+import pytest
+
+# Agregar el directorio src al path para importar los módulos
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from extractor_perfiles import ParserPerfiles, completar_perfil, extraer_perfil
+
+PERFIL_LLM = {
+    "composicion_familiar": {"adultos": 2, "ninos": [], "adultos_mayores": 0},
+    "presupuesto": {"min": 90000, "max": 110000, "tipo": "compra"},
+    "necesidades": ["supermercado"],
+    "preferencias": {"ubicacion": "Urbari", "seguridad": "media",
+                     "estilo_propiedad": "casa", "caracteristicas_deseadas": ["jardin"]}
+}
+
+
+@pytest.fixture
+def llm():
+    """Integración LLM simulada que cuenta las llamadas."""
+    simulado = MagicMock()
+    simulado.parsear_perfil_desde_texto.return_value = PERFIL_LLM
+    return simulado
+
+
+class TestExtractorPerfiles:
+    """Campos que las reglas reconocen y confianza resultante."""
+
+    def test_descripcion_completa(self):
+        resultado = extraer_perfil("familia con 2 niños, 150 mil, Equipetrol")
+
+        perfil = resultado.perfil
+        assert perfil["composicion_familiar"]["ninos"] == [{"edad": 8}, {"edad": 8}]
+        assert perfil["presupuesto"] == {"min": 120000, "max": 180000, "tipo": "compra"}
+        assert perfil["preferencias"]["ubicacion"] == "Equipetrol"
+        assert resultado.faltantes == ["necesidades"]
+        assert resultado.confianza == pytest.approx(0.85)
+
+    @pytest.mark.parametrize("texto, minimo, maximo", [
+        ("presupuesto 250-300K", 250000, 300000),
+        ("entre 120 y 150 mil", 120000, 150000),
+        ("hasta $180.000", 0, 180000),
+        ("1,5 millones", 1200000, 1800000),
+        ("alquiler mensual de 800 usd", 640, 960),
+    ])
+    def test_presupuestos(self, texto, minimo, maximo):
+        presupuesto = extraer_perfil(texto).perfil["presupuesto"]
+        assert presupuesto["min"] == pytest.approx(minimo)
+        assert presupuesto["max"] == pytest.approx(maximo)
+
+    def test_numeros_que_no_son_montos(self):
+        resultado = extraer_perfil("3 adultos y 2 hijos de 5 y 9 años, 3 habitaciones en el 2do anillo")
+
+        assert "presupuesto" in resultado.faltantes
+        assert resultado.perfil["composicion_familiar"]["adultos"] == 3
+        assert resultado.perfil["composicion_familiar"]["ninos"] == [{"edad": 5}, {"edad": 9}]
+
+    @pytest.mark.parametrize("texto, minimo, maximo", [
+        ("pareja busca depto a 5 cuadras del centro, hasta 120k", 0, 120000),
+        ("necesito 2 autos de garaje y 150k", 120000, 180000),
+        ("de 2 a 3 autos, entre 100 y 130 mil", 100000, 130000),
+        ("casa en plan 3000 hasta 90k", 0, 90000),
+    ])
+    def test_prefiere_montos_con_unidad(self, texto, minimo, maximo):
+        resultado = extraer_perfil(texto)
+        assert resultado.perfil["presupuesto"]["min"] == pytest.approx(minimo)
+        assert resultado.perfil["presupuesto"]["max"] == pytest.approx(maximo)
+        assert not resultado.ambiguo
+
+    @pytest.mark.parametrize("texto, minimo, maximo", [
+        ("Equipetrol, 150 mil, 2 niños", 120000, 180000),
+        ("Equipetrol, 150, 2 niños, colegio", 120000, 180000),
+        ("hasta 200k, 3 hijos, Sirari, colegio", 0, 200000),
+        ("presupuesto 100 mil, 2 hijos, escuela, Urubó", 80000, 120000),
+        ("presupuesto 100, y 2 hijos, Urubó", 80000, 120000),
+    ])
+    def test_monto_seguido_de_cantidad_de_hijos(self, texto, minimo, maximo):
+        resultado = extraer_perfil(texto)
+        assert resultado.perfil["presupuesto"]["min"] == pytest.approx(minimo)
+        assert resultado.perfil["presupuesto"]["max"] == pytest.approx(maximo)
+        assert resultado.confianza >= 0.7
+
+    def test_lista_de_edades_no_es_monto(self):
+        resultado = extraer_perfil("hijos de 8, 10 y 12 años, 150 mil")
+        assert resultado.perfil["presupuesto"]["min"] == pytest.approx(120000)
+        assert [n["edad"] for n in resultado.perfil["composicion_familiar"]["ninos"]] == [8, 10, 12]
+
+    def test_numero_suelto_seguido_de_sustantivo(self):
+        assert "presupuesto" in extraer_perfil("a 5 cuadras del centro").faltantes
+
+    def test_montos_en_conflicto_quedan_bajo_el_umbral(self):
+        resultado = extraer_perfil("familia con 2 niños, 150k o 200k, Equipetrol")
+        assert resultado.ambiguo
+        assert resultado.confianza < 0.7
+
+    def test_necesidades_y_preferencias(self):
+        perfil = extraer_perfil("Departamento amoblado con garaje, cerca de colegio y clínica, zona segura").perfil
+
+        assert perfil["necesidades"] == ["escuela_primaria", "hospital"]
+        assert perfil["preferencias"]["estilo_propiedad"] == "departamento"
+        assert perfil["preferencias"]["caracteristicas_deseadas"] == ["amoblado", "estacionamiento"]
+        assert perfil["preferencias"]["seguridad"] == "alta"
+
+    def test_negaciones_bajan_la_confianza(self):
+        claro = extraer_perfil("pareja, 200 mil, zona sur")
+        ambiguo = extraer_perfil("pareja, 200 mil, no en zona sur pero cerca del centro")
+
+        assert ambiguo.ambiguo and not claro.ambiguo
+        assert ambiguo.confianza < claro.confianza
+
+    @pytest.mark.parametrize("texto, ubicacion", [
+        ("no quiero Equipetrol, familia, 150 mil", None),
+        ("no quiero Equipetrol, prefiero Sirari", "Sirari"),
+        ("pareja, 200 mil, no en zona sur pero cerca del centro", "Centro"),
+        ("excepto Urubó, 100 mil", None),
+    ])
+    def test_zona_negada_no_es_la_preferida(self, texto, ubicacion):
+        assert extraer_perfil(texto).perfil["preferencias"]["ubicacion"] == ubicacion
+
+
+class TestParserPerfiles:
+    """Consulta al LLM sólo bajo el umbral de confianza."""
+
+    def test_confianza_suficiente_no_llama_al_llm(self, llm):
+        parser = ParserPerfiles(llm, umbral_confianza=0.7)
+        perfil, detalle = parser.parsear("familia con 2 niños, 150 mil, Equipetrol")
+
+        assert detalle["fuente"] == "reglas"
+        assert perfil["preferencias"]["ubicacion"] == "Equipetrol"
+        llm.parsear_perfil_desde_texto.assert_not_called()
+
+    def test_llm_completa_los_faltantes(self, llm):
+        parser = ParserPerfiles(llm, umbral_confianza=0.7)
+        perfil, detalle = parser.parsear("pareja joven, 200 mil")
+
+        assert detalle["fuente"] == "reglas+llm"
+        # Lo que encontraron las reglas se conserva; el LLM aporta el resto
+        assert perfil["presupuesto"]["min"] == pytest.approx(160000)
+        assert perfil["preferencias"]["ubicacion"] == "Urbari"
+        assert perfil["necesidades"] == ["supermercado"]
+        assert perfil["preferencias"]["caracteristicas_deseadas"] == ["jardin"]
+
+    def test_texto_ambiguo_usa_el_perfil_del_llm(self):
+        resultado = extraer_perfil("pareja, 200 mil, no en zona sur pero cerca del centro")
+        assert completar_perfil(resultado, PERFIL_LLM) is PERFIL_LLM
+
+    def test_montos_en_conflicto_consultan_al_llm(self, llm):
+        parser = ParserPerfiles(llm, umbral_confianza=0.7)
+        perfil, detalle = parser.parsear("familia con 2 niños, 150k o 200k, Equipetrol")
+
+        assert detalle["fuente"] == "reglas+llm"
+        assert perfil is PERFIL_LLM
+
+    def test_sin_llm_usa_las_reglas(self):
+        parser = ParserPerfiles(None, umbral_confianza=0.7)
+        perfil, detalle = parser.parsear("pareja joven")
+
+        assert detalle["fuente"] == "reglas_sin_llm"
+        assert perfil["composicion_familiar"]["adultos"] == 2
+
+    def test_sin_llm_no_usa_la_zona_negada(self):
+        parser = ParserPerfiles(None, umbral_confianza=0.7)
+        perfil, detalle = parser.parsear("no quiero Equipetrol, familia con 2 niños, 150 mil")
+
+        assert detalle["fuente"] == "reglas_sin_llm" and detalle["ambiguo"]
+        assert perfil["preferencias"]["ubicacion"] is None
+
+    def test_fraccion_sin_llm(self, llm):
+        parser = ParserPerfiles(llm, umbral_confianza=0.7)
+        for texto in ["familia con 2 niños, 150 mil, Equipetrol",
+                      "soltero, hasta 90k, Las Palmas",
+                      "busco algo lindo"]:
+            parser.parsear(texto)
+
+        stats = parser.estadisticas()
+        assert stats["reglas"] == 2
+        assert stats["llm"] == 1
+        assert stats["fraccion_sin_llm"] == pytest.approx(0.667)
+        assert llm.parsear_perfil_desde_texto.call_count == 1
+
+    def test_lote_envia_al_llm_solo_las_dudosas(self, llm):
+        llm.parsear_perfiles_lote.return_value = [PERFIL_LLM]
+        parser = ParserPerfiles(llm, umbral_confianza=0.7)
+        resultados = parser.parsear_lote(["familia con 2 niños, 150 mil, Equipetrol", "pareja joven"],
+                                         max_concurrentes=4)
+
+        assert [detalle["fuente"] for _, detalle in resultados] == ["reglas", "reglas+llm"]
+        llm.parsear_perfiles_lote.assert_called_once_with(["pareja joven"], max_concurrentes=4)
+        llm.parsear_perfil_desde_texto.assert_not_called()
+        assert parser.estadisticas()["fraccion_sin_llm"] == pytest.approx(0.5)
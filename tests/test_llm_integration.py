@@ -0,0 +1,358 @@
+"""
+Pruebas de la integración LLM contra un servidor local que imita la API de
+chat completions, y del cache persistente de perfiles.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# Agregar el directorio src al path para importar los módulos
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from llm_cache import CacheLLM, clave_cache, normalizar_texto
+from llm_integration import LLMIntegration, LLMConfig, PROMPT_VERSION
+from llm_async import ClienteLLMAsync
+
+PERFIL_LLM = {
+    "composicion_familiar": {"adultos": 2, "ninos": [{"edad": 6}], "adultos_mayores": 0},
+    "presupuesto": {"min": 140000, "max": 160000, "tipo": "compra"},
+    "necesidades": ["escuela_primaria"],
+    "preferencias": {"ubicacion": "Equipetrol", "seguridad": "alta",
+                     "estilo_propiedad": None, "caracteristicas_deseadas": []}
+}
+
+
+class _ManejadorLLM(BaseHTTPRequestHandler):
+    """Responde como /chat/completions con un perfil fijo y cuenta las llamadas."""
+
+    def do_POST(self):
+        cuerpo = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with self.server.lock:
+            self.server.llamadas.append((self.path, cuerpo))
+            self.server.en_curso += 1
+            self.server.max_en_curso = max(self.server.max_en_curso, self.server.en_curso)
+            codigo = self.server.codigos.pop(0) if self.server.codigos else None
+        try:
+            self._responder(codigo)
+        finally:
+            with self.server.lock:
+                self.server.en_curso -= 1
+
+    def _responder(self, codigo):
+        if self.server.demora:
+            time.sleep(self.server.demora)
+        if self.server.fallar or codigo:
+            self.send_response(codigo or 500)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        respuesta = json.dumps({
+            "choices": [{"message": {"content": json.dumps(self.server.perfil)}}]
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(respuesta)))
+        self.end_headers()
+        goteo = self.server.goteo
+        if not goteo:
+            self.wfile.write(respuesta)
+            return
+        # Cuerpo de a un byte: cada lectura llega dentro del timeout de requests
+        try:
+            for i in range(len(respuesta)):
+                self.wfile.write(respuesta[i:i + 1])
+                self.wfile.flush()
+                time.sleep(goteo)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def servidor_llm():
+    """
+    Servidor local en un puerto libre; expone `llamadas`, `fallar`, `demora`,
+    `goteo` (pausa entre bytes del cuerpo), `perfil`, `codigos` (errores a
+    responder antes de los éxitos) y `max_en_curso`.
+    """
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), _ManejadorLLM)
+    servidor.lock = threading.Lock()
+    servidor.llamadas = []
+    servidor.codigos = []
+    servidor.en_curso = 0
+    servidor.max_en_curso = 0
+    servidor.fallar = False
+    servidor.demora = 0
+    servidor.goteo = 0
+    servidor.perfil = PERFIL_LLM
+    servidor.url = f"http://127.0.0.1:{servidor.server_address[1]}/v1"
+    hilo = threading.Thread(target=servidor.serve_forever, args=(0.05,), daemon=True)
+    hilo.start()
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+
+
+@pytest.fixture
+def ruta_cache(tmp_path):
+    return str(tmp_path / 'cache' / 'llm.sqlite')
+
+
+def crear_llm(servidor, ruta_cache=None, **extra):
+    config = LLMConfig(provider="openai", api_key="clave-prueba", model="modelo-prueba",
+                       base_url=servidor.url, cache_path=ruta_cache, **extra)
+    return LLMIntegration(config)
+
+
+class TestLLMIntegration:
+    """Llamadas al LLM a través de base_url."""
+
+    def test_usa_base_url_configurada(self, servidor_llm):
+        llm = crear_llm(servidor_llm)
+        perfil = llm.parsear_perfil_desde_texto("familia con un niño, 150 mil, Equipetrol")
+
+        assert perfil == PERFIL_LLM
+        assert len(servidor_llm.llamadas) == 1
+        ruta, cuerpo = servidor_llm.llamadas[0]
+        assert ruta == '/v1/chat/completions'
+        assert cuerpo['model'] == 'modelo-prueba'
+
+    def test_error_del_llm_usa_perfil_basico(self, servidor_llm):
+        servidor_llm.fallar = True
+        llm = crear_llm(servidor_llm)
+        perfil = llm.parsear_perfil_desde_texto("pareja en zona norte")
+
+        assert perfil['preferencias']['ubicacion'] == 'norte'
+
+    def test_sin_cache_siempre_llama(self, servidor_llm):
+        llm = crear_llm(servidor_llm)
+        for _ in range(3):
+            llm.parsear_perfil_desde_texto("pareja joven")
+        assert len(servidor_llm.llamadas) == 3
+        assert llm.obtener_info_configuracion()['cache'] is None
+
+
+class TestCacheLLM:
+    """Cache SQLite de perfiles: aciertos, normalización, TTL y límite."""
+
+    def test_texto_repetido_no_llama_al_llm(self, servidor_llm, ruta_cache):
+        llm = crear_llm(servidor_llm, ruta_cache)
+        primero = llm.parsear_perfil_desde_texto("Familia con un niño, 150 mil")
+        segundo = llm.parsear_perfil_desde_texto("  familia   con un niño,\n150 MIL ")
+
+        assert primero == segundo == PERFIL_LLM
+        assert len(servidor_llm.llamadas) == 1
+        stats = llm.cache.estadisticas()
+        assert stats['aciertos'] == 1
+        assert stats['fallos'] == 1
+        assert stats['entradas'] == 1
+
+    def test_persiste_entre_instancias(self, servidor_llm, ruta_cache):
+        crear_llm(servidor_llm, ruta_cache).parsear_perfil_desde_texto("pareja jubilada")
+        # Otra invocación (p. ej. otra ejecución de la CLI) sobre el mismo archivo
+        otra = crear_llm(servidor_llm, ruta_cache)
+        assert otra.parsear_perfil_desde_texto("pareja jubilada") == PERFIL_LLM
+        assert len(servidor_llm.llamadas) == 1
+
+    def test_modelo_y_version_separan_entradas(self, ruta_cache):
+        cache = CacheLLM(ruta_cache)
+        cache.guardar("texto", "modelo-a", "v1", {"valor": 1})
+
+        assert cache.obtener("texto", "modelo-b", "v1") is None
+        assert cache.obtener("texto", "modelo-a", "v2") is None
+        assert cache.obtener("TEXTO", "modelo-a", "v1") == {"valor": 1}
+        assert clave_cache("a  b", "m", PROMPT_VERSION) == clave_cache("A b", "m", PROMPT_VERSION)
+        assert clave_cache("a", "m", PROMPT_VERSION, "openai") != clave_cache("a", "m", PROMPT_VERSION, "openrouter")
+        assert normalizar_texto(" Casa\tEN  Equipetrol ") == "casa en equipetrol"
+
+    def test_proveedor_y_endpoint_separan_entradas(self, servidor_llm, ruta_cache):
+        """El mismo modelo detrás de otro endpoint no reutiliza las respuestas guardadas."""
+        crear_llm(servidor_llm, ruta_cache).parsear_perfil_desde_texto("pareja jubilada")
+
+        otro_endpoint = crear_llm(servidor_llm, ruta_cache)
+        otro_endpoint.config.base_url = servidor_llm.url + "/"
+        assert otro_endpoint.parsear_perfil_desde_texto("pareja jubilada") == PERFIL_LLM
+        # La barra final no cambia el endpoint
+        assert len(servidor_llm.llamadas) == 1
+
+        otro_endpoint.config.base_url = servidor_llm.url.replace("127.0.0.1", "localhost")
+        otro_endpoint.parsear_perfil_desde_texto("pareja jubilada")
+        assert len(servidor_llm.llamadas) == 2
+
+        otro_proveedor = LLMIntegration(LLMConfig(provider="openrouter", api_key="clave-prueba",
+                                                  model="modelo-prueba", base_url=servidor_llm.url,
+                                                  cache_path=ruta_cache))
+        otro_proveedor.parsear_perfil_desde_texto("pareja jubilada")
+        assert len(servidor_llm.llamadas) == 3
+        assert len(otro_proveedor.cache) == 3
+
+    def test_perfil_basico_no_se_guarda(self, servidor_llm, ruta_cache):
+        servidor_llm.fallar = True
+        llm = crear_llm(servidor_llm, ruta_cache)
+        llm.parsear_perfil_desde_texto("pareja en zona sur")
+        servidor_llm.fallar = False
+        assert llm.parsear_perfil_desde_texto("pareja en zona sur") == PERFIL_LLM
+        assert len(servidor_llm.llamadas) == 2
+
+    def test_entradas_vencidas(self, servidor_llm, ruta_cache):
+        llm = crear_llm(servidor_llm, ruta_cache, cache_ttl_segundos=0.05)
+        llm.parsear_perfil_desde_texto("inversionista")
+        time.sleep(0.1)
+        llm.parsear_perfil_desde_texto("inversionista")
+
+        assert len(servidor_llm.llamadas) == 2
+        assert llm.cache.stats['vencidas'] == 1
+
+    def test_descarta_las_usadas_hace_mas_tiempo(self, ruta_cache):
+        cache = CacheLLM(ruta_cache, max_entradas=2)
+        cache.guardar("uno", "m", "v", 1)
+        cache.guardar("dos", "m", "v", 2)
+        time.sleep(0.01)
+        assert cache.obtener("uno", "m", "v") == 1
+        cache.guardar("tres", "m", "v", 3)
+
+        assert len(cache) == 2
+        assert cache.obtener("dos", "m", "v") is None
+        assert cache.obtener("uno", "m", "v") == 1
+        assert cache.stats['descartadas'] == 1
+
+    def test_limpiar(self, ruta_cache):
+        cache = CacheLLM(ruta_cache)
+        cache.guardar("uno", "m", "v", 1)
+        assert cache.limpiar() == 1
+        assert len(cache) == 0
+
+    def test_configuracion_desde_entorno(self, monkeypatch, ruta_cache):
+        monkeypatch.setenv("LLM_CACHE_PATH", ruta_cache)
+        monkeypatch.setenv("LLM_CACHE_MAX_ENTRADAS", "7")
+        monkeypatch.setenv("LLM_BASE_URL", "http://127.0.0.1:1/v1")
+        llm = LLMIntegration()
+        assert llm.cache.ruta == ruta_cache
+        assert llm.cache.max_entradas == 7
+        assert llm._url_chat() == "http://127.0.0.1:1/v1/chat/completions"
+
+        monkeypatch.setenv("LLM_CACHE_PATH", "")
+        assert LLMIntegration().cache is None
+
+    def test_cache_desactivado_por_defecto(self, monkeypatch, tmp_path):
+        """Sin LLM_CACHE_PATH no se escribe en el directorio del usuario."""
+        monkeypatch.setenv("HOME", str(tmp_path))
+        monkeypatch.delenv("LLM_CACHE_PATH", raising=False)
+        assert LLMIntegration().cache is None
+
+        monkeypatch.setenv("LLM_CACHE_PATH", "~/citrino/perfiles.sqlite")
+        assert LLMIntegration().cache.ruta == str(tmp_path / "citrino" / "perfiles.sqlite")
+
+
+class TestClienteLLMAsync:
+    """Llamadas concurrentes acotadas, reintentos y timeouts."""
+
+    def test_lote_en_paralelo_acotado(self, servidor_llm):
+        servidor_llm.demora = 0.2
+        llm = crear_llm(servidor_llm)
+        textos = [f"familia número {i}" for i in range(8)]
+
+        inicio = time.perf_counter()
+        perfiles = llm.parsear_perfiles_lote(textos, max_concurrentes=4)
+        duracion = time.perf_counter() - inicio
+
+        assert perfiles == [PERFIL_LLM] * 8
+        assert len(servidor_llm.llamadas) == 8
+        assert servidor_llm.max_en_curso <= 4
+        # Dos tandas de 0.2 s en lugar de ocho
+        assert duracion < 0.2 * 8 / 2
+
+    def test_respeta_el_orden_y_agrupa_repetidos(self, servidor_llm):
+        llm = crear_llm(servidor_llm)
+        perfiles = llm.parsear_perfiles_lote(["Pareja joven", "soltero", "pareja  JOVEN"])
+
+        assert len(servidor_llm.llamadas) == 2
+        prompts = [cuerpo['messages'][0]['content'] for _, cuerpo in servidor_llm.llamadas]
+        assert sum('"Pareja joven"' in p for p in prompts) == 1
+        assert perfiles[0] == perfiles[2] and perfiles[0] is not perfiles[2]
+
+    def test_reintenta_errores_transitorios(self, servidor_llm):
+        servidor_llm.codigos = [503, 429]
+        llm = crear_llm(servidor_llm)
+
+        async def procesar():
+            async with ClienteLLMAsync(llm, espera_base=0.01) as cliente:
+                return await cliente.parsear_perfil("pareja joven"), cliente.stats
+
+        perfil, stats = asyncio.run(procesar())
+        assert perfil == PERFIL_LLM
+        assert stats['reintentos'] == 2
+        assert len(servidor_llm.llamadas) == 3
+
+    def test_error_no_transitorio_no_se_reintenta(self, servidor_llm):
+        servidor_llm.codigos = [401]
+        llm = crear_llm(servidor_llm)
+
+        async def procesar():
+            async with ClienteLLMAsync(llm, espera_base=0.01) as cliente:
+                return await cliente.parsear_perfil("pareja en zona norte"), cliente.stats
+
+        perfil, stats = asyncio.run(procesar())
+        # Perfil básico de respaldo
+        assert perfil['preferencias']['ubicacion'] == 'norte'
+        assert stats['reintentos'] == 0
+        assert len(servidor_llm.llamadas) == 1
+
+    def test_timeout_por_llamada(self, servidor_llm):
+        servidor_llm.demora = 0.5
+        llm = crear_llm(servidor_llm)
+
+        async def procesar():
+            async with ClienteLLMAsync(llm, reintentos=0, timeout_segundos=0.1) as cliente:
+                inicio = time.perf_counter()
+                perfil = await cliente.parsear_perfil("pareja en zona sur")
+                return perfil, time.perf_counter() - inicio, cliente.stats
+
+        perfil, duracion, stats = asyncio.run(procesar())
+        assert perfil['preferencias']['ubicacion'] == 'sur'
+        assert stats['timeouts'] == 1
+        assert duracion < 0.4
+
+    def test_timeout_libera_el_hilo(self, servidor_llm):
+        """Una respuesta que llega de a poco se abandona en el hilo y no retiene el pool."""
+        servidor_llm.goteo = 0.02
+        llm = crear_llm(servidor_llm)
+
+        async def procesar():
+            async with ClienteLLMAsync(llm, max_concurrentes=1, reintentos=0, timeout_segundos=0.2) as cliente:
+                inicio = time.perf_counter()
+                await cliente.parsear_perfil("pareja en zona sur")
+                primera = time.perf_counter() - inicio
+
+                servidor_llm.goteo = 0
+                inicio = time.perf_counter()
+                perfil = await cliente.parsear_perfil("familia en equipetrol")
+                return primera, time.perf_counter() - inicio, perfil, cliente.stats
+
+        primera, segunda, perfil, stats = asyncio.run(procesar())
+        assert stats['timeouts'] == 1
+        assert primera < 0.6
+        # El único hilo del pool quedó libre para la llamada siguiente
+        assert perfil == PERFIL_LLM
+        assert segunda < 0.5
+
+    def test_comparte_el_cache(self, servidor_llm, ruta_cache):
+        llm = crear_llm(servidor_llm, ruta_cache)
+        llm.parsear_perfiles_lote(["pareja joven", "soltero"])
+        assert llm.parsear_perfil_desde_texto("Pareja joven") == PERFIL_LLM
+        llm.parsear_perfiles_lote(["soltero"])
+        assert len(servidor_llm.llamadas) == 2
+
+    def test_lote_con_texto_vacio(self, servidor_llm):
+        with pytest.raises(ValueError):
+            crear_llm(servidor_llm).parsear_perfiles_lote(["pareja", "  "])
+        assert servidor_llm.llamadas == []
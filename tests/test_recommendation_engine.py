@@ -390,4 +390,28 @@ class TestRecommendationEngine:
         propiedad_sin_habitaciones = {"caracteristicas": {}}
 
         score = engine._evaluar_composicion_familiar(perfil_incompleto, propiedad_sin_habitaciones)
-        assert score == 0.0
\ No newline at end of file
+        assert score == 0.0
+    def test_cache_key_usa_id_sin_recorrer_propiedad(self, engine, perfil_familia):
+        """Con id no se leen los valores: en registros compactos eso carga textos diferidos."""
+        from collections.abc import Mapping
+
+        class RegistroSinItems(Mapping):
+            def __init__(self, datos):
+                self._datos = datos
+
+            def __getitem__(self, clave):
+                return self._datos[clave]
+
+            def __iter__(self):
+                return iter(self._datos)
+
+            def __len__(self):
+                return len(self._datos)
+
+            def items(self):
+                raise AssertionError("items() no debe llamarse si hay id")
+
+        clave = engine._generar_cache_key(perfil_familia, RegistroSinItems({'id': 'prop_001'}), 'compatibilidad')
+        assert clave.endswith(':prop_001')
+        sin_id = engine._generar_cache_key(perfil_familia, {'precio': 1}, 'compatibilidad')
+        assert sin_id == engine._generar_cache_key(perfil_familia, {'precio': 1}, 'compatibilidad')
@@ -0,0 +1,435 @@
+"""
+Pruebas para el sistema de consulta de la base de datos integrada.
+"""
+
+import json
+import pickle
+import pytest
+import sys
+import os
+
+# Agregar el directorio scripts al path para importar los módulos
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from sistema_consulta import SistemaConsultaCitrino
+from registro_compacto import RegistroCompacto, a_json, extracto_texto
+
+
+RUTA_PROPIEDADES = os.path.join(os.path.dirname(__file__), '..', 'data', 'propiedades_ampliado.json')
+
+
+def crear_propiedad(id_prop, precio, superficie, zona, habitaciones=2, banos=1,
+                    garaje=False, fecha='2025-09-01 10:00:00', descripcion=''):
+    """Crea una propiedad con la estructura de la base de datos integrada."""
+    return {
+        'id': id_prop,
+        'nombre': f'Departamento en {zona}',
+        'fuente': 'scraping_C21',
+        'descripcion': descripcion,
+        'caracteristicas_principales': {
+            'precio': precio,
+            'superficie_m2': superficie,
+            'habitaciones': habitaciones,
+            'banos_completos': banos,
+            'cochera_garaje': garaje
+        },
+        'ubicacion': {'zona': zona},
+        'fecha_registro': fecha
+    }
+
+
+@pytest.fixture
+def propiedades_ejemplo():
+    """Fixture con propiedades de ejemplo para las pruebas."""
+    return [
+        crear_propiedad('p1', 180000, 120, 'Equipetrol', 3, 2, True, '2025-09-03 10:00:00'),
+        crear_propiedad('p2', 95000, 70, 'Zona Norte', 2, 1, False, '2025-09-01 10:00:00'),
+        crear_propiedad('p3', 250000, 200, 'Equipetrol', 4, 3, True, '2025-09-05 10:00:00'),
+        crear_propiedad('p4', 95000, 50, 'Las Palmas', 1, 1, False, '2025-09-02 10:00:00'),
+        crear_propiedad('p5', 140000, 100, 'Urubó', 3, 2, True, '2025-09-04 10:00:00'),
+    ]
+
+
+@pytest.fixture
+def sistema(propiedades_ejemplo):
+    """Fixture con un sistema de consulta cargado con propiedades de ejemplo."""
+    sistema = SistemaConsultaCitrino()
+    sistema.cargar_propiedades(propiedades_ejemplo)
+    return sistema
+
+
+@pytest.fixture
+def sistema_ampliado():
+    """Fixture con el sistema cargado desde el dataset ampliado del repositorio."""
+    sistema = SistemaConsultaCitrino()
+    sistema.cargar_base_datos(RUTA_PROPIEDADES)
+    return sistema
+
+
+class TestBusquedaPorFiltros:
+    """Pruebas del filtrado vectorizado."""
+
+    @pytest.mark.parametrize('filtros', [
+        {},
+        {'zona': 'equipetrol'},
+        {'zona': ['Norte', 'Urubó']},
+        {'zona': ['Equipetrol', 5]},
+        {'zona': [5]},
+        {'precio_min': 100000, 'precio_max': 200000},
+        {'superficie_min': 80, 'habitaciones_min': 3},
+        {'banos_min': 2, 'tiene_garaje': True},
+        {'tiene_garaje': False, 'zona': 'Equipetrol', 'precio_max': 150000},
+    ])
+    def test_equivale_a_cumple_filtros(self, sistema_ampliado, filtros):
+        """El filtrado por columnas debe coincidir con la evaluación por propiedad."""
+        esperado = [p['id'] for p in sistema_ampliado.propiedades
+                    if sistema_ampliado.cumple_filtros(p, filtros)]
+        obtenido = [p['id'] for p in sistema_ampliado.buscar_por_filtros(filtros)]
+        assert obtenido == esperado
+
+    def test_ordenar_resultados_filtrados(self, sistema):
+        """Los resultados filtrados respetan el criterio de ordenamiento."""
+        resultados = sistema.buscar_por_filtros({'precio_max': 200000}, ordenar_por='superficie')
+        assert [p['id'] for p in resultados] == ['p4', 'p2', 'p5', 'p1']
+
+        resultados = sistema.buscar_por_filtros({'precio_max': 200000}, ordenar_por='fecha',
+                                                descendente=True)
+        assert [p['id'] for p in resultados] == ['p5', 'p1', 'p4', 'p2']
+
+    def test_criterio_no_soportado(self, sistema):
+        """Un criterio de ordenamiento desconocido genera error."""
+        with pytest.raises(ValueError):
+            sistema.buscar_por_filtros({}, ordenar_por='color')
+
+
+class TestTopPropiedades:
+    """Pruebas de obtener_top_propiedades."""
+
+    def test_top_precio(self, sistema):
+        """Las más caras primero; empates en orden estable."""
+        top = sistema.obtener_top_propiedades(3, 'precio')
+        assert [p['id'] for p in top] == ['p3', 'p1', 'p5']
+
+    def test_top_precio_m2_ascendente(self, sistema):
+        """El precio por m² más bajo primero cuando no es descendente."""
+        top = sistema.obtener_top_propiedades(2, 'precio_m2', descendente=False)
+        assert [p['id'] for p in top] == ['p3', 'p2']
+
+    def test_top_columna_no_precalculada(self, sistema):
+        """Las columnas numéricas sin permutación usan selección parcial."""
+        top = sistema.obtener_top_propiedades(2, 'habitaciones')
+        assert [p['id'] for p in top] == ['p3', 'p1']
+
+    def test_top_criterio_funcion(self, sistema):
+        """Un criterio arbitrario se resuelve con heapq."""
+        top = sistema.obtener_top_propiedades(1, lambda p: -p['caracteristicas_principales']['superficie_m2'])
+        assert top[0]['id'] == 'p4'
+
+    def test_criterio_desconocido(self, sistema):
+        """Un criterio desconocido retorna lista vacía."""
+        assert sistema.obtener_top_propiedades(3, 'color') == []
+
+    def test_coincide_con_ordenamiento_completo(self, sistema_ampliado):
+        """El resultado coincide con ordenar el catálogo completo."""
+        esperado = sorted(sistema_ampliado.propiedades,
+                          key=lambda x: x['caracteristicas_principales']['superficie_m2'],
+                          reverse=True)[:10]
+        top = sistema_ampliado.obtener_top_propiedades(10, 'superficie')
+        assert [p['caracteristicas_principales']['superficie_m2'] for p in top] == \
+            [p['caracteristicas_principales']['superficie_m2'] for p in esperado]
+
+
+class TestActualizacionCatalogo:
+    """Pruebas de sincronización de índices con actualizaciones del catálogo."""
+
+    def test_agregar_mantiene_ordenamientos(self, sistema, propiedades_ejemplo):
+        """Agregar propiedades produce las mismas permutaciones que reconstruir."""
+        version = sistema.version_catalogo
+        nuevas = [
+            crear_propiedad('p6', 95000, 60, 'Equipetrol', fecha='2025-09-06 10:00:00'),
+            crear_propiedad('p7', 300000, 90, 'Zona Norte', fecha=''),
+        ]
+        sistema.agregar_propiedades(nuevas)
+        assert sistema.version_catalogo == version + 1
+
+        reconstruido = SistemaConsultaCitrino()
+        reconstruido.cargar_propiedades(propiedades_ejemplo + nuevas)
+        for criterio, permutacion in reconstruido.ordenamientos.items():
+            assert sistema.ordenamientos[criterio].tolist() == permutacion.tolist()
+
+        resultados = sistema.buscar_por_filtros({'zona': 'Equipetrol'}, ordenar_por='precio')
+        assert [p['id'] for p in resultados] == ['p6', 'p1', 'p3']
+
+
+class TestPaginacion:
+    """Pruebas de paginación por cursor."""
+
+    @pytest.mark.parametrize('ordenar_por,descendente', [
+        (None, False), (None, True), ('precio', False), ('precio', True), ('fecha', True),
+    ])
+    def test_recorrer_todas_las_paginas(self, sistema_ampliado, ordenar_por, descendente):
+        """Recorrer las páginas entrega cada resultado una vez y en orden."""
+        filtros = {'precio_max': 250000}
+        esperado = [p['id'] for p in sistema_ampliado.buscar_por_filtros(filtros, ordenar_por, descendente)]
+
+        obtenido, cursor = [], None
+        while True:
+            pagina = sistema_ampliado.buscar_pagina(filtros, ordenar_por, descendente, limite=7, cursor=cursor)
+            assert pagina['total'] == len(esperado)
+            obtenido.extend(p['id'] for p in pagina['propiedades'])
+            cursor = pagina['siguiente_cursor']
+            if not cursor:
+                break
+
+        assert obtenido == esperado
+
+    def test_paginas_siguientes_sin_recorrer_el_catalogo(self, monkeypatch):
+        """Aunque el cache no admita el resultado, las páginas siguientes reutilizan los ids."""
+        sistema = SistemaConsultaCitrino(max_bytes_cache=1)
+        sistema.cargar_base_datos(RUTA_PROPIEDADES)
+        recorridos = []
+        mascara_filtros = sistema._mascara_filtros
+        monkeypatch.setattr(sistema, '_mascara_filtros',
+                            lambda filtros: recorridos.append(filtros) or mascara_filtros(filtros))
+
+        primera = pagina = sistema.buscar_pagina({'precio_max': 250000}, 'precio', limite=5)
+        while pagina['siguiente_cursor']:
+            pagina = sistema.buscar_pagina({'precio_max': 250000}, 'precio', limite=5,
+                                           cursor=pagina['siguiente_cursor'])
+        assert len(recorridos) == 1
+        assert sistema.estadisticas_cache()['entradas'] == 0
+
+        # Un cursor inválido se rechaza sin recorrer el catálogo
+        with pytest.raises(ValueError):
+            sistema.buscar_pagina({'precio_max': 1}, 'precio', limite=5, cursor=primera['siguiente_cursor'])
+        assert len(recorridos) == 1
+
+    def test_cursor_de_otra_busqueda(self, sistema):
+        """Un cursor no puede reutilizarse con otros filtros u orden."""
+        pagina = sistema.buscar_pagina({}, 'precio', limite=2)
+        with pytest.raises(ValueError):
+            sistema.buscar_pagina({'zona': 'Equipetrol'}, 'precio', limite=2, cursor=pagina['siguiente_cursor'])
+        with pytest.raises(ValueError):
+            sistema.buscar_pagina({}, 'superficie', limite=2, cursor=pagina['siguiente_cursor'])
+
+    def test_cursor_invalido_tras_actualizar_catalogo(self, sistema):
+        """Los cursores de una versión anterior del catálogo se rechazan."""
+        pagina = sistema.buscar_pagina({}, 'precio', limite=2)
+        sistema.agregar_propiedades([crear_propiedad('p6', 100000, 80, 'Equipetrol')])
+        with pytest.raises(ValueError):
+            sistema.buscar_pagina({}, 'precio', limite=2, cursor=pagina['siguiente_cursor'])
+
+    def test_cursor_malformado(self, sistema):
+        """Un cursor que no fue generado por el sistema se rechaza."""
+        with pytest.raises(ValueError):
+            sistema.buscar_pagina({}, limite=2, cursor='no-es-un-cursor')
+
+
+class TestCacheResultados:
+    """Pruebas del cache de resultados por filtros normalizados."""
+
+    def test_filtros_equivalentes_comparten_entrada(self, sistema):
+        """Filtros equivalentes producen un acierto en el cache."""
+        primero = sistema.buscar_ids_por_filtros({'zona': ['Urubó', 'equipetrol'], 'precio_max': 200000})
+        segundo = sistema.buscar_ids_por_filtros({'precio_max': 200000.0, 'zona': ['EQUIPETROL', 'urubó'],
+                                                  'desconocido': 1})
+        assert segundo is primero
+
+        stats = sistema.estadisticas_cache()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+        assert stats['entradas'] == 1
+        assert stats['bytes'] > 0
+
+    @pytest.mark.parametrize('valor', ['abc', [], {'a': 1}, None, float('nan')])
+    def test_limites_que_no_son_numeros(self, sistema, valor):
+        """Un límite numérico inválido se descarta en vez de lanzar una excepción."""
+        assert sistema.normalizar_filtros({'precio_max': valor, 'zona': 'Equipetrol'}) == {'zona': 'equipetrol'}
+        assert len(sistema.buscar_por_filtros({'precio_max': valor, 'zona': 'Equipetrol'})) == 2
+
+    def test_resultados_de_solo_lectura(self, sistema):
+        """Los ids guardados en cache no pueden modificarse."""
+        ids = sistema.buscar_ids_por_filtros({'zona': 'Equipetrol'})
+        with pytest.raises(ValueError):
+            ids[0] = 99
+
+    def test_invalidacion_por_version(self, sistema):
+        """Actualizar el catálogo invalida los resultados en cache."""
+        assert len(sistema.buscar_por_zona('Equipetrol')) == 2
+        sistema.agregar_propiedades([crear_propiedad('p6', 100000, 80, 'Equipetrol')])
+        assert len(sistema.buscar_por_zona('Equipetrol')) == 3
+        assert sistema.estadisticas_cache()['hits'] == 0
+
+    def test_limite_de_memoria(self, propiedades_ejemplo):
+        """El cache desaloja las entradas menos usadas al superar su límite."""
+        sistema = SistemaConsultaCitrino(max_bytes_cache=300)
+        sistema.cargar_propiedades(propiedades_ejemplo)
+        for precio in range(100000, 200000, 10000):
+            sistema.buscar_ids_por_filtros({'precio_max': precio})
+
+        stats = sistema.estadisticas_cache()
+        assert stats['bytes'] <= 300
+        assert stats['evicciones'] > 0
+
+    def test_estadisticas_por_zona(self, sistema):
+        """Las estadísticas por zona se calculan desde los ids de la búsqueda."""
+        stats = sistema.obtener_estadisticas_por_zona('equipetrol')
+        assert stats['total_propiedades'] == 2
+        assert stats['precio_promedio'] == 215000
+        assert stats['precio_m2_promedio'] == pytest.approx(430000 / 320)
+        assert sistema.obtener_estadisticas_por_zona('Inexistente') == {}
+
+
+class TestBusquedaTexto:
+    """Pruebas del índice invertido sobre nombre y descripción."""
+
+    @pytest.fixture
+    def sistema_texto(self):
+        """Sistema con descripciones para búsqueda de texto."""
+        sistema = SistemaConsultaCitrino()
+        sistema.cargar_propiedades([
+            crear_propiedad('t1', 150000, 100, 'Equipetrol', descripcion='Departamento amoblado con piscina y vista'),
+            crear_propiedad('t2', 250000, 180, 'Urubó', descripcion='Casa con PISCÍNA privada, piscina para niños'),
+            crear_propiedad('t3', 90000, 60, 'Zona Norte', descripcion='Monoambiente sin amoblar'),
+            crear_propiedad('t4', 120000, 90, 'Equipetrol', descripcion='Amoblado, cerca del parque'),
+        ])
+        return sistema
+
+    def test_busqueda_sin_acentos_y_ranking(self, sistema_texto):
+        """La búsqueda ignora acentos y mayúsculas y ordena por relevancia."""
+        resultados = sistema_texto.buscar_texto('piscina')
+        assert [r['propiedad']['id'] for r in resultados] == ['t2', 't1']
+        assert resultados[0]['relevancia'] > resultados[1]['relevancia']
+
+    def test_combinar_con_filtros(self, sistema_texto):
+        """El texto se combina con los filtros estructurados."""
+        resultados = sistema_texto.buscar_texto('amoblado', filtros={'zona': 'Equipetrol', 'precio_max': 130000})
+        assert [r['propiedad']['id'] for r in resultados] == ['t4']
+
+        ids = sistema_texto.buscar_ids_por_filtros({'zona': 'Equipetrol'}, ordenar_por='precio', texto='amoblado')
+        assert [sistema_texto.propiedades[i]['id'] for i in ids] == ['t4', 't1']
+
+    def test_actualizacion_incremental(self, sistema_texto):
+        """Las propiedades agregadas quedan indexadas sin reconstruir el índice."""
+        sistema_texto.agregar_propiedades([
+            crear_propiedad('t5', 300000, 200, 'Las Palmas', descripcion='Vista panorámica y piscina')
+        ])
+        ids = [r['propiedad']['id'] for r in sistema_texto.buscar_texto('vista')]
+        assert sorted(ids) == ['t1', 't5']
+
+    def test_paginar_por_relevancia(self, sistema_texto):
+        """La paginación por cursor funciona con el orden por relevancia."""
+        primera = sistema_texto.buscar_pagina({}, limite=1, texto='piscina amoblado')
+        assert primera['total'] == 3
+        segunda = sistema_texto.buscar_pagina({}, limite=5, texto='piscina amoblado',
+                                              cursor=primera['siguiente_cursor'])
+        ids = [p['id'] for p in primera['propiedades'] + segunda['propiedades']]
+        assert sorted(ids) == ['t1', 't2', 't4']
+        assert segunda['siguiente_cursor'] is None
+
+
+class TestRegistrosCompactos:
+    """Pruebas de los registros compactos producidos por cargar_base_datos."""
+
+    def test_vista_equivalente_al_json(self, sistema_ampliado):
+        """Cada registro compacto debe leerse igual que el diccionario original."""
+        with open(RUTA_PROPIEDADES, 'r', encoding='utf-8') as f:
+            originales = json.load(f)
+
+        for compacto, original in zip(sistema_ampliado.propiedades, originales):
+            assert isinstance(compacto, RegistroCompacto)
+            assert compacto.a_dict() == original
+            assert compacto['id'] == original['id']
+            assert compacto.get('ubicacion', {}).get('zona') == original['ubicacion']['zona']
+            assert compacto.get('inexistente', 'x') == 'x'
+            assert set(compacto.keys()) == set(original.keys())
+
+    def test_cadenas_y_formas_compartidas(self, sistema_ampliado):
+        """Las cadenas repetidas y las claves se comparten entre registros."""
+        p1, p2 = sistema_ampliado.propiedades[:2]
+        assert p1['ubicacion'].get('coordenadas')._forma is p2['ubicacion'].get('coordenadas')._forma
+        zonas = {}
+        for prop in sistema_ampliado.propiedades:
+            zona = prop['ubicacion']['zona']
+            assert zonas.setdefault(zona, zona) is zona
+
+    def test_resultados_iguales_en_ambos_modos(self, sistema_ampliado):
+        """Las consultas no cambian al usar registros compactos."""
+        sistema_dict = SistemaConsultaCitrino()
+        sistema_dict.cargar_base_datos(RUTA_PROPIEDADES, compacto=False)
+
+        filtros = {'zona': 'Equipetrol', 'precio_max': 200000}
+        assert ([p['id'] for p in sistema_ampliado.buscar_por_filtros(filtros, ordenar_por='precio')] ==
+                [p['id'] for p in sistema_dict.buscar_por_filtros(filtros, ordenar_por='precio')])
+        assert (sistema_ampliado.obtener_estadisticas_por_zona('Equipetrol') ==
+                sistema_dict.obtener_estadisticas_por_zona('Equipetrol'))
+
+    def test_es_de_solo_lectura_y_serializable(self, sistema_ampliado):
+        """Los registros no admiten asignación y se serializan con a_json."""
+        prop = sistema_ampliado.propiedades[0]
+        with pytest.raises(TypeError):
+            prop['id'] = 'otro'
+        with pytest.raises(AttributeError):
+            prop.extra = 1
+
+        assert json.loads(json.dumps(prop, default=a_json)) == prop.a_dict()
+        assert pickle.loads(pickle.dumps(prop)) == prop
+
+
+class TestTextosDiferidos:
+    """Pruebas del archivo lateral para textos largos."""
+
+    @pytest.fixture
+    def ruta_textos(self, tmp_path):
+        """Dataset con descripciones largas y cortas."""
+        propiedades = [
+            crear_propiedad('d1', 150000, 100, 'Equipetrol', descripcion='Amplio departamento con piscina. ' * 20),
+            crear_propiedad('d2', 95000, 70, 'Zona Norte', descripcion='Monoambiente céntrico'),
+            crear_propiedad('d3', 250000, 200, 'Urubó', descripcion='Casa con jardín y vista al río. ' * 15),
+        ]
+        ruta = tmp_path / 'propiedades.json'
+        ruta.write_text(json.dumps(propiedades, ensure_ascii=False), encoding='utf-8')
+        return str(ruta), propiedades
+
+    def test_textos_largos_van_al_archivo_lateral(self, ruta_textos):
+        """Sólo los textos más largos que el extracto se difieren."""
+        ruta, originales = ruta_textos
+        sistema = SistemaConsultaCitrino()
+        sistema.cargar_base_datos(ruta)
+
+        assert len(sistema.almacen_textos) == 2
+        for prop, original in zip(sistema.propiedades, originales):
+            assert prop['descripcion'] == original['descripcion']
+            assert prop.get('descripcion') == original['descripcion']
+            assert prop.a_dict() == original
+
+    def test_extracto_sin_leer_archivo(self, ruta_textos):
+        """El extracto precalculado coincide con el truncado del API."""
+        ruta, originales = ruta_textos
+        sistema = SistemaConsultaCitrino()
+        sistema.cargar_base_datos(ruta)
+
+        for prop, original in zip(sistema.propiedades, originales):
+            texto = original['descripcion']
+            esperado = texto[:300] + '...' if len(texto) > 300 else texto
+            assert extracto_texto(prop) == esperado
+            assert extracto_texto(original) == esperado
+            assert extracto_texto(prop, 'descripcion', 50) == (texto[:50] + '...' if len(texto) > 50 else texto)
+
+    def test_busqueda_de_texto_con_textos_diferidos(self, ruta_textos):
+        """El índice de texto se construye leyendo el archivo lateral."""
+        ruta, _ = ruta_textos
+        sistema = SistemaConsultaCitrino()
+        sistema.cargar_base_datos(ruta)
+
+        assert [r['propiedad']['id'] for r in sistema.buscar_texto('jardin rio')] == ['d3']
+        assert [r['propiedad']['id'] for r in sistema.buscar_texto('piscina')] == ['d1']
+
+    def test_sin_diferir(self, ruta_textos):
+        """Con diferir_textos_largos=False los textos quedan en memoria."""
+        ruta, originales = ruta_textos
+        sistema = SistemaConsultaCitrino()
+        sistema.cargar_base_datos(ruta, diferir_textos_largos=False)
+
+        assert sistema.almacen_textos is None
+        assert pickle.loads(pickle.dumps(sistema.propiedades[0])) == originales[0]